@@ -0,0 +1,38 @@
+import json
+from collections.abc import Mapping
+
+from werkzeug import Request, Response
+
+from dify_plugin import Endpoint
+
+from tools.utils.notify import SIGNATURE_HEADER, get_completion_registry, verify_signature
+
+
+class TianshuCallbackEndpoint(Endpoint):
+    """
+    Receives task-completion callbacks from the Tianshu server and wakes the
+    tool invocations waiting on that task.
+    """
+
+    def _invoke(self, r: Request, values: Mapping, settings: Mapping) -> Response:
+        body = r.get_data()
+
+        # Reject callbacks that are not signed with the shared secret (when one is set)
+        if not verify_signature(settings.get('callback_secret') or '', body, r.headers.get(SIGNATURE_HEADER)):
+            return self._json_response({'success': False, 'message': 'Invalid signature'}, 401)
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            return self._json_response({'success': False, 'message': 'Invalid JSON body'}, 400)
+
+        task_id = payload.get('task_id') if isinstance(payload, dict) else None
+        if not task_id:
+            return self._json_response({'success': False, 'message': 'task_id is required'}, 400)
+
+        get_completion_registry().notify(str(task_id), payload)
+        return self._json_response({'success': True, 'task_id': task_id}, 200)
+
+    @staticmethod
+    def _json_response(payload: dict, status: int) -> Response:
+        return Response(json.dumps(payload), status=status, content_type='application/json')
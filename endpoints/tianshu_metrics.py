@@ -0,0 +1,16 @@
+from collections.abc import Mapping
+
+from werkzeug import Request, Response
+
+from dify_plugin import Endpoint
+
+from tools.utils.metrics import prometheus_text
+
+
+class TianshuMetricsEndpoint(Endpoint):
+    """
+    Serves the plugin's invocation metrics in the Prometheus text format.
+    """
+
+    def _invoke(self, r: Request, values: Mapping, settings: Mapping) -> Response:
+        return Response(prometheus_text(), status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
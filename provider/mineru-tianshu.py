@@ -8,71 +8,75 @@ class MineruTianshuProvider(ToolProvider):
     
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         try:
-            # Validate API server URL
-            api_server_url = credentials.get('api_server_url', '').rstrip('/')
-            if not api_server_url:
+            from tools.utils.routing import ROUTING_POLICIES, parse_servers
+
+            # Validate API server URL(s): one or more "url" or "url|weight" entries
+            if not (credentials.get('api_server_url') or '').strip():
                 raise ToolProviderCredentialValidationError("API Server URL is required")
+            try:
+                servers = parse_servers(credentials.get('api_server_url'))
+            except ValueError as e:
+                raise ToolProviderCredentialValidationError(str(e))
 
-            # Validate URL format
-            if not (api_server_url.startswith('http://') or api_server_url.startswith('https://')):
-                raise ToolProviderCredentialValidationError("API Server URL must start with http:// or https://")
+            routing_policy = credentials.get('routing_policy') or 'least_queue'
+            if routing_policy not in ROUTING_POLICIES:
+                raise ToolProviderCredentialValidationError(
+                    f"Routing policy must be one of: {', '.join(ROUTING_POLICIES)}"
+                )
 
             # Get optional credentials
             api_key = credentials.get('api_key', '')
             verify_ssl = credentials.get('verify_ssl', True)
 
-            # Prepare headers with optional API key
-            headers = {}
-            if api_key:
-                headers['X-API-Key'] = api_key
-
-            # Test connection with health check endpoint
-            import requests
-            try:
-                response = requests.get(
-                    f"{api_server_url}/api/v1/health",
-                    headers=headers,
-                    timeout=10,
-                    verify=verify_ssl
-                )
-                response.raise_for_status()
-
-                # Optionally verify response structure
-                result = response.json()
-                if not isinstance(result, dict):
-                    raise ToolProviderCredentialValidationError("Invalid API server response format")
-
-            except requests.exceptions.SSLError as e:
-                raise ToolProviderCredentialValidationError(
-                    f"SSL certificate verification failed: {str(e)}. "
-                    "You can disable SSL verification in settings (not recommended for production)."
-                )
-            except requests.exceptions.Timeout:
-                raise ToolProviderCredentialValidationError(
-                    f"Connection timeout. Please check if the API server at {api_server_url} is accessible."
-                )
-            except requests.exceptions.ConnectionError as e:
-                raise ToolProviderCredentialValidationError(
-                    f"Cannot connect to API server at {api_server_url}: {str(e)}"
-                )
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 401 or e.response.status_code == 403:
-                    raise ToolProviderCredentialValidationError(
-                        "Authentication failed. Please check your API key."
-                    )
-                raise ToolProviderCredentialValidationError(
-                    f"HTTP error {e.response.status_code}: {str(e)}"
-                )
-            except ValueError as e:
-                raise ToolProviderCredentialValidationError(
-                    f"Invalid JSON response from API server: {str(e)}"
-                )
+            for api_server_url, _ in servers:
+                self._check_server(api_server_url, verify_ssl, api_key)
 
         except ToolProviderCredentialValidationError:
             raise
         except Exception as e:
             raise ToolProviderCredentialValidationError(f"Unexpected error: {str(e)}")
 
+    @staticmethod
+    def _check_server(api_server_url: str, verify_ssl: bool, api_key: str) -> None:
+        """Test connection and authentication with the server's health check endpoint."""
+        import requests
+        from tools.utils.client import get_client
+        try:
+            client = get_client(api_server_url, verify_ssl, api_key)
+            response = client.get('/api/v1/health', timeout=10)
+            response.raise_for_status()
+
+            # Optionally verify response structure
+            result = response.json()
+            if not isinstance(result, dict):
+                raise ToolProviderCredentialValidationError("Invalid API server response format")
+
+        except requests.exceptions.SSLError as e:
+            raise ToolProviderCredentialValidationError(
+                f"SSL certificate verification failed: {str(e)}. "
+                "You can disable SSL verification in settings (not recommended for production)."
+            )
+        except requests.exceptions.Timeout:
+            raise ToolProviderCredentialValidationError(
+                f"Connection timeout. Please check if the API server at {api_server_url} is accessible."
+            )
+        except requests.exceptions.ConnectionError as e:
+            raise ToolProviderCredentialValidationError(
+                f"Cannot connect to API server at {api_server_url}: {str(e)}"
+            )
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 401 or e.response.status_code == 403:
+                raise ToolProviderCredentialValidationError(
+                    "Authentication failed. Please check your API key."
+                )
+            raise ToolProviderCredentialValidationError(
+                f"HTTP error {e.response.status_code}: {str(e)}"
+            )
+        except ValueError as e:
+            raise ToolProviderCredentialValidationError(
+                f"Invalid JSON response from API server: {str(e)}"
+            )
+
     #########################################################################################
     # If OAuth is supported, uncomment the following functions.
     # Warning: please make sure that the sdk version is 0.4.2 or higher.
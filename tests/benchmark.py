@@ -0,0 +1,272 @@
+"""
+End-to-end benchmark of the plugin tools against the local fake Tianshu server.
+
+Each tool runs in its own subprocess (so peak RSS is per tool) against a
+fresh ``FakeTianshuServer``, with ``--concurrency`` invocations in flight:
+
+- ``parse_document``: one invocation per document, submit and wait
+- ``parse_document_async``: one submission per document
+- ``parse_documents_batch``: batches of ``--batch-size`` documents
+- ``wait_for_results``: groups of ``--batch-size`` already submitted tasks
+- ``get_parse_result_stream``: one split document per invocation
+
+Reported per tool: submit throughput, p50/p99 time-to-result (invocation
+start to its final result), status requests and 304s per document, HTTP
+body bytes in each direction, errors and peak RSS. ``--save`` writes the
+report as JSON and ``--baseline`` compares against a saved report, exiting
+with status 1 when a metric regressed by more than ``--tolerance``.
+
+Usage::
+
+    python -m tests.benchmark --documents 40 --concurrency 8 --delay lognormal:1:0.5
+    python -m tests.benchmark --save baseline.json
+    python -m tests.benchmark --baseline baseline.json --tolerance 0.25
+"""
+# The plugin SDK monkeypatches threading with gevent on import, as in the
+# plugin process; it must happen before any lock or executor is created
+import dify_plugin  # noqa: F401
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any
+
+TOOLS = ('parse_document', 'parse_document_async', 'parse_documents_batch', 'wait_for_results', 'get_parse_result_stream')
+# Metrics where a higher value is a regression; submit_throughput is the reverse
+HIGHER_IS_WORSE = (
+    'time_to_result_p50', 'time_to_result_p99', 'status_requests_per_document',
+    'bytes_in_per_document', 'bytes_out_per_document', 'peak_rss_mb',
+)
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(-(-fraction * len(ordered) // 1)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _document(index: int, config: dict[str, Any]) -> SimpleNamespace:
+    from tests.test_pdf_split import make_pdf
+    return SimpleNamespace(filename=f"bench-{index}.pdf", url=None, blob=make_pdf(config['pages']))
+
+
+def _final_result(messages: list[Any]) -> dict[str, Any] | None:
+    results = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+    return results[-1] if results else None
+
+
+def _invoke(tool: Any, parameters: dict[str, Any]) -> tuple[float, dict[str, Any] | None]:
+    started = time.monotonic()
+    messages = list(tool._invoke(parameters))
+    return time.monotonic() - started, _final_result(messages)
+
+
+def _succeeded(name: str, result: dict[str, Any] | None) -> bool:
+    if result is None:
+        return False
+    if name == 'parse_document_async':
+        return bool(result.get('task_id'))
+    if name == 'parse_documents_batch':
+        return not result.get('failed')
+    if name == 'wait_for_results':
+        return bool(result.get('satisfied', result.get('completed')))
+    return result.get('status') == 'completed'
+
+
+def run_tool(name: str, config: dict[str, Any]) -> dict[str, Any]:
+    """Benchmark one tool in this process and return its report."""
+    from tests.fake_server import FakeTianshuServer
+    from tools.get_parse_result_stream import GetParseResultStreamTool
+    from tools.parse_document import ParseDocumentTool
+    from tools.parse_document_async import ParseDocumentAsyncTool
+    from tools.parse_documents_batch import ParseDocumentsBatchTool
+    from tools.wait_for_results import WaitForResultsTool
+
+    server = FakeTianshuServer(
+        delay=config['delay'], workers=config['workers'],
+        split_threshold=config['split_threshold'], split_size=config['split_size'],
+        markdown_bytes_per_page=config['markdown_bytes_per_page'],
+        submit_failure_rate=config['submit_failure_rate'],
+        status_failure_rate=config['status_failure_rate'],
+        task_failure_rate=config['task_failure_rate'],
+        compress_responses=config['compress_responses'], seed=config['seed'],
+    ).start()
+    runtime = SimpleNamespace(credentials={'api_server_url': server.url, 'api_key': 'bench-key'})
+    session = SimpleNamespace()
+    documents = config['documents']
+    batch_size = config['batch_size']
+    wait = {'max_wait_time': config['max_wait_time'], 'use_cache': False}
+
+    if name == 'parse_document':
+        tool = ParseDocumentTool(runtime=runtime, session=session)
+        calls = [{'file': _document(index, config), **wait} for index in range(documents)]
+    elif name == 'parse_document_async':
+        tool = ParseDocumentAsyncTool(runtime=runtime, session=session)
+        calls = [{'file': _document(index, config), 'use_cache': False} for index in range(documents)]
+    elif name == 'parse_documents_batch':
+        tool = ParseDocumentsBatchTool(runtime=runtime, session=session)
+        calls = [
+            {'files': [_document(index, config) for index in range(start, min(start + batch_size, documents))],
+             'use_cache': False}
+            for start in range(0, documents, batch_size)
+        ]
+    elif name == 'wait_for_results':
+        tool = WaitForResultsTool(runtime=runtime, session=session)
+        task_ids = [server.create_task(f"bench-{index}.pdf", config['pages']).task_id for index in range(documents)]
+        calls = [{'task_ids': ','.join(task_ids[start:start + batch_size]), **wait}
+                 for start in range(0, documents, batch_size)]
+    elif name == 'get_parse_result_stream':
+        tool = GetParseResultStreamTool(runtime=runtime, session=session)
+        calls = [{'task_id': server.create_task(f"bench-{index}.pdf", config['pages']).task_id,
+                  'max_wait_time': config['max_wait_time']}
+                 for index in range(documents)]
+    else:
+        raise ValueError(f"Unknown tool '{name}'; choose from: {', '.join(TOOLS)}")
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=config['concurrency']) as executor:
+            outcomes = list(executor.map(lambda parameters: _invoke(tool, parameters), calls))
+    finally:
+        server.stop()
+    elapsed = time.monotonic() - started
+
+    stats = server.stats()
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        'tool': name,
+        'documents': documents,
+        'invocations': len(calls),
+        'errors': sum(1 for _, result in outcomes if not _succeeded(name, result)),
+        'wall_seconds': round(elapsed, 3),
+        'submit_throughput': stats.get('submit_throughput'),
+        'time_to_result_p50': _round(percentile(latencies, 0.5)),
+        'time_to_result_p99': _round(percentile(latencies, 0.99)),
+        'status_requests_per_document': round(stats['status_requests'] / documents, 2),
+        'not_modified_per_document': round(stats['not_modified'] / documents, 2),
+        'bytes_in_per_document': round(stats['bytes_in'] / documents),
+        'bytes_out_per_document': round(stats['bytes_out'] / documents),
+        'injected_failures': stats['injected_failures'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _round(value: float | None) -> float | None:
+    return round(value, 3) if value is not None else None
+
+
+def run_isolated(name: str, config: dict[str, Any]) -> dict[str, Any]:
+    """Benchmark one tool in a fresh interpreter, so its peak RSS is its own."""
+    completed = subprocess.run(
+        [sys.executable, '-m', 'tests.benchmark', '--run-tool', name, '--config', json.dumps(config)],
+        capture_output=True, text=True,
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Benchmark of {name} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def regressions(report: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float) -> list[str]:
+    """Metrics that got worse than the baseline by more than ``tolerance`` (a fraction)."""
+    previous = {entry['tool']: entry for entry in baseline}
+    found = []
+    for entry in report:
+        old = previous.get(entry['tool'])
+        if old is None:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            new_value, old_value = entry.get(metric), old.get(metric)
+            if new_value is not None and old_value and new_value > old_value * (1 + tolerance):
+                found.append(f"{entry['tool']}: {metric} {old_value} -> {new_value}")
+        new_value, old_value = entry.get('submit_throughput'), old.get('submit_throughput')
+        if new_value is not None and old_value and new_value < old_value * (1 - tolerance):
+            found.append(f"{entry['tool']}: submit_throughput {old_value} -> {new_value}")
+        if entry['errors'] > old.get('errors', 0):
+            found.append(f"{entry['tool']}: errors {old.get('errors', 0)} -> {entry['errors']}")
+    return found
+
+
+def print_table(report: list[dict[str, Any]]) -> None:
+    columns = (
+        ('tool', 'tool'), ('submit/s', 'submit_throughput'), ('p50 s', 'time_to_result_p50'),
+        ('p99 s', 'time_to_result_p99'), ('polls/doc', 'status_requests_per_document'),
+        ('304/doc', 'not_modified_per_document'), ('in B/doc', 'bytes_in_per_document'),
+        ('out B/doc', 'bytes_out_per_document'), ('errors', 'errors'), ('RSS MB', 'peak_rss_mb'),
+    )
+    rows = [[title for title, _ in columns]] + [
+        ['-' if entry.get(key) is None else str(entry[key]) for _, key in columns] for entry in report
+    ]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the plugin tools against a local fake Tianshu server')
+    parser.add_argument('--tools', default=','.join(TOOLS), help='comma-separated tools to benchmark')
+    parser.add_argument('--documents', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8, help='tool invocations in flight')
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=4, help='pages per generated PDF')
+    parser.add_argument('--delay', default='lognormal:1:0.5', help='server processing time distribution')
+    parser.add_argument('--workers', type=int, default=8, help='simulated GPUs (0: unlimited)')
+    parser.add_argument('--split-threshold', type=int, default=0)
+    parser.add_argument('--split-size', type=int, default=2)
+    parser.add_argument('--markdown-bytes-per-page', type=int, default=20000)
+    parser.add_argument('--submit-failure-rate', type=float, default=0.0)
+    parser.add_argument('--status-failure-rate', type=float, default=0.0)
+    parser.add_argument('--task-failure-rate', type=float, default=0.0)
+    parser.add_argument('--compress-responses', action='store_true')
+    parser.add_argument('--max-wait-time', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='compare against a report saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--run-tool', help=argparse.SUPPRESS)
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_tool:
+        print(json.dumps(run_tool(args.run_tool, json.loads(args.config))))
+        return 0
+
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ('tools', 'save', 'baseline', 'tolerance', 'run_tool', 'config')
+    }
+    names = [name.strip() for name in args.tools.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TOOLS]
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(unknown)}")
+
+    report = [run_isolated(name, config) for name in names]
+    print_table(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
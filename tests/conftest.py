@@ -4,6 +4,84 @@ Pytest configuration and shared fixtures for MinerU Tianshu tests
 import pytest
 from unittest.mock import Mock, MagicMock, patch
 
+from tools.utils.admission import reset_admission
+from tools.utils.cache import get_result_cache
+from tools.utils.client import close_all_clients
+from tools.utils.resilience import reset_resilience
+from tools.utils.routing import reset_routing
+from tools.utils.submit import get_submit_flight
+from tools.utils.task_group import get_status_flight, reset_status_validators
+from tools.utils.timeline import get_timeline
+from tools.utils.upload import reset_acquisition
+
+
+@pytest.fixture(autouse=True)
+def reset_result_cache():
+    """Start every test with an empty process-wide result cache"""
+    get_result_cache().clear()
+    yield
+    get_result_cache().clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_single_flight():
+    """Do not let coalesced submissions or shared statuses leak between tests"""
+    get_submit_flight().clear()
+    get_status_flight().clear()
+    reset_status_validators()
+    yield
+    get_submit_flight().clear()
+    get_status_flight().clear()
+    reset_status_validators()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Retry counters and circuit breakers are process-wide, so start each test closed"""
+    reset_resilience()
+    yield
+    reset_resilience()
+
+
+@pytest.fixture(autouse=True)
+def reset_submit_admission():
+    """Rate limits and submission slots are process-wide, so start each test with full buckets"""
+    reset_admission()
+    yield
+    reset_admission()
+
+
+@pytest.fixture(autouse=True)
+def reset_server_pools():
+    """Server pools and task pins are process-wide, so start each test without them"""
+    reset_routing()
+    yield
+    reset_routing()
+
+
+@pytest.fixture(autouse=True)
+def reset_pooled_clients():
+    """Discovered server capabilities live on the pooled clients, so start each test with none"""
+    close_all_clients()
+    yield
+    close_all_clients()
+
+
+@pytest.fixture(autouse=True)
+def reset_task_timeline():
+    """Completion history is process-wide, so start each test without samples"""
+    get_timeline().clear()
+    yield
+    get_timeline().clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_broken_files_urls():
+    """File servers marked as unreachable are process-wide, so start each test trusting them"""
+    reset_acquisition()
+    yield
+    reset_acquisition()
+
 
 @pytest.fixture
 def mock_runtime():
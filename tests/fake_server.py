@@ -0,0 +1,475 @@
+"""
+A local stand-in for the MinerU Tianshu API, for end-to-end tests and benchmarks.
+
+``FakeTianshuServer`` serves the endpoints the plugin uses over real HTTP:
+
+- ``GET /api/v1/health`` and ``GET /api/v1/queue/stats``
+- ``POST /api/v1/tasks/submit`` (multipart, optionally gzip-compressed)
+- ``GET /api/v1/tasks/{task_id}``, with ``ETag`` and ``304 Not Modified``
+
+Tasks are simulated against the wall clock instead of being parsed: each
+submission draws a processing time from a delay distribution and waits for
+one of ``workers`` simulated GPUs (0 means unlimited). PDFs longer than
+``split_threshold`` pages become parent tasks with one subtask per
+``split_size`` pages, like the real server. Failures can be injected per
+submission (503), per status request (500) and per task, and completed
+tasks carry ``markdown_bytes_per_page`` of markdown per page so large
+payloads can be measured.
+
+Run it standalone to point a Dify instance at it::
+
+    python -m tests.fake_server --port 8100 --delay lognormal:5:0.5 --workers 4
+"""
+import argparse
+import email.policy
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+TASK_PATH = re.compile(r'^/api/v1/tasks/([\w.-]+)$')
+FILLER = (
+    'MinerU Tianshu converts documents to markdown. This sentence pads the simulated '
+    'page so payload sizes match real documents. '
+)
+
+
+def parse_delay(spec: str | float) -> Callable[[random.Random], float]:
+    """
+    Parse a processing time distribution in seconds: ``fixed:S``,
+    ``uniform:LOW:HIGH``, ``exponential:MEAN`` or ``lognormal:MEDIAN:SIGMA``.
+    A bare number is a fixed delay.
+
+    Raises ``ValueError`` on an unknown distribution.
+    """
+    name, *args = str(spec).split(':')
+    try:
+        if not args:
+            value = float(name)
+            return lambda rng: value
+        values = [float(arg) for arg in args]
+    except ValueError:
+        raise ValueError(f"Invalid delay distribution '{spec}'")
+    if name == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if name == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == 'exponential' and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if name == 'lognormal' and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    raise ValueError(f"Invalid delay distribution '{spec}'")
+
+
+def _iso(timestamp: float | None) -> str | None:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _page_count(content: bytes, default: int) -> int:
+    if not content.startswith(b'%PDF-'):
+        return default
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(io.BytesIO(content)).pages)
+    except Exception:
+        return default
+
+
+class _FakeTask:
+    """One simulated task; parents only aggregate their subtasks."""
+
+    def __init__(self, task_id: str, file_name: str, backend: str, priority: int, start_page: int, end_page: int):
+        self.task_id = task_id
+        self.file_name = file_name
+        self.backend = backend
+        self.priority = priority
+        self.start_page = start_page
+        self.end_page = end_page
+        self.created_at = time.time()
+        self.started_at = self.created_at
+        self.completed_at = self.created_at
+        self.fails = False
+        self.subtasks: list['_FakeTask'] = []
+        self.markdown: str | None = None
+        # (version, ETag, encoded body) of the last status served
+        self.body: tuple[Any, str, bytes] | None = None
+
+    def status(self, now: float) -> str:
+        if self.subtasks:
+            statuses = [subtask.status(now) for subtask in self.subtasks]
+            if all(status in ('completed', 'failed') for status in statuses):
+                return 'failed' if 'failed' in statuses else 'completed'
+            return 'pending' if all(status == 'pending' for status in statuses) else 'processing'
+        if now < self.started_at:
+            return 'pending'
+        if now < self.completed_at:
+            return 'processing'
+        return 'failed' if self.fails else 'completed'
+
+
+class FakeTianshuServer:
+    """
+    Simulated Tianshu API server on a local port; see the module docstring.
+    """
+
+    def __init__(
+        self,
+        delay: str | float = 'fixed:0',
+        workers: int = 0,
+        split_threshold: int = 0,
+        split_size: int = 10,
+        default_pages: int = 1,
+        markdown_bytes_per_page: int = 2048,
+        submit_failure_rate: float = 0.0,
+        status_failure_rate: float = 0.0,
+        task_failure_rate: float = 0.0,
+        compress_responses: bool = False,
+        seed: int | None = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+    ):
+        self.delay = parse_delay(delay)
+        self.workers = workers
+        self.split_threshold = split_threshold
+        self.split_size = max(split_size, 1)
+        self.default_pages = default_pages
+        self.markdown_bytes_per_page = markdown_bytes_per_page
+        self.submit_failure_rate = submit_failure_rate
+        self.status_failure_rate = status_failure_rate
+        self.task_failure_rate = task_failure_rate
+        self.compress_responses = compress_responses
+        self.random = random.Random(seed)
+        self.tasks: dict[str, _FakeTask] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # Times at which each busy simulated worker becomes free
+        self._worker_free_at: list[float] = []
+        self.counters = {
+            'requests': 0, 'submits': 0, 'status_requests': 0, 'not_modified': 0,
+            'injected_failures': 0, 'bytes_in': 0, 'bytes_out': 0,
+        }
+        self.submit_times: list[float] = []
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeTianshuServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeTianshuServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            submit_times = list(self.submit_times)
+        stats['tasks'] = len(self.tasks)
+        if len(submit_times) > 1 and submit_times[-1] > submit_times[0]:
+            stats['submit_throughput'] = round((len(submit_times) - 1) / (submit_times[-1] - submit_times[0]), 2)
+        return stats
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _inject(self, rate: float) -> bool:
+        with self._lock:
+            injected = rate > 0 and self.random.random() < rate
+            if injected:
+                self.counters['injected_failures'] += 1
+        return injected
+
+    # Task simulation
+
+    def _schedule(self, task: _FakeTask) -> None:
+        """Give a leaf task its processing window on the next free worker (lock held)."""
+        duration = max(self.delay(self.random), 0.0)
+        start = task.created_at
+        if self.workers > 0:
+            if len(self._worker_free_at) >= self.workers:
+                start = max(start, heapq.heappop(self._worker_free_at))
+            heapq.heappush(self._worker_free_at, start + duration)
+        task.started_at = start
+        task.completed_at = start + duration
+        task.fails = self.task_failure_rate > 0 and self.random.random() < self.task_failure_rate
+
+    def create_task(self, file_name: str, pages: int, backend: str = 'auto', priority: int = 0) -> _FakeTask:
+        """Register a submitted document, split into subtasks when it is long enough."""
+        with self._lock:
+            parent = _FakeTask(f"fake-{next(self._ids)}", file_name, backend, priority, 1, pages)
+            if self.split_threshold and pages > self.split_threshold:
+                for start_page in range(1, pages + 1, self.split_size):
+                    end_page = min(start_page + self.split_size - 1, pages)
+                    subtask = _FakeTask(f"fake-{next(self._ids)}", file_name, backend, priority, start_page, end_page)
+                    self._schedule(subtask)
+                    parent.subtasks.append(subtask)
+                    self.tasks[subtask.task_id] = subtask
+            else:
+                self._schedule(parent)
+            self.tasks[parent.task_id] = parent
+        return parent
+
+    def _markdown(self, task: _FakeTask) -> str:
+        if task.markdown is None:
+            if task.subtasks:
+                task.markdown = '\n\n'.join(self._markdown(subtask) for subtask in task.subtasks)
+            else:
+                filler = (FILLER * (self.markdown_bytes_per_page // len(FILLER) + 1))[:self.markdown_bytes_per_page]
+                task.markdown = '\n\n'.join(
+                    f"## {task.file_name} page {page}\n\n{filler}" for page in range(task.start_page, task.end_page + 1)
+                )
+        return task.markdown
+
+    def _queue_position(self, task: _FakeTask) -> int:
+        with self._lock:
+            return sum(
+                1 for other in self.tasks.values()
+                if not other.subtasks and task.started_at > other.started_at > time.time()
+            ) + 1
+
+    def _subtask_entry(self, subtask: _FakeTask, now: float) -> dict[str, Any]:
+        return {
+            'task_id': subtask.task_id,
+            'status': subtask.status(now),
+            'chunk_info': {'start_page': subtask.start_page, 'end_page': subtask.end_page},
+        }
+
+    def task_payload(self, task: _FakeTask, now: float) -> dict[str, Any]:
+        status = task.status(now)
+        payload = {
+            'success': True,
+            'task_id': task.task_id,
+            'status': status,
+            'file_name': task.file_name,
+            'backend': task.backend,
+            'priority': task.priority,
+            'created_at': _iso(task.created_at),
+            'started_at': _iso(task.started_at) if status != 'pending' else None,
+            'completed_at': _iso(task.completed_at) if status in ('completed', 'failed') else None,
+        }
+        if status == 'pending' and not task.subtasks:
+            payload['queue_position'] = self._queue_position(task)
+        if task.subtasks:
+            entries = [self._subtask_entry(subtask, now) for subtask in task.subtasks]
+            done = sum(1 for entry in entries if entry['status'] == 'completed')
+            failed = sum(1 for entry in entries if entry['status'] == 'failed')
+            payload['is_parent'] = True
+            payload['subtasks'] = entries
+            payload['subtask_progress'] = {
+                'total': len(entries), 'completed': done, 'failed': failed,
+                'percentage': 100.0 * done / len(entries),
+            }
+        if status == 'completed':
+            payload['data'] = {
+                'content': self._markdown(task),
+                'markdown_file': task.file_name.rsplit('.', 1)[0] + '.md',
+            }
+        elif status == 'failed':
+            payload['error_message'] = 'Injected failure'
+        return payload
+
+    def _version(self, task: _FakeTask, now: float) -> Any:
+        if task.subtasks:
+            return tuple(subtask.status(now) for subtask in task.subtasks)
+        return task.status(now)
+
+    def status_body(self, task: _FakeTask) -> tuple[str, bytes]:
+        """(ETag, JSON body) of a task's current status, encoded once per version."""
+        now = time.time()
+        version = self._version(task, now)
+        cached = task.body
+        # Queue positions change without a status change, so pending bodies are rebuilt
+        if cached is None or cached[0] != version or version == 'pending':
+            body = json.dumps(self.task_payload(task, now)).encode()
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            cached = task.body = (version, etag, body)
+        return cached[1], cached[2]
+
+    def queue_stats(self) -> dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            statuses = [task.status(now) for task in self.tasks.values() if not task.subtasks]
+        return {name: statuses.count(name) for name in ('pending', 'processing', 'completed', 'failed')}
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(_FakeTianshuHandler):
+            fake = server
+
+        return Handler
+
+
+class _FakeTianshuHandler(BaseHTTPRequestHandler):
+    """Keep-alive request handler that routes to a ``FakeTianshuServer``."""
+    protocol_version = 'HTTP/1.1'
+    fake: FakeTianshuServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: dict[str, str] | None = None) -> None:
+        headers = dict(headers or {})
+        accept = self.headers.get('Accept-Encoding') or ''
+        if self.fake.compress_responses and len(body) > 1024 and 'gzip' in accept:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            body = compressor.compress(body) + compressor.flush()
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        if body:
+            headers.setdefault('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.fake._count('bytes_out', len(body))
+
+    def _send_json(self, status: int, payload: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(payload).encode(), headers)
+
+    def _read_body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.fake._count('bytes_in', len(body))
+        encoding = (self.headers.get('Content-Encoding') or '').lower()
+        if encoding == 'gzip':
+            return zlib.decompress(body, 47)
+        if encoding == 'zstd':
+            import zstandard
+            return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return body
+
+    def do_GET(self):
+        self.fake._count('requests')
+        path = self.path.split('?', 1)[0]
+        if path == '/api/v1/health':
+            self._send_json(200, {'status': 'healthy', 'stats': self.fake.queue_stats()})
+            return
+        if path == '/api/v1/queue/stats':
+            self._send_json(200, {'success': True, 'stats': self.fake.queue_stats()})
+            return
+
+        match = TASK_PATH.match(path)
+        if match is None:
+            self._send_json(404, {'detail': 'Not Found'})
+            return
+        self.fake._count('status_requests')
+        if self.fake._inject(self.fake.status_failure_rate):
+            self._send_json(500, {'detail': 'Injected status failure'})
+            return
+        task = self.fake.tasks.get(match.group(1))
+        if task is None:
+            self._send_json(404, {'success': False, 'message': 'Task not found'})
+            return
+
+        etag, body = self.fake.status_body(task)
+        if self.headers.get('If-None-Match') == etag:
+            self.fake._count('not_modified')
+            self._send(304, headers={'ETag': etag})
+            return
+        self._send(200, body, {'ETag': etag})
+
+    def do_POST(self):
+        self.fake._count('requests')
+        body = self._read_body()
+        if self.path.split('?', 1)[0] != '/api/v1/tasks/submit':
+            self._send_json(404, {'detail': 'Not Found'})
+            return
+        if self.fake._inject(self.fake.submit_failure_rate):
+            self._send_json(503, {'detail': 'Injected submit failure'})
+            return
+
+        message = BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        fields: dict[str, str] = {}
+        file_name, content = None, b''
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                file_name, content = part.get_filename(), part.get_payload(decode=True) or b''
+            elif name:
+                fields[name] = part.get_content().strip()
+        if not file_name:
+            self._send_json(422, {'success': False, 'message': 'file is required'})
+            return
+
+        with self.fake._lock:
+            self.fake.counters['submits'] += 1
+            self.fake.submit_times.append(time.monotonic())
+        try:
+            priority = int(fields.get('priority') or 0)
+        except ValueError:
+            priority = 0
+        task = self.fake.create_task(
+            file_name, _page_count(content, self.fake.default_pages), fields.get('backend') or 'auto', priority
+        )
+        self._send_json(200, {
+            'success': True, 'task_id': task.task_id, 'status': 'pending',
+            'file_name': file_name, 'message': 'Task submitted successfully',
+        })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local stand-in for the MinerU Tianshu API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--delay', default='lognormal:2:0.5', help='processing time distribution')
+    parser.add_argument('--workers', type=int, default=4, help='simulated GPUs (0: unlimited)')
+    parser.add_argument('--split-threshold', type=int, default=0, help='split PDFs longer than this')
+    parser.add_argument('--split-size', type=int, default=10)
+    parser.add_argument('--markdown-bytes-per-page', type=int, default=2048)
+    parser.add_argument('--submit-failure-rate', type=float, default=0.0)
+    parser.add_argument('--status-failure-rate', type=float, default=0.0)
+    parser.add_argument('--task-failure-rate', type=float, default=0.0)
+    parser.add_argument('--compress-responses', action='store_true')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = FakeTianshuServer(
+        delay=args.delay, workers=args.workers, split_threshold=args.split_threshold,
+        split_size=args.split_size, markdown_bytes_per_page=args.markdown_bytes_per_page,
+        submit_failure_rate=args.submit_failure_rate, status_failure_rate=args.status_failure_rate,
+        task_failure_rate=args.task_failure_rate, compress_responses=args.compress_responses,
+        seed=args.seed, host=args.host, port=args.port,
+    )
+    print(f"Fake Tianshu API listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Tests for submission rate limiting and admission control
+"""
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from tools.utils import admission
+from tools.utils.admission import AdmissionError, PrioritySlots, TokenBucket, admission_stats, admit
+from tools.utils.client import TianshuClient
+from tools.utils.submit import SubmitError, submit_upload
+from tools.utils.upload import spool_bytes
+
+
+@pytest.fixture
+def client():
+    return TianshuClient('http://tianshu', api_key='key')
+
+
+@pytest.fixture
+def no_sleep():
+    with patch('tools.utils.admission.time.sleep') as mock_sleep:
+        yield mock_sleep
+
+
+def test_token_bucket_allows_burst_then_spaces_submissions():
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve(10) for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve(10) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(10) == pytest.approx(1.0, abs=0.05)
+
+    with pytest.raises(AdmissionError, match='rate limit'):
+        bucket.reserve(0.1)
+
+
+def test_concurrency_cap_per_server(monkeypatch, client):
+    monkeypatch.setattr(admission, 'SERVER_CONCURRENCY', 1)
+    monkeypatch.setattr(admission, 'ADMISSION_MAX_WAIT', 0.05)
+
+    with admit(client, {}):
+        with pytest.raises(AdmissionError, match='in flight to this server'):
+            with admit(client, {}):
+                pass
+    # The slot is released once the first submission is done
+    with admit(client, {}):
+        pass
+    assert admission_stats()[0]['rejected'] == 1
+
+
+def test_token_refunded_when_no_slot_is_granted(monkeypatch, client):
+    monkeypatch.setattr(admission, 'SERVER_CONCURRENCY', 1)
+    monkeypatch.setattr(admission, 'SUBMIT_RATE', 0.001)
+    monkeypatch.setattr(admission, 'SUBMIT_BURST', 2)
+    monkeypatch.setattr(admission, 'ADMISSION_MAX_WAIT', 0.05)
+
+    with admit(client, {}):
+        # Timed out waiting for the slot: the token it reserved goes back
+        for _ in range(3):
+            with pytest.raises(AdmissionError, match='in flight to this server'):
+                with admit(client, {}):
+                    pass
+    # One token is left, so the next submission is admitted without waiting
+    with admit(client, {}) as ticket:
+        assert ticket['wait_seconds'] < 0.05
+
+
+def test_token_refunded_when_connection_never_made(monkeypatch, client):
+    monkeypatch.setattr(admission, 'SUBMIT_RATE', 0.001)
+    monkeypatch.setattr(admission, 'SUBMIT_BURST', 1)
+    monkeypatch.setattr(admission, 'ADMISSION_MAX_WAIT', 0)
+    refused = requests.exceptions.ConnectionError(Mock(reason=NewConnectionError(None, 'refused')))
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        with admit(client, {}):
+            raise refused
+    with admit(client, {}):
+        pass
+    # The admitted submission used the refunded token
+    with pytest.raises(AdmissionError, match='rate limit'):
+        with admit(client, {}):
+            pass
+
+
+def test_slots_go_to_highest_priority_then_soonest_deadline():
+    slots = PrioritySlots(1)
+    assert slots.acquire()
+    order = []
+
+    def submit(name, priority, deadline):
+        assert slots.acquire(priority, deadline, timeout=5)
+        order.append(name)
+        slots.release()
+
+    waiters = [
+        threading.Thread(target=submit, args=('bulk', 0, None)),
+        threading.Thread(target=submit, args=('chat-late', 5, time.time() + 300)),
+        threading.Thread(target=submit, args=('chat-soon', 5, time.time() + 30)),
+    ]
+    for waiter in waiters:
+        waiter.start()
+    while slots.waiting < len(waiters):
+        time.sleep(0.01)
+    slots.release()
+    for waiter in waiters:
+        waiter.join(5)
+
+    assert order == ['chat-soon', 'chat-late', 'bulk']
+
+
+def test_deprioritize_mode_lowers_priority_on_long_queue(monkeypatch, client, no_sleep):
+    monkeypatch.setattr(admission, 'ADMISSION_MODE', 'deprioritize')
+    with patch('tools.utils.admission.read_queue_depth', return_value=120):
+        with admit(client, {'priority': '5', 'backend': 'pipeline'}) as ticket:
+            assert ticket['data'] == {'priority': '0', 'backend': 'pipeline'}
+            assert ticket['deprioritized'] is True
+            assert ticket['queue_depth'] == 120
+
+
+def test_wait_mode_holds_submission_until_queue_drains(monkeypatch, client, no_sleep):
+    monkeypatch.setattr(admission, 'ADMISSION_MODE', 'wait')
+    with patch('tools.utils.admission.read_queue_depth', side_effect=[80, 60, 10]):
+        with admit(client, {'priority': '5'}) as ticket:
+            assert ticket['queue_depth'] == 10
+            assert ticket['data']['priority'] == '5'
+    assert no_sleep.call_count == 2
+
+
+def test_rejected_admission_surfaces_as_submit_error(monkeypatch, client):
+    monkeypatch.setattr(admission, 'SUBMIT_RATE', 1)
+    monkeypatch.setattr(admission, 'SUBMIT_BURST', 1)
+    monkeypatch.setattr(admission, 'ADMISSION_MAX_WAIT', 0)
+    response = Mock(status_code=200)
+    response.json.return_value = {'success': True, 'task_id': 'task-1'}
+
+    with patch.object(client, 'post', return_value=response) as mock_post:
+        assert submit_upload(client, 'a.pdf', spool_bytes(b'%PDF-1.4'), {})['task_id'] == 'task-1'
+        with pytest.raises(SubmitError, match='rate limit'):
+            submit_upload(client, 'a.pdf', spool_bytes(b'%PDF-1.4'), {})
+    assert mock_post.call_count == 1
@@ -0,0 +1,168 @@
+"""
+Tests for client-side backend selection
+"""
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from tests.test_pdf_split import make_pdf
+from tools.parse_document_async import ParseDocumentAsyncTool
+from tools.utils.backend_router import choose_backend, sniff_kind
+from tools.utils.timeline import get_timeline
+from tools.utils.upload import SpooledUpload
+
+
+def make_text_pdf(text: str) -> bytes:
+    """A one-page PDF whose text layer holds ``text``."""
+    stream = f"BT /F1 12 Tf 20 100 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 200] "
+        b"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    body, offsets = b"%PDF-1.4\n", []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n".encode() + content + b"\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return body
+
+
+def _spool(content: bytes) -> SpooledUpload:
+    upload = SpooledUpload()
+    upload.write(content)
+    upload.seek(0)
+    return upload
+
+
+def _history(backend, count, queue_wait, processing, pages=None):
+    for index in range(count):
+        task_id = f"{backend}-{index}"
+        if pages:
+            get_timeline().expect_pages(task_id, pages)
+        get_timeline().record({
+            'success': True, 'status': 'completed', 'task_id': task_id, 'backend': backend,
+            'created_at': 0.0, 'started_at': queue_wait, 'completed_at': queue_wait + processing,
+        })
+
+
+@pytest.mark.parametrize('file_name, head, kind', [
+    ('a.pdf', b'%PDF-1.7', 'pdf'),
+    ('photo.bin', b'\x89PNG\r\n\x1a\n', 'image'),
+    ('talk.wav', b'RIFF\x00\x00\x00\x00WAVE', 'audio'),
+    ('clip', b'\x00\x00\x00\x18ftypmp42', 'video'),
+    ('report.docx', b'PK\x03\x04', 'office'),
+    ('seq.fasta', b'>chr1', 'fasta'),
+    ('notes.md', b'# Notes', 'other'),
+    ('scan.tiff', b'', 'image'),
+])
+def test_sniff_kind(file_name, head, kind):
+    assert sniff_kind(file_name, head) == kind
+
+
+def test_text_pdf_uses_text_layer():
+    route = choose_backend('paper.pdf', _spool(make_text_pdf('Born digital text ' * 8)), {'backend': 'auto'})
+
+    assert (route.backend, route.method) == ('pipeline', 'txt')
+    assert route.text_layer is True
+    assert route.to_dict()['reason'] == 'PDF has a text layer'
+
+
+def test_scanned_pdf_goes_to_fastest_measured_ocr_backend():
+    upload = _spool(make_pdf(4))
+
+    first = choose_backend('scan.pdf', upload, {'backend': 'auto'})
+    assert (first.backend, first.method, first.pages) == ('pipeline', 'ocr', 4)
+    assert 'no history yet' in first.reason
+
+    # pipeline has the shorter queue, but paddleocr-vl is much faster per page
+    _history('pipeline', 5, queue_wait=1, processing=40, pages=4)
+    _history('paddleocr-vl', 5, queue_wait=5, processing=8, pages=4)
+    with patch('tools.utils.backend_router.random.random', return_value=1.0):
+        route = choose_backend('scan.pdf', upload, {'backend': 'auto'})
+
+    assert (route.backend, route.method) == ('paddleocr-vl', 'auto')
+    assert route.estimated_seconds == 13
+    assert route.reason.startswith('scanned PDF: fastest measured (paddleocr-vl ~13s; pipeline ~41s)')
+
+
+def test_unconfigured_backend_is_used_once_seen_working():
+    image = _spool(b'\x89PNG\r\n\x1a\n' + b'\x00' * 32)
+    _history('pipeline', 5, queue_wait=0, processing=30)
+    _history('paddleocr-vl', 5, queue_wait=0, processing=20)
+    with patch('tools.utils.backend_router.random.random', return_value=1.0):
+        assert choose_backend('page.png', image, {}).backend == 'paddleocr-vl'
+        _history('paddleocr-vl-vllm', 5, queue_wait=0, processing=5)
+        assert choose_backend('page.png', image, {}).backend == 'paddleocr-vl-vllm'
+
+
+def test_caller_choices_are_kept():
+    upload = _spool(make_text_pdf('Born digital text ' * 8))
+
+    assert not choose_backend('paper.pdf', upload, {'backend': 'pipeline'}).routed
+    assert choose_backend('paper.pdf', upload, {'backend': 'auto', 'method': 'ocr'}).method == 'ocr'
+    assert not choose_backend('report.docx', _spool(b'PK\x03\x04rest'), {'backend': 'auto'}).routed
+    assert choose_backend('talk.mp3', _spool(b'ID3\x04'), {'backend': 'auto'}).backend == 'sensevoice'
+
+
+def test_async_submission_records_route(mock_runtime, mock_session, mock_successful_submit_response):
+    tool = ParseDocumentAsyncTool(runtime=mock_runtime, session=mock_session)
+    file = SimpleNamespace(filename='paper.pdf', url=None, blob=make_text_pdf('Born digital text ' * 8))
+
+    with patch('tools.utils.client.requests.Session.post') as mock_post:
+        mock_post.return_value = Mock(status_code=200, headers={})
+        mock_post.return_value.json.return_value = mock_successful_submit_response
+        messages = list(tool._invoke({'file': file, 'backend': 'auto', 'use_cache': False}))
+
+    fields = mock_post.call_args.kwargs['data'].fields
+    result = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')][-1]
+    assert (fields['backend'], fields['method']) == ('pipeline', 'txt')
+    assert result['backend'] == 'pipeline'
+    assert result['route']['routed'] is True
+    assert result['route']['reason'] == 'PDF has a text layer'
+
+
+def test_routing_does_not_change_the_document_identity(mock_runtime, mock_session, mock_successful_submit_response):
+    tool = ParseDocumentAsyncTool(runtime=mock_runtime, session=mock_session)
+    file = SimpleNamespace(filename='scan.pdf', url=None, blob=make_pdf(4))
+
+    with patch('tools.utils.client.requests.Session.post') as mock_post, \
+            patch('tools.utils.client.requests.Session.get') as mock_get:
+        mock_post.return_value = Mock(status_code=200, headers={})
+        mock_post.return_value.json.return_value = mock_successful_submit_response
+        mock_get.return_value = Mock(status_code=200, headers={})
+        mock_get.return_value.json.return_value = {'success': True, 'status': 'processing'}
+        list(tool._invoke({'file': file, 'backend': 'auto'}))
+
+        # Whatever backend exploration would pick now, the earlier task is reused without inspecting the file
+        with patch('tools.utils.backend_router.inspect_pdf') as inspect:
+            messages = list(tool._invoke({'file': file, 'backend': 'auto'}))
+
+    result = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')][-1]
+    assert mock_post.call_count == 1
+    inspect.assert_not_called()
+    assert result['api_response']['cached'] is True
+    assert result['task_id'] == mock_successful_submit_response['task_id']
+
+
+def test_route_tracks_submitted_pages(mock_runtime, mock_session, mock_successful_submit_response):
+    tool = ParseDocumentAsyncTool(runtime=mock_runtime, session=mock_session)
+    file = SimpleNamespace(filename='scan.pdf', url=None, blob=make_pdf(4))
+
+    with patch('tools.utils.client.requests.Session.post') as mock_post, \
+            patch.object(get_timeline(), 'expect_pages') as expect_pages:
+        mock_post.return_value = Mock(status_code=200, headers={})
+        mock_post.return_value.json.return_value = mock_successful_submit_response
+        messages = list(tool._invoke({'file': file, 'backend': 'auto', 'max_pages': 2, 'use_cache': False}))
+
+    result = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')][-1]
+    assert result['page_selection']['submitted_pages'] == 2
+    assert result['route']['pages'] == 2
+    expect_pages.assert_called_once_with(mock_successful_submit_response['task_id'], 2)
@@ -0,0 +1,73 @@
+"""
+Tests for the content-hash result cache
+"""
+from unittest.mock import patch
+
+from tools.utils.cache import ResultCache
+
+
+class TestResultCache:
+    """Test cases for ResultCache"""
+
+    def test_document_key_normalizes_options(self):
+        """Option order does not change the key, option values do"""
+        a = ResultCache.document_key('http://s', 'abc', {'lang': 'ch', 'backend': 'pipeline'})
+        b = ResultCache.document_key('http://s', 'abc', {'backend': 'pipeline', 'lang': 'ch'})
+        c = ResultCache.document_key('http://s', 'abc', {'backend': 'pipeline', 'lang': 'en'})
+
+        assert a == b
+        assert a != c
+
+    def test_hits_and_misses_are_counted(self):
+        cache = ResultCache()
+        cache.put('k', {'task_id': 't'})
+
+        assert cache.get('k') == {'task_id': 't'}
+        assert cache.get('missing') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_lru_eviction_by_entry_count(self):
+        """The least recently used entry is evicted first"""
+        cache = ResultCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_eviction_by_size(self):
+        """Entries are evicted to stay within the byte budget"""
+        cache = ResultCache(max_bytes=250)
+        cache.put('a', 'x' * 100)
+        cache.put('b', 'y' * 100)
+        cache.put('c', 'z' * 100)
+
+        assert cache.get('a') is None
+        assert cache.stats()['bytes'] <= 250
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResultCache(ttl=10)
+        with patch('tools.utils.cache.time.time', return_value=1000.0):
+            cache.put('k', 'v')
+        with patch('tools.utils.cache.time.time', return_value=1011.0):
+            assert cache.get('k') is None
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        """Entries written to the disk tier are readable by a fresh cache"""
+        ResultCache(disk_dir=str(tmp_path)).put('doc:abc', {'task_id': 't'})
+
+        fresh = ResultCache(disk_dir=str(tmp_path))
+
+        assert fresh.get('doc:abc') == {'task_id': 't'}
+
+    def test_invalidate_removes_both_tiers(self, tmp_path):
+        cache = ResultCache(disk_dir=str(tmp_path))
+        cache.put('doc:abc', {'task_id': 't'})
+        cache.invalidate('doc:abc')
+
+        assert cache.get('doc:abc') is None
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,104 @@
+"""
+Tests for the semantic markdown chunker
+"""
+import pytest
+from tools.utils.chunker import MarkdownChunker, chunk_markdown, estimate_tokens, parse_chunking_options
+from tools.utils.pdf_split import stitch_parts
+
+DOCUMENT = """<!-- page: 1 -->
+# Introduction
+
+MinerU turns documents into markdown.
+
+## Results
+
+| model | score |
+|-------|-------|
+| a     | 0.9   |
+
+$$
+E = mc^2
+$$
+
+<!-- page: 2 -->
+# Appendix
+
+""" + "A fairly long sentence for splitting. " * 60
+
+
+def test_headings_start_new_chunks_with_heading_path():
+    chunks = chunk_markdown(DOCUMENT, 128)
+
+    assert chunks[0]['headings'] == ['Introduction']
+    assert chunks[1]['headings'] == ['Introduction', 'Results']
+    assert chunks[2]['headings'] == ['Appendix']
+    assert [chunk['index'] for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_tables_and_formulas_stay_whole():
+    chunks = chunk_markdown(DOCUMENT, 64)
+
+    table_chunk = next(chunk for chunk in chunks if 'table' in chunk['block_types'])
+    assert '| a     | 0.9   |' in table_chunk['text'] and '| model | score |' in table_chunk['text']
+    formula_chunk = next(chunk for chunk in chunks if 'formula' in chunk['block_types'])
+    assert '$$\nE = mc^2\n$$' in formula_chunk['text']
+
+
+def test_long_paragraphs_respect_token_budget():
+    chunks = chunk_markdown(DOCUMENT, 128)
+
+    appendix = [chunk for chunk in chunks if chunk['headings'] == ['Appendix']]
+    assert len(appendix) > 1
+    assert all(chunk['tokens'] <= 128 for chunk in appendix)
+    assert all(chunk['pages'] == [2, 2] for chunk in appendix)
+    assert chunks[0]['pages'] == [1, 1]
+
+
+def test_pages_only_for_client_split_documents():
+    # Server markdown has no page data, so its chunks carry no page references
+    unmarked = DOCUMENT.replace('<!-- page: 1 -->\n', '').replace('<!-- page: 2 -->\n', '')
+    assert all(chunk['pages'] is None for chunk in chunk_markdown(unmarked, 128))
+
+    stitched = stitch_parts([
+        {'first_page': 1, 'last_page': 2, 'content': '# Part one\n\nText.'},
+        {'first_page': 3, 'last_page': 4, 'content': '# Part two\n\nMore text.'},
+    ])
+    assert [chunk['pages'] for chunk in chunk_markdown(stitched, 128)] == [[1, 1], [3, 3]]
+
+
+def test_ids_are_stable_and_unique():
+    first = chunk_markdown(DOCUMENT, 128)
+    second = chunk_markdown(DOCUMENT, 128)
+
+    assert [chunk['id'] for chunk in first] == [chunk['id'] for chunk in second]
+    assert len({chunk['id'] for chunk in first}) == len(first)
+
+
+def test_offsets_point_into_source():
+    chunks = chunk_markdown(DOCUMENT, 128)
+
+    assert DOCUMENT[chunks[1]['char_start']:].startswith('## Results')
+
+
+@pytest.mark.parametrize('piece_size', [1, 7, 1000])
+def test_streaming_matches_single_pass(piece_size):
+    chunker = MarkdownChunker(128)
+    streamed = []
+    for start in range(0, len(DOCUMENT), piece_size):
+        streamed.extend(chunker.feed(DOCUMENT[start:start + piece_size]))
+    streamed.extend(chunker.close())
+
+    assert streamed == chunk_markdown(DOCUMENT, 128)
+
+
+def test_estimate_tokens_counts_cjk_characters():
+    assert estimate_tokens('解析文档') == 4
+    assert estimate_tokens('abcdefgh') == 2
+
+
+def test_parse_chunking_options():
+    assert parse_chunking_options({}) is None
+    assert parse_chunking_options({'semantic_chunks': True}) == 512
+    assert parse_chunking_options({'semantic_chunks': 'true', 'chunk_max_tokens': 256}) == 256
+    with pytest.raises(ValueError):
+        parse_chunking_options({'semantic_chunks': True, 'chunk_max_tokens': 10})
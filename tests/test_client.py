@@ -0,0 +1,104 @@
+"""
+Tests for the shared pooled HTTP client
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tools.utils import client as client_module
+from tools.utils.client import get_client, get_client_stats, close_all_clients
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler that echoes the API key header back as JSON"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'api_key': self.headers.get('X-API-Key')}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def clean_clients():
+    close_all_clients()
+    yield
+    close_all_clients()
+
+
+class TestSharedClient:
+    """Test cases for get_client and TianshuClient"""
+
+    def test_same_key_returns_same_client(self):
+        """Clients are shared per (url, verify_ssl, api_key)"""
+        a = get_client('http://localhost:8100/', True, 'key')
+        b = get_client('http://localhost:8100', True, 'key')
+        c = get_client('http://localhost:8100', True, 'other-key')
+
+        assert a is b
+        assert a is not c
+
+    def test_connections_are_reused(self, local_server):
+        """Sequential requests reuse one keep-alive connection"""
+        client = get_client(local_server, True, 'test-api-key')
+
+        for _ in range(5):
+            response = client.get('/api/v1/health', timeout=5)
+            assert response.json() == {'api_key': 'test-api-key'}
+
+        stats = client.stats()
+        assert stats['requests'] == 5
+        assert stats['new_connections'] == 1
+        assert stats['reused_connections'] == 4
+        assert get_client_stats()[0]['requests'] == 5
+
+    def test_download_does_not_send_api_key(self, local_server):
+        """File downloads go through the pool without API credentials"""
+        client = get_client(local_server, True, 'test-api-key')
+
+        response = client.download(f"{local_server}/files/test.pdf", timeout=5)
+
+        assert response.json() == {'api_key': None}
+
+    def test_idle_clients_are_evicted(self, monkeypatch):
+        """Clients unused for longer than IDLE_TIMEOUT are closed and replaced"""
+        monkeypatch.setattr(client_module, 'IDLE_TIMEOUT', 0)
+        first = get_client('http://localhost:8100', True, 'key')
+        first.last_used -= 1
+
+        second = get_client('http://localhost:8100', True, 'key')
+
+        assert second is not first
+
+    def test_client_with_streamed_transfer_is_not_evicted(self, monkeypatch, local_server):
+        """A client whose streamed response is still open survives idle eviction"""
+        monkeypatch.setattr(client_module, 'IDLE_TIMEOUT', 0)
+        first = get_client(local_server, True, 'key')
+
+        response = first.download(f"{local_server}/files/test.pdf", stream=True, timeout=5)
+        first.last_used -= 1
+        assert first.busy
+        assert get_client(local_server, True, 'key') is first
+
+        response.close()
+        assert not first.busy
+        first.last_used -= 1
+        assert get_client(local_server, True, 'key') is not first
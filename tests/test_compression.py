@@ -0,0 +1,100 @@
+"""
+Tests for compressed responses and uploads
+"""
+import gzip
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+import pytest
+
+from tools.utils import compression
+from tools.utils.client import TianshuClient
+from tools.utils.compression import compress_body, is_compressible
+from tools.utils.submit import submit_upload
+from tools.utils.upload import MultipartEncoder, spool_bytes
+
+MARKDOWN = ('# Report\n\n' + 'The quarterly figures are in the table below. ' * 2000).encode()
+
+
+class _GzipHandler(BaseHTTPRequestHandler):
+    """Answers with a gzip-compressed status payload when the client accepts it"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'success': True, 'status': 'completed', 'data': {'content': MARKDOWN.decode()}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gzip_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _GzipHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_compressed_status_response_is_decoded_and_counted(gzip_server):
+    client = TianshuClient(gzip_server)
+    response = client.get('/api/v1/tasks/task-1')
+
+    assert response.json()['data']['content'] == MARKDOWN.decode()
+    responses = client.stats()['compression']['responses']
+    assert responses['compressed'] == 1
+    assert responses['saved_bytes'] > responses['wire_bytes']
+    client.close()
+
+
+def test_only_uncompressed_formats_are_compressible():
+    assert is_compressible('notes.md', spool_bytes(MARKDOWN))
+    assert not is_compressible('notes.md', spool_bytes(b'tiny'))
+    # Office Open XML is a ZIP container, whatever the extension
+    assert not is_compressible('report.docx', spool_bytes(b'PK\x03\x04' + MARKDOWN))
+    assert not is_compressible('notes.txt', spool_bytes(b'%PDF-1.7' + MARKDOWN))
+
+
+def test_compress_body_round_trips_or_declines():
+    encoder = MultipartEncoder({'backend': 'pipeline'}, 'file', 'notes.md', spool_bytes(MARKDOWN))
+    raw = encoder.read()
+
+    body = compress_body(encoder, 'gzip')
+    assert gzip.decompress(body.read()) == raw
+    assert len(body) < len(raw) / 10
+    # The encoder is left ready to send uncompressed
+    assert encoder.read() == raw
+
+    noise = MultipartEncoder({}, 'file', 'scan.bmp', spool_bytes(os.urandom(64 * 1024)))
+    assert compress_body(noise, 'gzip') is None
+
+
+def test_submit_sends_compressed_body_when_enabled(monkeypatch):
+    monkeypatch.setattr(compression, 'UPLOAD_COMPRESSION', 'gzip')
+    client = TianshuClient('http://tianshu')
+    sent = {}
+
+    def post(path, data=None, headers=None, **kwargs):
+        sent.update(headers=headers, body=data.read())
+        response = Mock(status_code=200)
+        response.json.return_value = {'success': True, 'task_id': 'task-1'}
+        return response
+
+    with patch.object(client, 'post', side_effect=post):
+        submit_upload(client, 'notes.md', spool_bytes(MARKDOWN), {'backend': 'pipeline'})
+
+    assert sent['headers']['Content-Encoding'] == 'gzip'
+    assert MARKDOWN in gzip.decompress(sent['body'])
+    assert client.stats()['compression']['uploads']['saved_bytes'] > 0
@@ -0,0 +1,127 @@
+"""
+End-to-end tests of the tools against the local fake Tianshu server
+"""
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from tests.benchmark import percentile, regressions, run_tool
+from tests.fake_server import FakeTianshuServer, parse_delay
+from tests.test_pdf_split import make_pdf
+from tools.get_parse_result_stream import GetParseResultStreamTool
+from tools.parse_document import ParseDocumentTool
+from tools.utils.client import close_all_clients, get_client
+from tools.utils.task_group import fetch_task_status
+
+
+@pytest.fixture(autouse=True)
+def clean_clients():
+    close_all_clients()
+    yield
+    close_all_clients()
+
+
+def _runtime(server):
+    runtime = Mock()
+    runtime.credentials = {'api_server_url': server.url, 'api_key': 'test-api-key'}
+    return runtime
+
+
+def _document(name, content):
+    return SimpleNamespace(filename=name, url=None, blob=content)
+
+
+def _json_messages(messages):
+    return [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+
+
+def test_parse_delay():
+    import random
+    rng = random.Random(1)
+    assert parse_delay('0.5')(rng) == 0.5
+    assert 1 <= parse_delay('uniform:1:2')(rng) <= 2
+    assert parse_delay('lognormal:1:0.5')(rng) > 0
+    with pytest.raises(ValueError):
+        parse_delay('gamma:1')
+
+
+def test_parse_document_round_trip(mock_session):
+    with FakeTianshuServer(markdown_bytes_per_page=100) as server:
+        tool = ParseDocumentTool(runtime=_runtime(server), session=mock_session)
+        messages = list(tool._invoke({
+            'file': _document('notes.txt', b'hello'), 'use_cache': False, 'max_wait_time': 30,
+        }))
+        stats = server.stats()
+
+    result = _json_messages(messages)[-1]
+    assert result['status'] == 'completed'
+    assert 'notes.txt page 1' in result['data']['content']
+    assert stats['submits'] == 1
+    assert stats['bytes_in'] > 0
+
+
+def test_split_document_streams_every_part(mock_session):
+    with FakeTianshuServer(split_threshold=5, split_size=5, markdown_bytes_per_page=50) as server:
+        task = server.create_task('big.pdf', pages=12)
+        tool = GetParseResultStreamTool(runtime=_runtime(server), session=mock_session)
+        messages = list(tool._invoke({'task_id': task.task_id, 'max_wait_time': 30}))
+
+    results = _json_messages(messages)
+    assert [(part['start_page'], part['end_page']) for part in results[:-1]] == [(1, 5), (6, 10), (11, 12)]
+    assert results[-1]['status'] == 'completed'
+
+
+def test_split_pdf_upload_becomes_parent_task(mock_session):
+    with FakeTianshuServer(split_threshold=3, split_size=2) as server:
+        tool = ParseDocumentTool(runtime=_runtime(server), session=mock_session)
+        messages = list(tool._invoke({
+            'file': _document('doc.pdf', make_pdf(5)), 'use_cache': False, 'max_wait_time': 30,
+        }))
+
+    result = _json_messages(messages)[-1]
+    assert result['is_parent'] is True
+    assert result['subtask_progress']['total'] == 3
+
+
+def test_unchanged_status_is_not_modified():
+    with FakeTianshuServer(delay=60, workers=1) as server:
+        server.create_task('first.txt', pages=1)
+        queued = server.create_task('second.txt', pages=1)
+        client = get_client(server.url)
+        (_, first), _ = fetch_task_status(client, queued.task_id)
+        (response, second), _ = fetch_task_status(client, queued.task_id, not_before=float('inf'))
+        stats = server.stats()
+
+    assert first['status'] == 'pending'
+    assert first['queue_position'] == 1
+    assert response.status_code == 304
+    assert second is first
+    assert stats['not_modified'] == 1
+
+
+def test_injected_task_failure_is_reported(mock_session):
+    with FakeTianshuServer(task_failure_rate=1.0, seed=1) as server:
+        tool = ParseDocumentTool(runtime=_runtime(server), session=mock_session)
+        messages = list(tool._invoke({
+            'file': _document('broken.txt', b'data'), 'use_cache': False, 'max_wait_time': 30,
+        }))
+
+    assert _json_messages(messages)[-1]['status'] == 'failed'
+
+
+def test_benchmark_reports_and_flags_regressions():
+    config = {
+        'documents': 3, 'concurrency': 2, 'batch_size': 2, 'pages': 1, 'delay': 0, 'workers': 0,
+        'split_threshold': 0, 'split_size': 2, 'markdown_bytes_per_page': 10, 'submit_failure_rate': 0.0,
+        'status_failure_rate': 0.0, 'task_failure_rate': 0.0, 'compress_responses': False,
+        'max_wait_time': 30, 'seed': 1,
+    }
+    report = run_tool('parse_document_async', config)
+    assert report['errors'] == 0
+    assert report['bytes_in_per_document'] > 0
+
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    baseline = [{**report, 'time_to_result_p99': 0.001, 'errors': 0}]
+    slower = {**report, 'time_to_result_p99': 1.0}
+    assert regressions([slower], baseline, 0.25) == ['parse_document_async: time_to_result_p99 0.001 -> 1.0']
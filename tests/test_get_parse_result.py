@@ -19,7 +19,7 @@ class TestGetParseResultTool:
             'include_images': False
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = mock_completed_task_response
             mock_response.raise_for_status = Mock()
@@ -41,7 +41,7 @@ class TestGetParseResultTool:
             'task_id': 'test-task-id-12345'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = mock_pending_task_response
             mock_response.raise_for_status = Mock()
@@ -61,7 +61,7 @@ class TestGetParseResultTool:
             'task_id': 'test-task-id-12345'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = mock_processing_task_response
             mock_response.raise_for_status = Mock()
@@ -81,7 +81,7 @@ class TestGetParseResultTool:
             'task_id': 'test-task-id-12345'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = mock_failed_task_response
             mock_response.raise_for_status = Mock()
@@ -131,7 +131,7 @@ class TestGetParseResultTool:
             'task_id': 'invalid-task-id'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = {
                 'success': False,
@@ -155,7 +155,7 @@ class TestGetParseResultTool:
             'task_id': 'test-task-id-12345'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_get.side_effect = Exception("Network error: Connection refused")
 
             messages = list(tool._invoke(tool_parameters))
@@ -180,7 +180,7 @@ class TestGetParseResultTool:
             'include_images': True
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = mock_completed_task_response
             mock_response.raise_for_status = Mock()
@@ -206,7 +206,7 @@ class TestGetParseResultTool:
             'task_id': 'test-task-id-12345'
         }
 
-        with patch('tools.get_parse_result.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
             mock_response = Mock()
             mock_response.json.return_value = {
                 'success': True,
@@ -225,3 +225,118 @@ class TestGetParseResultTool:
 
             # Should warn about missing content
             assert any('no content found' in str(msg).lower() for msg in messages)
+
+    def test_compact_output_drops_origin_content(self, mock_runtime, mock_session, mock_completed_task_response):
+        """Test that compact mode keeps markdown_content but not its copy in originData"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
+            mock_response = Mock()
+            mock_response.json.return_value = mock_completed_task_response
+            mock_get.return_value = mock_response
+
+            messages = list(tool._invoke({'task_id': 'test-task-id-12345', 'output_mode': 'compact'}))
+
+        result_json = messages[-1].message.json_object
+        assert result_json['markdown_content'] == mock_completed_task_response['data']['content']
+        assert 'content' not in result_json['originData']['data']
+
+    def test_chunked_output(self, mock_runtime, mock_session):
+        """Test that chunked mode emits bounded chunks with offsets"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+        content = 'x' * 2500
+
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            'success': True,
+            'status': 'completed',
+            'data': {'content': content, 'markdown_file': 'doc.md'}
+        }
+        with patch('tools.utils.client.requests.Session.get', return_value=mock_response) as mock_get:
+            messages = list(tool._invoke({
+                'task_id': 'test-task-id-12345', 'output_mode': 'chunked', 'chunk_size': 1000
+            }))
+
+        # The inlined content is sliced instead of downloaded a second time
+        assert mock_get.call_count == 1
+
+        json_messages = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+        chunks, result_json = json_messages[:-1], json_messages[-1]
+        assert [(chunk['offset'], chunk['length']) for chunk in chunks] == [(0, 1000), (1000, 1000), (2000, 500)]
+        assert ''.join(chunk['content'] for chunk in chunks) == content
+        assert result_json['chunk_count'] == 3
+        assert result_json['total_length'] == 2500
+        assert 'markdown_content' not in result_json
+
+    def test_chunked_output_streams_from_content_endpoint(self, mock_runtime, mock_session):
+        """Test that chunked mode streams content the status payload does not carry"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+        content = '# 标题\n' * 400
+
+        status_response = Mock()
+        status_response.json.return_value = {'success': True, 'status': 'completed', 'data': {}}
+        content_response = Mock()
+        content_response.status_code = 200
+        encoded = content.encode('utf-8')
+        # Split mid-character to exercise incremental decoding
+        content_response.iter_content.return_value = [encoded[i:i + 7] for i in range(0, len(encoded), 7)]
+        close = content_response.close
+
+        with patch('tools.utils.client.requests.Session.get', side_effect=[status_response, content_response]) as mock_get:
+            messages = list(tool._invoke({
+                'task_id': 'test-task-id-12345', 'output_mode': 'chunked', 'chunk_size': 1000
+            }))
+
+        assert mock_get.call_args_list[1][0][0].endswith('/api/v1/tasks/test-task-id-12345/content')
+        chunks = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')][:-1]
+        assert ''.join(chunk['content'] for chunk in chunks) == content
+        assert all(chunk['length'] <= 1000 for chunk in chunks)
+        close.assert_called()
+
+    def test_chunked_output_streams_truncated_content(self, mock_runtime, mock_session):
+        """Test that chunked mode streams the full content when the inlined copy is truncated"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+        content = 'z' * 2500
+
+        status_response = Mock()
+        status_response.json.return_value = {
+            'success': True, 'status': 'completed',
+            'data': {'content': 'z' * 100, 'content_truncated': True, 'markdown_file': 'doc.md'}
+        }
+        content_response = Mock(status_code=200)
+        content_response.iter_content.return_value = [content.encode()[i:i + 700] for i in range(0, 2500, 700)]
+
+        with patch('tools.utils.client.requests.Session.get', side_effect=[status_response, content_response]) as mock_get:
+            messages = list(tool._invoke({
+                'task_id': 'test-task-id-12345', 'output_mode': 'chunked', 'chunk_size': 1000
+            }))
+
+        assert mock_get.call_args_list[1][0][0].endswith('/api/v1/tasks/test-task-id-12345/content')
+        assert mock_get.call_args_list[1][1]['stream'] is True
+        json_messages = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+        assert ''.join(chunk['content'] for chunk in json_messages[:-1]) == content
+        assert json_messages[-1]['total_length'] == 2500
+
+    def test_invalid_output_mode(self, mock_runtime, mock_session):
+        """Test validation of output_mode"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+
+        messages = list(tool._invoke({'task_id': 'test-task-id-12345', 'output_mode': 'tiny'}))
+
+        assert any('output_mode must be one of' in str(msg) for msg in messages)
+
+    def test_semantic_chunks_alongside_markdown(self, mock_runtime, mock_session, mock_completed_task_response):
+        """Test that RAG chunks are returned with the raw markdown"""
+        tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+
+        with patch('tools.utils.client.requests.Session.get') as mock_get:
+            mock_response = Mock()
+            mock_response.json.return_value = mock_completed_task_response
+            mock_get.return_value = mock_response
+
+            messages = list(tool._invoke({'task_id': 'test-task-id-12345', 'semantic_chunks': True}))
+
+        result_json = messages[-1].message.json_object
+        assert result_json['markdown_content'] == mock_completed_task_response['data']['content']
+        assert result_json['chunks']
+        assert all({'id', 'text', 'tokens', 'headings', 'pages'} <= set(chunk) for chunk in result_json['chunks'])
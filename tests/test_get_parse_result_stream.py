@@ -0,0 +1,164 @@
+"""
+Tests for get_parse_result_stream tool
+"""
+from unittest.mock import Mock, patch
+
+from tests.fake_server import FakeTianshuServer
+from tools.get_parse_result_stream import GetParseResultStreamTool
+from tools.utils.client import get_client
+from tools.utils.subtasks import SubtaskIndex, ordered_subtasks
+from tools.utils.task_group import fetch_task_status
+
+
+def _response(payload):
+    response = Mock()
+    response.status_code = 200
+    response.headers = {}
+    response.json.return_value = payload
+    return response
+
+
+def _parent(status, subtask_statuses):
+    return {
+        'success': True,
+        'task_id': 'parent',
+        'status': status,
+        'is_parent': True,
+        'subtask_progress': {'total': len(subtask_statuses)},
+        'subtasks': [
+            {'task_id': f'sub-{index}', 'status': sub_status,
+             'chunk_info': {'start_page': index * 10 + 1, 'end_page': index * 10 + 10}}
+            for index, sub_status in enumerate(subtask_statuses)
+        ],
+    }
+
+
+def _json_messages(messages):
+    return [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+
+
+def _variables(messages):
+    return {msg.message.variable_name: msg.message.variable_value
+            for msg in messages if hasattr(msg.message, 'variable_name')}
+
+
+def test_ordered_subtasks_sorts_by_start_page():
+    status_result = _parent('processing', ['completed', 'completed'])
+    status_result['subtasks'].reverse()
+    status_result['subtasks'].append({'task_id': 'sub-x', 'status': 'pending'})
+    assert [s['task_id'] for s in ordered_subtasks(status_result)] == ['sub-0', 'sub-1', 'sub-x']
+
+
+def test_subtask_index_records_only_changes():
+    index = SubtaskIndex()
+    first = _parent('processing', ['completed', 'failed', 'pending'])
+    index.update(first)
+    assert index.completed == ['sub-0']
+    assert index.failed == 1
+
+    index.update(first)
+    second = _parent('processing', ['completed', 'completed', 'pending'])
+    index.update(second)
+    assert index.completed == ['sub-0', 'sub-1']
+    assert index.failed == 0
+    assert index.positions == {'sub-0': 0, 'sub-1': 1, 'sub-2': 2}
+
+    # Unchanged progress counters skip the subtask list entirely
+    progressed = _parent('processing', ['completed', 'completed', 'completed'])
+    index.update({**second, 'subtask_progress': {'total': 3, 'completed': 2, 'failed': 0}})
+    index.update({**progressed, 'subtask_progress': {'total': 3, 'completed': 2, 'failed': 0}})
+    assert index.completed == ['sub-0', 'sub-1']
+
+
+def test_not_modified_status_reuses_decoded_payload():
+    client = get_client('http://localhost:8100')
+    full = _response({'success': True, 'status': 'processing'})
+    full.headers = {'ETag': '"v1"'}
+    not_modified = Mock(status_code=304, headers={})
+
+    with patch('tools.utils.client.requests.Session.get', side_effect=[full, not_modified]) as mock_get:
+        (_, first), _ = fetch_task_status(client, 'task-1')
+        (_, second), _ = fetch_task_status(client, 'task-1', not_before=float('inf'))
+
+    assert second is first
+    assert mock_get.call_args.kwargs['headers']['If-None-Match'] == '"v1"'
+    not_modified.json.assert_not_called()
+
+
+class TestGetParseResultStreamTool:
+    """Test cases for GetParseResultStreamTool"""
+
+    def test_parts_emitted_once_as_they_finish(self, mock_runtime, mock_session):
+        """Test that each finished part is sent exactly once, before the parent completes"""
+        tool = GetParseResultStreamTool(runtime=mock_runtime, session=mock_session)
+        parent_rounds = [
+            _parent('processing', ['pending', 'completed', 'processing']),
+            _parent('processing', ['completed', 'completed', 'processing']),
+            _parent('completed', ['completed', 'completed', 'completed']),
+        ]
+
+        def get(url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            if task_id == 'parent':
+                return _response(parent_rounds.pop(0))
+            return _response({'success': True, 'task_id': task_id, 'status': 'completed',
+                              'data': {'content': f'# {task_id}'}})
+
+        with patch('tools.utils.client.requests.Session.get', side_effect=get), \
+             patch('tools.get_parse_result_stream.time.sleep'):
+            messages = list(tool._invoke({'task_id': 'parent'}))
+
+        results = _json_messages(messages)
+        parts = results[:-1]
+        assert [part['subtask_id'] for part in parts] == ['sub-1', 'sub-0', 'sub-2']
+        assert parts[0]['start_page'] == 11
+        assert parts[0]['content'] == '# sub-1'
+        assert results[-1]['status'] == 'completed'
+        assert _variables(messages)['emitted_subtasks'] == 'sub-1,sub-0,sub-2'
+
+    def test_emitted_subtasks_are_skipped(self, mock_runtime, mock_session):
+        """Test that parts returned by an earlier call are not sent again"""
+        tool = GetParseResultStreamTool(runtime=mock_runtime, session=mock_session)
+
+        def get(url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            if task_id == 'parent':
+                return _response(_parent('completed', ['completed', 'completed']))
+            return _response({'success': True, 'status': 'completed', 'data': {'content': task_id}})
+
+        with patch('tools.utils.client.requests.Session.get', side_effect=get):
+            messages = list(tool._invoke({'task_id': 'parent', 'emitted_subtasks': 'sub-0'}))
+
+        parts = _json_messages(messages)[:-1]
+        assert [part['subtask_id'] for part in parts] == ['sub-1']
+
+    def test_stops_at_deadline_with_continuation(self, mock_runtime, mock_session):
+        """Test that an unfinished task returns what is done plus the continuation value"""
+        tool = GetParseResultStreamTool(runtime=mock_runtime, session=mock_session)
+
+        def get(url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            if task_id == 'parent':
+                return _response(_parent('processing', ['completed', 'processing']))
+            return _response({'success': True, 'status': 'completed', 'data': {'content': task_id}})
+
+        with patch('tools.utils.client.requests.Session.get', side_effect=get):
+            messages = list(tool._invoke({'task_id': 'parent', 'max_wait_time': 1}))
+
+        summary = _json_messages(messages)[-1]
+        assert summary['status'] == 'processing'
+        assert summary['emitted_subtasks'] == ['sub-0']
+        assert any('Call this tool again' in str(msg) for msg in messages)
+
+
+def test_unknown_task_is_reported_at_once(mock_session):
+    """A 404 for the task is final, not a failed poll to retry until the deadline"""
+    with FakeTianshuServer() as server:
+        runtime = Mock()
+        runtime.credentials = {'api_server_url': server.url, 'api_key': 'test-api-key'}
+        tool = GetParseResultStreamTool(runtime=runtime, session=mock_session)
+        messages = list(tool._invoke({'task_id': 'no-such-task', 'max_wait_time': 60}))
+
+    assert not any('will retry' in str(msg) for msg in messages)
+    assert any('Task not found' in str(msg) for msg in messages)
+    assert _json_messages(messages)[-1]['transient'] is False
@@ -0,0 +1,122 @@
+"""
+Tests for per-invocation metrics, the Prometheus export and trace propagation
+"""
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from endpoints.tianshu_metrics import TianshuMetricsEndpoint
+from tests.fake_server import FakeTianshuServer
+from tools.parse_document import ParseDocumentTool
+from tools.utils.client import close_all_clients, get_client
+from tools.utils.metrics import (
+    TRACE_HEADER, InvocationMetrics, current_metrics, get_metrics_registry, instrumented, measure,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    close_all_clients()
+    get_metrics_registry().clear()
+    yield
+    close_all_clients()
+    get_metrics_registry().clear()
+
+
+def _json_messages(messages):
+    return [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+
+
+class TestInvocationMetrics:
+    """Test cases for recording one invocation"""
+
+    def test_phases_follow_task_status(self):
+        metrics = InvocationMetrics('parse_document')
+        metrics.add_phase('upload', 10.0, 12.5)
+        metrics.start_phase('queued')
+        metrics.observe_status('pending')
+        metrics.observe_status('processing')
+        metrics.observe_status('completed')
+        metrics.record_polls(3)
+        metrics.record_transfer(sent=100, received=40)
+
+        snapshot = metrics.snapshot('completed')
+
+        assert list(snapshot['phases']) == ['upload', 'queued', 'processing']
+        assert snapshot['phases']['upload'] == 2.5
+        assert snapshot['polls'] == 3
+        assert snapshot['api_calls'] == 1
+        assert snapshot['bytes'] == {'downloaded': 0, 'sent': 100, 'received': 40}
+        assert metrics.traceparent == f"00-{metrics.trace_id}-{metrics.span_id}-01"
+
+    def test_measure_is_a_no_op_outside_an_invocation(self):
+        with measure('fetch'):
+            pass
+        assert current_metrics() is None
+
+    def test_instrumented_records_into_registry(self):
+        class Tool:
+            @instrumented('demo')
+            def _invoke(self, tool_parameters):
+                with measure('fetch'):
+                    current_metrics().record_polls()
+                yield current_metrics().snapshot('completed')
+
+        snapshot = list(Tool()._invoke({}))[0]
+        text = get_metrics_registry().prometheus_text()
+
+        assert current_metrics() is None
+        assert 'fetch' in snapshot['phases']
+        assert 'tianshu_invocation_seconds_count{outcome="completed",tool="demo"} 1' in text
+        assert 'tianshu_phase_seconds_bucket{phase="fetch",tool="demo",le="+Inf"} 1' in text
+        assert 'tianshu_polls_total{tool="demo"} 1' in text
+
+
+def test_api_calls_carry_trace_id():
+    response = Mock(status_code=200, headers={})
+    response.json.return_value = {'success': True}
+    metrics = InvocationMetrics('demo')
+
+    class Tool:
+        @instrumented('demo')
+        def _invoke(self, tool_parameters):
+            get_client('http://localhost:8000').get('/api/v1/tasks/t-1')
+            yield current_metrics()
+
+    with patch('tools.utils.client.requests.Session.get', return_value=response) as mock_get, \
+            patch('tools.utils.metrics.InvocationMetrics', return_value=metrics):
+        list(Tool()._invoke({}))
+
+    headers = mock_get.call_args.kwargs['headers']
+    assert headers[TRACE_HEADER] == metrics.trace_id
+    assert headers['traceparent'] == metrics.traceparent
+    assert metrics.api_calls == 1
+
+
+def test_parse_document_reports_metrics(mock_session):
+    with FakeTianshuServer(delay='0.3', markdown_bytes_per_page=100) as server:
+        runtime = Mock()
+        runtime.credentials = {'api_server_url': server.url, 'api_key': 'test-api-key'}
+        tool = ParseDocumentTool(runtime=runtime, session=mock_session)
+        messages = list(tool._invoke({
+            'file': SimpleNamespace(filename='notes.txt', url=None, blob=b'hello'),
+            'use_cache': False, 'max_wait_time': 30,
+        }))
+
+    metrics = _json_messages(messages)[-1]['metrics']
+    assert {'upload', 'fetch'} <= set(metrics['phases'])
+    assert metrics['polls'] >= 1
+    assert metrics['bytes']['sent'] > 0
+    assert metrics['bytes']['received'] > 0
+    assert 'tianshu_bytes_total{direction="sent",tool="parse_document"}' in get_metrics_registry().prometheus_text()
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    InvocationMetrics('demo').finish()
+
+    response = TianshuMetricsEndpoint(session=Mock())._invoke(Mock(), {}, {})
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert 'tianshu_invocation_seconds_count{outcome="incomplete",tool="demo"} 1' in response.get_data(as_text=True)
@@ -0,0 +1,85 @@
+"""
+Tests for push-based completion (registry and callback endpoint)
+"""
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+from werkzeug.test import EnvironBuilder
+from werkzeug import Request
+
+from endpoints.tianshu_callback import TianshuCallbackEndpoint
+from tools.utils.notify import CompletionRegistry, callback_fields, get_completion_registry, sign_payload
+
+
+def _request(payload, headers=None):
+    body = json.dumps(payload).encode()
+    return body, Request(EnvironBuilder(method='POST', data=body, headers=headers or {}).get_environ())
+
+
+class TestCompletionRegistry:
+    """Test cases for CompletionRegistry"""
+
+    def test_wait_times_out_without_callback(self):
+        registry = CompletionRegistry()
+
+        started = time.monotonic()
+        assert registry.wait('task-1', 0.05) is None
+        assert time.monotonic() - started >= 0.04
+
+    def test_callback_wakes_waiter(self):
+        registry = CompletionRegistry()
+        timer = threading.Timer(0.05, registry.notify, args=('task-1', {'status': 'completed'}))
+        timer.start()
+
+        started = time.monotonic()
+        payload = registry.wait('task-1', 5)
+
+        assert payload == {'status': 'completed'}
+        assert time.monotonic() - started < 5
+
+    def test_early_callback_is_kept_for_late_waiter(self):
+        registry = CompletionRegistry()
+        registry.notify('task-1', {'status': 'completed'})
+
+        assert registry.wait('task-1', 0) == {'status': 'completed'}
+        # Claimed notifications do not wake the next wait
+        assert registry.wait('task-1', 0) is None
+
+    def test_callback_fields(self):
+        assert callback_fields({}) == {}
+        assert callback_fields({'callback_url': ' https://dify/e/abc/tianshu/callback '}) == {
+            'callback_url': 'https://dify/e/abc/tianshu/callback'
+        }
+
+
+class TestTianshuCallbackEndpoint:
+    """Test cases for the callback endpoint"""
+
+    def test_callback_notifies_registry(self):
+        endpoint = TianshuCallbackEndpoint(session=Mock())
+        _, request = _request({'task_id': 'task-cb', 'status': 'completed'})
+
+        response = endpoint._invoke(request, {}, {})
+
+        assert response.status_code == 200
+        assert get_completion_registry().wait('task-cb', 0)['status'] == 'completed'
+
+    def test_signature_required_when_secret_set(self):
+        endpoint = TianshuCallbackEndpoint(session=Mock())
+        payload = {'task_id': 'task-signed', 'status': 'completed'}
+
+        _, unsigned = _request(payload)
+        assert endpoint._invoke(unsigned, {}, {'callback_secret': 's3cret'}).status_code == 401
+
+        body = json.dumps(payload).encode()
+        _, signed = _request(payload, {'X-Tianshu-Signature': sign_payload('s3cret', body)})
+        assert endpoint._invoke(signed, {}, {'callback_secret': 's3cret'}).status_code == 200
+        get_completion_registry().discard('task-signed')
+
+    def test_missing_task_id(self):
+        endpoint = TianshuCallbackEndpoint(session=Mock())
+        _, request = _request({'status': 'completed'})
+
+        assert endpoint._invoke(request, {}, {}).status_code == 400
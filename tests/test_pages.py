@@ -0,0 +1,61 @@
+"""
+Tests for page selection and local PDF trimming
+"""
+import io
+
+import pytest
+from pypdf import PdfReader
+
+from tests.test_pdf_split import make_pdf
+from tools.utils.pages import apply_page_selection, format_page_ranges, parse_page_selection, selected_pages
+from tools.utils.submit import build_submit_data
+from tools.utils.upload import spool_bytes
+
+
+def test_parse_page_selection():
+    ranges, max_pages = parse_page_selection({'page_ranges': '1-3, 8; 20-', 'max_pages': '10'})
+    assert ranges == [(1, 3), (8, 8), (20, None)]
+    assert max_pages == 10
+    assert format_page_ranges(ranges) == '1-3,8,20-'
+    assert parse_page_selection({}) == ([], 0)
+
+
+@pytest.mark.parametrize('page_ranges', ['0-2', '5-3', 'a-b', '1-2-3'])
+def test_invalid_page_ranges_rejected(page_ranges):
+    with pytest.raises(ValueError):
+        parse_page_selection({'page_ranges': page_ranges})
+
+
+def test_selected_pages_clip_dedupe_and_cap():
+    assert selected_pages([(4, None), (1, 2), (2, 3)], 0, 5) == [1, 2, 3, 4, 5]
+    assert selected_pages([(3, 100)], 2, 5) == [3, 4]
+    assert selected_pages([], 2, 5) == [1, 2]
+    assert selected_pages([(9, 9)], 0, 5) == []
+
+
+def test_pdf_is_trimmed_before_upload():
+    data = {}
+    upload, summary = apply_page_selection(spool_bytes(make_pdf(6)), [(2, 3)], 0, data)
+
+    pages = PdfReader(io.BytesIO(upload.read())).pages
+    assert [int(page.mediabox.width) for page in pages] == [101, 102]
+    assert summary == {'trimmed': True, 'page_count': 6, 'submitted_pages': 2}
+    # The server receives only the kept pages, so nothing is forwarded
+    assert data == {}
+
+
+def test_selection_forwarded_for_other_formats():
+    data = {}
+    upload, summary = apply_page_selection(spool_bytes(b'PK\x03\x04 docx'), [(1, 2)], 5, data)
+    assert data == {'page_ranges': '1-2', 'max_pages': '5'}
+    assert summary['trimmed'] is False
+
+
+def test_selection_outside_document_rejected():
+    with pytest.raises(ValueError, match='selects no pages'):
+        apply_page_selection(spool_bytes(make_pdf(2)), [(5, None)], 0, {})
+
+
+def test_text_only_disables_layout_models():
+    data = build_submit_data({'text_only': True, 'method': 'ocr', 'table_enable': True})
+    assert (data['method'], data['formula_enable'], data['table_enable']) == ('txt', 'false', 'false')
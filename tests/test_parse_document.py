@@ -2,8 +2,17 @@
 Tests for parse_document tool (synchronous)
 """
 import pytest
+import requests
 from unittest.mock import Mock, patch
+import hashlib
+
 from tools.parse_document import ParseDocumentTool
+from tools.utils.cache import get_result_cache
+from tools.utils.submit import build_submit_data, parse_options
+from tools.utils.client import close_all_clients
+from tools.utils.notify import get_completion_registry
+from tools.utils.timeline import get_timeline
+from tests.test_pdf_split import make_pdf
 
 
 class TestParseDocumentTool:
@@ -23,8 +32,8 @@ class TestParseDocumentTool:
             'max_wait_time': 300
         }
 
-        with patch('tools.parse_document.requests.post') as mock_post, \
-             patch('tools.parse_document.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
 
             # Mock submit response
             mock_submit_response = Mock()
@@ -97,8 +106,8 @@ class TestParseDocumentTool:
             'max_wait_time': 1  # 1 second timeout
         }
 
-        with patch('tools.parse_document.requests.post') as mock_post, \
-             patch('tools.parse_document.requests.get') as mock_get, \
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get, \
              patch('tools.parse_document.time.sleep'):
 
             # Mock submit response
@@ -134,8 +143,8 @@ class TestParseDocumentTool:
             'file': mock_file
         }
 
-        with patch('tools.parse_document.requests.post') as mock_post, \
-             patch('tools.parse_document.requests.get') as mock_get, \
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get, \
              patch('tools.parse_document.time.sleep'):
 
             # Mock submit response
@@ -174,8 +183,8 @@ class TestParseDocumentTool:
             # No other parameters - should use defaults
         }
 
-        with patch('tools.parse_document.requests.post') as mock_post, \
-             patch('tools.parse_document.requests.get') as mock_get:
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
 
             # Mock submit response
             mock_submit_response = Mock()
@@ -201,7 +210,7 @@ class TestParseDocumentTool:
             # Verify post was called with default values
             call_args = mock_post.call_args
             assert call_args is not None
-            data = call_args[1]['data']
+            data = call_args[1]['data'].fields
             assert data['backend'] == 'pipeline'
             assert data['lang'] == 'ch'
 
@@ -214,10 +223,362 @@ class TestParseDocumentTool:
             'file': mock_file
         }
 
-        with patch('tools.parse_document.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_post.side_effect = Exception("Network error: Connection refused")
 
             messages = list(tool._invoke(tool_parameters))
 
             # Should return error message
             assert any('Error' in str(msg) for msg in messages)
+
+    def test_cached_result_skips_resubmission(self, mock_runtime, mock_session, mock_file):
+        """Test that an identical document is served from the result cache"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        tool_parameters = {
+            'file': mock_file,
+            'backend': 'pipeline'
+        }
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
+
+            mock_submit_response = Mock()
+            mock_submit_response.json.return_value = {
+                'success': True,
+                'task_id': 'test-task-id-12345'
+            }
+            mock_post.return_value = mock_submit_response
+
+            mock_status_response = Mock()
+            mock_status_response.json.return_value = {
+                'success': True,
+                'status': 'completed',
+                'data': {'content': '# Cached Document'}
+            }
+            mock_get.return_value = mock_status_response
+
+            first = list(tool._invoke(tool_parameters))
+            second = list(tool._invoke(tool_parameters))
+
+            # Only the first invocation uploads and polls
+            assert mock_post.call_count == 1
+            assert mock_get.call_count == 1
+            assert any('Cached Document' in str(msg) for msg in first)
+            assert any('Returning cached result' in str(msg) for msg in second)
+            assert second[-1].message.json_object['cache']['hit'] is True
+
+            # A different option set is a cache miss
+            list(tool._invoke({**tool_parameters, 'lang': 'en'}))
+            assert mock_post.call_count == 2
+
+    def test_stale_cached_task_is_resubmitted(self, mock_runtime, mock_session, mock_file):
+        """Test that a cached document whose task the server no longer knows is submitted again"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        cache = get_result_cache()
+        data = build_submit_data({'backend': 'pipeline'}, 0)
+        stale_key = cache.document_key('http://localhost:8100', hashlib.sha256(mock_file.blob).hexdigest(), parse_options(data))
+        cache.put(stale_key, {'task_id': 'purged-task'})
+
+        gone = Mock(status_code=404, headers={})
+        gone.json.return_value = {'success': False, 'message': 'Task not found'}
+        gone.raise_for_status.side_effect = requests.exceptions.HTTPError('404 Not Found', response=gone)
+        completed = Mock(status_code=200, headers={})
+        completed.json.return_value = {'success': True, 'status': 'completed', 'data': {'content': '# Fresh'}}
+
+        def get(url, **kwargs):
+            return gone if 'purged-task' in url else completed
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get', side_effect=get):
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'fresh-task'}
+            messages = list(tool._invoke({'file': mock_file, 'backend': 'pipeline'}))
+
+        assert mock_post.call_count == 1
+        assert any('fresh-task' in str(msg) for msg in messages)
+        assert cache.get(stale_key) == {'task_id': 'fresh-task'}
+
+    def test_resume_token_continues_wait_without_resubmitting(self, mock_runtime, mock_session, mock_file):
+        """Test that a wait outliving the request budget can be resumed with a token"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get, \
+             patch('tools.parse_document.time.sleep'), \
+             patch('tools.parse_document.REQUEST_BUDGET', 0):
+
+            mock_submit_response = Mock()
+            mock_submit_response.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            mock_post.return_value = mock_submit_response
+
+            mock_status_response = Mock()
+            mock_status_response.json.return_value = {'success': True, 'status': 'processing'}
+            mock_get.return_value = mock_status_response
+
+            first = list(tool._invoke({'file': mock_file, 'max_wait_time': 600}))
+            paused = first[-2].message.json_object
+            assert paused['status'] == 'resumable'
+            assert paused['task_id'] == 'test-task-id-12345'
+            resume_token = paused['resume_token']
+
+            mock_status_response.json.return_value = {
+                'success': True,
+                'status': 'completed',
+                'data': {'content': '# Resumed Document'}
+            }
+            second = list(tool._invoke({'resume_token': resume_token}))
+
+            # The task is submitted once and polled across both invocations
+            assert mock_post.call_count == 1
+            assert mock_get.call_count == 2
+            assert any('Resumed Document' in str(msg) for msg in second)
+            assert second[-1].message.json_object['poll_stats']['polls'] == 2
+
+            # A finished wait consumes its token
+            third = list(tool._invoke({'resume_token': resume_token}))
+            assert any('Resume token not found' in str(msg) for msg in third)
+
+    def test_completion_callback_replaces_polling(self, mock_runtime, mock_session, mock_file):
+        """Test that a completion callback wakes the wait instead of sleeping between polls"""
+        mock_runtime.credentials['callback_url'] = 'https://dify.example/e/abc/tianshu/callback'
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get, \
+             patch('tools.parse_document.time.sleep') as mock_sleep:
+
+            mock_submit_response = Mock()
+            mock_submit_response.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            mock_post.return_value = mock_submit_response
+
+            processing = Mock()
+            processing.json.return_value = {'success': True, 'status': 'processing'}
+            completed = Mock()
+            completed.json.return_value = {
+                'success': True,
+                'status': 'completed',
+                'data': {'content': '# Pushed Document'}
+            }
+            mock_get.side_effect = [processing, completed]
+
+            # The server's callback lands while the tool is between polls
+            get_completion_registry().notify('test-task-id-12345', {'status': 'completed'})
+            messages = list(tool._invoke({'file': mock_file}))
+
+            assert mock_post.call_args[1]['data'].fields['callback_url'] == 'https://dify.example/e/abc/tianshu/callback'
+            assert mock_get.call_count == 2
+            mock_sleep.assert_not_called()
+            assert any('Pushed Document' in str(msg) for msg in messages)
+
+    @pytest.mark.parametrize('grace, backstop', [(60, False), (0, True)])
+    def test_callbacks_stretch_only_later_polls(self, mock_runtime, mock_session, mock_file, grace, backstop):
+        """Test that callbacks keep the early adaptive polls and only stretch polls after the grace window"""
+        mock_runtime.credentials['callback_url'] = 'https://dify.example/e/abc/tianshu/callback'
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get, \
+             patch('tools.parse_document.CALLBACK_GRACE', grace), \
+             patch.object(get_completion_registry(), 'wait', return_value=None) as wait:
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            processing = Mock()
+            processing.json.return_value = {'success': True, 'status': 'processing'}
+            completed = Mock()
+            completed.json.return_value = {'success': True, 'status': 'completed', 'data': {'content': 'Test'}}
+            mock_get.side_effect = [processing, completed]
+
+            list(tool._invoke({'file': mock_file, 'max_wait_time': 600}))
+
+        timeout = wait.call_args[0][1]
+        assert timeout >= 30 if backstop else timeout < 10
+
+    def test_priority_is_submitted(self, mock_runtime, mock_session, mock_file):
+        """Test that the priority parameter reaches the submit payload instead of a fixed 0"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            mock_get.return_value.json.return_value = {
+                'success': True, 'status': 'completed', 'data': {'content': 'Test'}
+            }
+
+            list(tool._invoke({'file': mock_file, 'priority': 8.0}))
+
+            assert mock_post.call_args[1]['data'].fields['priority'] == '8'
+
+    def test_empty_max_wait_time_follows_backend_history(self, mock_runtime, mock_session, mock_file):
+        """Test that without a max_wait_time the wait is sized from how long the backend's tasks took"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        for index in range(5):
+            get_timeline().record({
+                'success': True, 'status': 'completed', 'task_id': f"slow-{index}", 'backend': 'auto',
+                'created_at': 0.0, 'started_at': 100.0, 'completed_at': 600.0,
+            })
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch.object(ParseDocumentTool, '_wait_for_task', return_value=iter(())) as wait:
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            list(tool._invoke({'file': mock_file, 'max_wait_time': ''}))
+
+        assert wait.call_args[0][1]['max_wait_time'] == 900
+
+    def test_rejected_status_request_ends_the_wait(self, mock_runtime, mock_session, mock_file):
+        """Test that a 4xx status answer is reported at once instead of polled until the timeout"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        not_found = Mock(status_code=404, headers={})
+        not_found.json.return_value = {'success': False, 'message': 'Task not found'}
+        not_found.raise_for_status.side_effect = requests.exceptions.HTTPError('404 Not Found', response=not_found)
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get', return_value=not_found) as mock_get, \
+             patch('time.sleep'):
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            messages = list(tool._invoke({'file': mock_file, 'max_wait_time': 600}))
+
+        assert mock_get.call_count == 1
+        assert any('API error: Task not found' in str(msg) for msg in messages)
+        assert not any('will retry' in str(msg) for msg in messages)
+
+    def test_chunked_output(self, mock_runtime, mock_session, mock_file):
+        """Test that chunked mode emits the content once, in bounded chunks"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        content = 'y' * 1500
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
+
+            mock_submit_response = Mock()
+            mock_submit_response.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            mock_post.return_value = mock_submit_response
+
+            mock_status_response = Mock()
+            mock_status_response.json.return_value = {
+                'success': True,
+                'task_id': 'test-task-id-12345',
+                'status': 'completed',
+                'data': {'content': content}
+            }
+            mock_get.return_value = mock_status_response
+
+            messages = list(tool._invoke({'file': mock_file, 'output_mode': 'chunked', 'chunk_size': 1000}))
+
+        json_messages = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+        assert [chunk['length'] for chunk in json_messages[:-1]] == [1000, 500]
+        assert 'content' not in json_messages[-1]['data']
+        assert json_messages[-1]['chunk_count'] == 2
+
+    def test_client_side_split_streams_parts_in_page_order(self, mock_runtime, mock_session, mock_file):
+        """Test that split parts are submitted separately and merged in page order"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        mock_file.blob = make_pdf(5)
+        submitted = []
+
+        def post(url, **kwargs):
+            response = Mock()
+            if url.endswith('/batch'):
+                response.status_code = 404
+                return response
+            submitted.append(kwargs['data'].upload.size)
+            response.json.return_value = {'success': True, 'task_id': f'part-{len(submitted)}'}
+            return response
+
+        # The last part finishes first; earlier parts still come out first
+        rounds = {
+            'part-1': ['processing', 'completed'],
+            'part-2': ['processing', 'completed'],
+            'part-3': ['completed'],
+        }
+
+        def get(url, **kwargs):
+            task_id = url.rsplit('/', 1)[-1]
+            response = Mock()
+            response.json.return_value = {
+                'success': True, 'task_id': task_id, 'status': rounds[task_id].pop(0),
+                'data': {'content': f'# {task_id}'}
+            }
+            return response
+
+        close_all_clients()
+        with patch('tools.utils.client.requests.Session.post', side_effect=post), \
+             patch('tools.utils.client.requests.Session.get', side_effect=get), \
+             patch('tools.utils.task_group.time.sleep'):
+            messages = list(tool._invoke({'file': mock_file, 'split_pages': 2}))
+        close_all_clients()
+
+        json_messages = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+        assert len(submitted) == 3
+        assert [part['task_id'] for part in json_messages[:3]] == ['part-1', 'part-2', 'part-3']
+        assert [part['last_page'] for part in json_messages[:3]] == [2, 4, 5]
+        result = json_messages[-1]
+        assert result['status'] == 'completed'
+        assert result['data']['content'] == (
+            '<!-- page: 1 -->\n\n# part-1\n\n<!-- page: 3 -->\n\n# part-2\n\n<!-- page: 5 -->\n\n# part-3'
+        )
+        assert len(result['client_split']['parts']) == 3
+
+    def test_stream_parts_emits_finished_subtasks_before_merge(self, mock_runtime, mock_session, mock_file):
+        """Test that parts of a server-split document arrive before the merged result"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+
+        def parent(status, first_part):
+            return {
+                'success': True, 'task_id': 'test-task-id-12345', 'status': status, 'is_parent': True,
+                'subtask_progress': {'total': 2, 'completed': 1, 'percentage': 50.0},
+                'subtasks': [{'task_id': 'sub-0', 'status': first_part}, {'task_id': 'sub-1', 'status': 'processing'}],
+                'data': {'content': '# Merged'} if status == 'completed' else None,
+            }
+
+        rounds = [parent('processing', 'completed'), parent('processing', 'completed'), parent('completed', 'completed')]
+
+        def get(url, **kwargs):
+            response = Mock()
+            response.headers = {}
+            if url.endswith('/sub-0'):
+                response.json.return_value = {'success': True, 'status': 'completed', 'data': {'content': '# Part 0'}}
+            else:
+                response.json.return_value = rounds.pop(0)
+            return response
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get', side_effect=get), \
+             patch('tools.parse_document.time.sleep'):
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            messages = list(tool._invoke({'file': mock_file, 'stream_parts': True}))
+
+        json_messages = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+        assert [m.get('subtask_id') for m in json_messages] == ['sub-0', None]
+        assert json_messages[0]['content'] == '# Part 0'
+        assert json_messages[-1]['data']['content'] == '# Merged'
+
+    def test_wait_survives_server_outage_during_polling(self, mock_runtime, mock_session, mock_file):
+        """Test that failed status polls are retried instead of ending the wait"""
+        tool = ParseDocumentTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        completed = Mock()
+        completed.json.return_value = {'success': True, 'status': 'completed', 'data': {'content': '# Survived'}}
+        bad_gateway = Mock()
+        bad_gateway.status_code = 502
+        bad_gateway.raise_for_status.side_effect = requests.exceptions.HTTPError('502 Bad Gateway')
+        down = requests.exceptions.ConnectionError('connection reset')
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get', side_effect=[down, down, bad_gateway, completed]), \
+             patch('tools.utils.resilience.time.sleep'), \
+             patch('tools.parse_document.time.sleep'):
+            mock_post.return_value.json.return_value = {'success': True, 'task_id': 'test-task-id-12345'}
+            messages = list(tool._invoke({'file': mock_file}))
+
+        assert any('Status check failed, will retry' in str(msg) for msg in messages)
+        assert any('Survived' in str(msg) for msg in messages)
@@ -1,9 +1,15 @@
 """
 Tests for parse_document_async tool
 """
+import io
+import threading
+import time
 import pytest
+from pypdf import PdfReader
 from unittest.mock import Mock, patch, MagicMock
 from tools.parse_document_async import ParseDocumentAsyncTool
+from tools.utils.submit import get_submit_flight
+from tests.test_pdf_split import make_pdf
 
 
 class TestParseDocumentAsyncTool:
@@ -22,7 +28,7 @@ class TestParseDocumentAsyncTool:
             'priority': 5
         }
 
-        with patch('tools.parse_document_async.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_response = Mock()
             mock_response.json.return_value = mock_successful_submit_response
             mock_response.raise_for_status = Mock()
@@ -75,7 +81,7 @@ class TestParseDocumentAsyncTool:
             'file': mock_file
         }
 
-        with patch('tools.parse_document_async.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_response = Mock()
             mock_response.json.return_value = {
                 'success': True
@@ -98,7 +104,7 @@ class TestParseDocumentAsyncTool:
             'file': mock_file
         }
 
-        with patch('tools.parse_document_async.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_response = Mock()
             mock_response.json.return_value = {
                 'success': False,
@@ -122,7 +128,7 @@ class TestParseDocumentAsyncTool:
             'file': mock_file
         }
 
-        with patch('tools.parse_document_async.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_post.side_effect = Exception("Network error: Connection refused")
 
             messages = list(tool._invoke(tool_parameters))
@@ -140,7 +146,7 @@ class TestParseDocumentAsyncTool:
             # No other parameters - should use defaults
         }
 
-        with patch('tools.parse_document_async.requests.post') as mock_post:
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
             mock_response = Mock()
             mock_response.json.return_value = mock_successful_submit_response
             mock_response.raise_for_status = Mock()
@@ -151,7 +157,73 @@ class TestParseDocumentAsyncTool:
             # Verify post was called with default values
             call_args = mock_post.call_args
             assert call_args is not None
-            data = call_args[1]['data']
+            data = call_args[1]['data'].fields
             assert data['backend'] == 'pipeline'
             assert data['lang'] == 'ch'
             assert data['priority'] == '0'
+
+    def test_concurrent_identical_submissions_share_one_task(self, mock_runtime, mock_session):
+        """Test that identical documents submitted at once create a single task"""
+        release = threading.Event()
+
+        def post(url, **kwargs):
+            release.wait(5)
+            response = Mock()
+            response.json.return_value = {'success': True, 'task_id': 'shared-task'}
+            return response
+
+        def make_file():
+            file = Mock()
+            file.filename = 'same.pdf'
+            file.url = None
+            file.blob = b'identical content'
+            return file
+
+        outputs = []
+
+        def invoke():
+            tool = ParseDocumentAsyncTool(runtime=mock_runtime, session=mock_session)
+            outputs.append(list(tool._invoke({'file': make_file(), 'use_cache': False})))
+
+        with patch('tools.utils.client.requests.Session.post', side_effect=post) as mock_post:
+            threads = [threading.Thread(target=invoke) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            deadline = time.monotonic() + 5
+            while get_submit_flight().stats()['shared'] < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        assert mock_post.call_count == 1
+        task_ids = [
+            next(msg.message.variable_value for msg in output if getattr(msg.message, 'variable_name', None) == 'task_id')
+            for output in outputs
+        ]
+        assert task_ids == ['shared-task', 'shared-task']
+
+    def test_page_selection_trims_pdf_upload(self, mock_runtime, mock_session, mock_file):
+        """Test that only the selected pages of a PDF are uploaded"""
+        tool = ParseDocumentAsyncTool(runtime=mock_runtime, session=mock_session)
+        mock_file.url = None
+        mock_file.blob = make_pdf(10)
+
+        uploads = []
+
+        def post(url, **kwargs):
+            encoder = kwargs['data']
+            uploads.append((encoder.fields, encoder.upload.read()))
+            response = Mock()
+            response.json.return_value = {'success': True, 'task_id': 'trimmed-task'}
+            return response
+
+        with patch('tools.utils.client.requests.Session.post', side_effect=post):
+            messages = list(tool._invoke({'file': mock_file, 'page_ranges': '1-3', 'text_only': True}))
+
+        fields, body = uploads[0]
+        assert len(PdfReader(io.BytesIO(body)).pages) == 3
+        assert 'page_ranges' not in fields
+        assert fields['method'] == 'txt'
+        result = [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')][0]
+        assert result['page_selection']['submitted_pages'] == 3
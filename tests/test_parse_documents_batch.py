@@ -0,0 +1,111 @@
+"""
+Tests for parse_documents_batch tool
+"""
+import time
+import pytest
+from unittest.mock import Mock, patch
+from tools.parse_documents_batch import ParseDocumentsBatchTool
+
+
+def _file(name, content):
+    file = Mock()
+    file.filename = name
+    file.url = None
+    file.blob = content
+    return file
+
+
+def _submit_response(task_id):
+    response = Mock()
+    response.json.return_value = {'success': True, 'task_id': task_id}
+    return response
+
+
+class TestParseDocumentsBatchTool:
+    """Test cases for ParseDocumentsBatchTool"""
+
+    def test_submits_all_files(self, mock_runtime, mock_session):
+        """Test that every file gets a task_id in input order"""
+        tool = ParseDocumentsBatchTool(runtime=mock_runtime, session=mock_session)
+        files = [_file(f'doc{i}.pdf', f'content {i}'.encode()) for i in range(5)]
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post:
+            mock_post.side_effect = [_submit_response(f'task-{i}') for i in range(5)]
+
+            messages = list(tool._invoke({'files': files, 'max_concurrency': 3}))
+
+        manifest = next(msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object'))
+        assert manifest['total'] == 5
+        assert manifest['submitted'] == 5
+        assert sorted(manifest['task_ids']) == [f'task-{i}' for i in range(5)]
+        assert [entry['file_name'] for entry in manifest['tasks']] == [f'doc{i}.pdf' for i in range(5)]
+        assert all(entry['submit_latency_ms'] is not None for entry in manifest['tasks'])
+
+    def test_one_failure_does_not_stop_batch(self, mock_runtime, mock_session):
+        """Test that a failing file is reported while the others are submitted"""
+        tool = ParseDocumentsBatchTool(runtime=mock_runtime, session=mock_session)
+        files = [_file('good.pdf', b'good'), _file('bad.pdf', b'bad')]
+
+        def post(url, **kwargs):
+            body = b''.join(kwargs['data'])
+            if b'bad.pdf' in body:
+                response = Mock()
+                response.json.return_value = {'success': False, 'message': 'Unsupported file'}
+                return response
+            return _submit_response('task-good')
+
+        with patch('tools.utils.client.requests.Session.post', side_effect=post):
+            messages = list(tool._invoke({'files': files, 'max_concurrency': 2}))
+
+        manifest = next(msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object'))
+        assert manifest['submitted'] == 1
+        assert manifest['failed'] == 1
+        assert manifest['tasks'][0]['task_id'] == 'task-good'
+        assert 'Unsupported file' in manifest['tasks'][1]['error']
+
+    def test_missing_files(self, mock_runtime, mock_session):
+        """Test error when no files are provided"""
+        tool = ParseDocumentsBatchTool(runtime=mock_runtime, session=mock_session)
+
+        messages = list(tool._invoke({}))
+
+        assert any('No files provided' in str(msg) for msg in messages)
+
+    @pytest.mark.parametrize('value', [0, 17, 'many'])
+    def test_invalid_concurrency(self, mock_runtime, mock_session, mock_file, value):
+        """Test validation of max_concurrency"""
+        tool = ParseDocumentsBatchTool(runtime=mock_runtime, session=mock_session)
+
+        messages = list(tool._invoke({'files': [mock_file], 'max_concurrency': value}))
+
+        assert any('max_concurrency' in str(msg) for msg in messages)
+
+    def test_files_left_after_request_budget_are_resumable(self, mock_runtime, mock_session):
+        """Test that files not started within the request budget are submitted by a resumed call"""
+        tool = ParseDocumentsBatchTool(runtime=mock_runtime, session=mock_session)
+        files = [_file(f'doc{i}.pdf', f'content {i}'.encode()) for i in range(3)]
+        posted = []
+
+        def post(url, **kwargs):
+            posted.append(url)
+            time.sleep(0.3)
+            return _submit_response(f'task-{len(posted)}')
+
+        with patch('tools.utils.client.requests.Session.post', side_effect=post), \
+             patch('tools.parse_documents_batch.REQUEST_BUDGET', 0.2):
+            messages = list(tool._invoke({'files': files, 'max_concurrency': 1, 'use_cache': False}))
+
+        first = next(msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object'))
+        assert (first['submitted'], first['pending']) == (1, 2)
+        assert first['resume_token']
+
+        with patch('tools.utils.client.requests.Session.post', side_effect=post):
+            messages = list(tool._invoke({
+                'files': files, 'max_concurrency': 1, 'use_cache': False, 'resume_token': first['resume_token'],
+            }))
+
+        second = next(msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object'))
+        assert len(posted) == 3
+        assert (second['submitted'], second['pending']) == (3, 0)
+        assert [entry['index'] for entry in second['tasks']] == [0, 1, 2]
+        assert 'resume_token' not in second
@@ -0,0 +1,64 @@
+"""
+Tests for client-side PDF splitting
+"""
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from tools.utils.chunker import chunk_markdown
+from tools.utils.pdf_split import (
+    PdfSplitError, is_pdf, open_pdf, parse_split_pages, part_file_name, plan_parts, stitch_parts, write_part,
+)
+from tools.utils.upload import spool_bytes
+
+
+def make_pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for index in range(pages):
+        # Distinct page sizes let the tests tell pages apart
+        writer.add_blank_page(width=100 + index, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_plan_parts_covers_every_page_in_order():
+    parts = plan_parts(7, 3)
+    assert [(p['first_page'], p['last_page']) for p in parts] == [(1, 3), (4, 6), (7, 7)]
+    assert [p['part_index'] for p in parts] == [0, 1, 2]
+
+
+def test_write_part_extracts_page_range():
+    reader = open_pdf(spool_bytes(make_pdf(5)))
+    with write_part(reader, 2, 4) as part:
+        pages = PdfReader(io.BytesIO(part.read())).pages
+        assert [int(page.mediabox.width) for page in pages] == [101, 102, 103]
+
+
+def test_open_pdf_rejects_broken_files():
+    upload = spool_bytes(b'%PDF-1.7 truncated')
+    assert is_pdf(upload)
+    with pytest.raises(PdfSplitError):
+        open_pdf(upload)
+    assert not is_pdf(spool_bytes(b'PK\x03\x04 docx'))
+
+
+def test_stitch_parts_anchors_pages_and_marks_gaps():
+    parts = plan_parts(4, 2)
+    parts[0].update(status='completed', content='# Intro\n\nText\n')
+    parts[1].update(status='failed', error_message='GPU out of memory')
+    document = stitch_parts(parts)
+
+    assert document.startswith('<!-- page: 1 -->\n\n# Intro')
+    assert '<!-- page: 3 -->\n\n<!-- pages 3-4 missing: GPU out of memory -->' in document
+    # The anchors feed the chunker's page references
+    assert chunk_markdown(document)[0]['pages'] == [1, 3]
+
+
+def test_parse_split_pages_and_part_names():
+    assert parse_split_pages({}) == 0
+    assert parse_split_pages({'split_pages': '50'}) == 50
+    with pytest.raises(ValueError):
+        parse_split_pages({'split_pages': 501})
+    assert part_file_name('report.pdf', 51, 100) == 'report.pages-51-100.pdf'
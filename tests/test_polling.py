@@ -0,0 +1,116 @@
+"""
+Tests for the poll schedulers
+"""
+from unittest.mock import Mock, patch
+
+import pytest
+
+from tools.utils.polling import (
+    AdaptivePollScheduler,
+    FixedPollScheduler,
+    create_scheduler,
+    parse_retry_after,
+)
+
+
+def _response(headers=None):
+    response = Mock()
+    response.headers = headers or {}
+    return response
+
+
+class TestAdaptivePollScheduler:
+    """Test cases for AdaptivePollScheduler"""
+
+    def test_backoff_grows_to_cap(self):
+        """Delays start small and grow exponentially up to max_delay"""
+        scheduler = AdaptivePollScheduler(initial_delay=0.5, multiplier=2, max_delay=4, jitter=0)
+        status = {'status': 'processing'}
+
+        delays = [scheduler.next_delay(status) for _ in range(6)]
+
+        assert delays == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+    def test_jitter_stays_within_bounds(self):
+        """Jitter perturbs the delay by at most the configured fraction"""
+        scheduler = AdaptivePollScheduler(initial_delay=1, multiplier=1, jitter=0.2)
+
+        for _ in range(50):
+            assert 0.8 <= scheduler.next_delay({'status': 'pending'}) <= 1.2
+
+    def test_retry_after_is_a_floor(self):
+        """Retry-After overrides shorter delays, even above the cap"""
+        scheduler = AdaptivePollScheduler(max_delay=10, jitter=0)
+
+        delay = scheduler.next_delay({'status': 'pending'}, _response({'Retry-After': '30'}))
+
+        assert delay == 30
+        assert scheduler.stats.hints == {'retry_after': 1}
+
+    def test_server_eta_is_used(self):
+        """An ETA in the status payload sets the next poll time"""
+        scheduler = AdaptivePollScheduler(jitter=0)
+
+        assert scheduler.next_delay({'status': 'processing', 'eta_seconds': 3}) == 3
+
+    def test_queue_position_stretches_delay(self):
+        """Pending tasks deep in the queue are polled less often"""
+        scheduler = AdaptivePollScheduler(jitter=0, seconds_per_queue_position=2, max_delay=15)
+
+        assert scheduler.next_delay({'status': 'pending', 'queue_position': 5}) == 10
+
+    def test_progress_estimate_shortens_delay(self):
+        """Fast-moving progress leads to an early poll near completion"""
+        scheduler = AdaptivePollScheduler(initial_delay=8, multiplier=1, jitter=0, min_delay=0.25)
+
+        with patch('tools.utils.polling.time.monotonic', side_effect=[100.0, 110.0]):
+            first = scheduler.next_delay({'status': 'processing', 'subtask_progress': {'percentage': 50}})
+            second = scheduler.next_delay({'status': 'processing', 'subtask_progress': {'percentage': 90}})
+
+        assert first == 8
+        # 40% in 10s leaves ~2.5s for the remaining 10%
+        assert second == pytest.approx(2.5)
+
+    def test_expected_completion_stretches_delay(self):
+        """Without server hints, polls aim at half the time left before the expected finish"""
+        scheduler = AdaptivePollScheduler(initial_delay=0.5, jitter=0, max_delay=15)
+        scheduler.expect_completion(1020.0)
+
+        with patch('tools.utils.polling.time.time', return_value=1000.0):
+            assert scheduler.next_delay({'status': 'processing'}) == 10
+        with patch('tools.utils.polling.time.time', return_value=1030.0):
+            # Overdue: back to plain backoff
+            assert scheduler.next_delay({'status': 'processing'}) == 0.8
+        assert scheduler.stats.hints == {'history': 1, 'backoff': 1}
+
+
+class TestPollStats:
+    """Test cases for per-task poll statistics"""
+
+    def test_stats_count_polls_and_wait(self):
+        scheduler = FixedPollScheduler(interval=5)
+        for _ in range(3):
+            scheduler.record_poll()
+            scheduler.next_delay({'status': 'processing'})
+
+        assert scheduler.stats.to_dict() == {
+            'polls': 3,
+            'total_wait_seconds': 15.0,
+            'delay_sources': {'fixed': 3},
+        }
+
+
+class TestHelpers:
+    """Test cases for module helpers"""
+
+    def test_create_scheduler_by_name(self):
+        assert isinstance(create_scheduler('fixed'), FixedPollScheduler)
+        assert isinstance(create_scheduler(None), AdaptivePollScheduler)
+        assert isinstance(create_scheduler('unknown'), AdaptivePollScheduler)
+
+    def test_parse_retry_after_http_date(self):
+        response = _response({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+        assert parse_retry_after(response) == 0.0
+        assert parse_retry_after(_response({'Retry-After': 'soon'})) is None
+        assert parse_retry_after(None) is None
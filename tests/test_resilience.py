@@ -0,0 +1,163 @@
+"""
+Tests for retries, the circuit breaker and hedged requests
+"""
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from tools.utils import resilience
+from tools.utils.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, get_resilience
+
+
+def _response(status_code=200, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep():
+    with patch('tools.utils.resilience.time.sleep') as mock_sleep:
+        yield mock_sleep
+
+
+def test_idempotent_call_retried_on_gateway_error():
+    caller = ResilientCaller('http://tianshu')
+    send = Mock(side_effect=[_response(502), _response(504), _response(200)])
+
+    assert caller.call(send, idempotent=True).status_code == 200
+    assert send.call_count == 3
+    assert caller.snapshot()['retries'] == 2
+
+
+def test_non_idempotent_call_resent_only_when_not_processed():
+    caller = ResilientCaller('http://tianshu')
+    rewind = Mock()
+
+    # 502: the submit may have reached the server, so it is not resent
+    send = Mock(return_value=_response(502))
+    assert caller.call(send, idempotent=False, rewind=rewind).status_code == 502
+    assert send.call_count == 1
+
+    # 503: explicitly not processed, so the rewound body is sent again
+    send = Mock(side_effect=[_response(503), _response(200)])
+    assert caller.call(send, idempotent=False, rewind=rewind).status_code == 200
+    rewind.assert_called_once()
+
+
+def test_non_idempotent_call_resent_only_if_never_sent():
+    caller = ResilientCaller('http://tianshu')
+
+    send = Mock(side_effect=requests.exceptions.ReadTimeout('read timed out'))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        caller.call(send, idempotent=False)
+    assert send.call_count == 1
+
+    refused = requests.exceptions.ConnectionError(Mock(reason=NewConnectionError(None, 'refused')))
+    send = Mock(side_effect=[refused, _response(200)])
+    assert caller.call(send, idempotent=False).status_code == 200
+
+
+def test_long_retry_after_is_not_slept_through(no_backoff_sleep):
+    caller = ResilientCaller('http://tianshu')
+    send = Mock(return_value=_response(429, {'Retry-After': '120'}))
+
+    assert caller.call(send, idempotent=True).status_code == 429
+    assert send.call_count == 1
+    no_backoff_sleep.assert_not_called()
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+    caller = ResilientCaller('http://tianshu', breaker)
+    down = Mock(side_effect=requests.exceptions.ConnectionError('down'))
+
+    # Each failed call counts once, however many attempts it made
+    with pytest.raises(requests.exceptions.ConnectionError):
+        caller.call(down, idempotent=True)
+    assert breaker.state == 'closed'
+    with pytest.raises(requests.exceptions.ConnectionError):
+        caller.call(down, idempotent=True)
+    assert breaker.state == 'open'
+    assert down.call_count == 2 * resilience.RETRY_ATTEMPTS
+
+    # Open: nothing is sent
+    send = Mock(return_value=_response(200))
+    with pytest.raises(CircuitOpenError):
+        caller.call(send, idempotent=True)
+    send.assert_not_called()
+
+    # After the reset timeout one probe goes through and closes the breaker
+    breaker.opened_at -= 31
+    assert caller.call(send, idempotent=True).status_code == 200
+    assert breaker.snapshot()['state'] == 'closed'
+    assert breaker.snapshot()['times_opened'] == 1
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_slow_get_is_hedged(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_DELAY', 0.05)
+    caller = ResilientCaller('http://tianshu')
+    release = threading.Event()
+    slow, fast = _response(200), _response(200)
+    responses = iter([slow, fast])
+
+    def send():
+        response = next(responses)
+        if response is slow:
+            release.wait(5)
+        return response
+
+    assert caller.call(send, idempotent=True, hedge=True) is fast
+    release.set()
+    assert caller.snapshot()['hedged'] == 1
+    assert caller.snapshot()['hedge_wins'] == 1
+
+
+def test_state_shared_per_server():
+    assert get_resilience('http://tianshu/') is get_resilience('http://tianshu')
+    assert get_resilience('http://tianshu') is not get_resilience('http://other')
+
+
+def test_failed_attempts_count_once_per_call():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+    caller = ResilientCaller('http://tianshu', breaker)
+
+    # Two gateway errors and then a success: the call succeeded
+    caller.call(Mock(side_effect=[_response(502), _response(502), _response(200)]), idempotent=True)
+    assert breaker.snapshot()['consecutive_failures'] == 0
+
+    caller.call(Mock(return_value=_response(503)), idempotent=True)
+    assert breaker.snapshot()['consecutive_failures'] == 1
+    assert breaker.state == 'closed'
+
+
+def test_unexpected_error_releases_half_open_probe():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    caller = ResilientCaller('http://tianshu', breaker)
+    breaker.record_failure()
+
+    # Not a transport error, so no verdict on the server; the probe is given back
+    with pytest.raises(OSError):
+        caller.call(Mock(side_effect=OSError('spool read failed')), idempotent=False)
+    assert breaker.state == 'half_open'
+
+    rewind = Mock(side_effect=ValueError('cannot rewind'))
+    send = Mock(side_effect=[_response(503), _response(200)])
+    with pytest.raises(ValueError):
+        caller.call(send, idempotent=False, rewind=rewind)
+
+    assert caller.call(Mock(return_value=_response(200)), idempotent=True).status_code == 200
+    assert breaker.state == 'closed'
@@ -0,0 +1,76 @@
+"""
+Tests for resumable wait-state storage
+"""
+import time
+from unittest.mock import Mock
+from tools.utils import resume
+from tools.utils.polling import AdaptivePollScheduler
+from tools.utils.resume import WaitStateStore
+
+
+class FakeStorage:
+    """In-memory stand-in for the plugin's persistent storage"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, val):
+        self.data[key] = val
+
+    def get(self, key):
+        return self.data[key]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def _state(**overrides):
+    return {'task_id': 'task-1', 'started_at': time.time(), 'deadline': time.time() + 600, **overrides}
+
+
+def test_state_survives_process_restart():
+    """Test that a record is read back from storage once process memory is gone"""
+    session = Mock()
+    session.storage = FakeStorage()
+    token = WaitStateStore(session).save(_state())
+
+    resume._memory.clear()
+
+    state = WaitStateStore(session).load(token)
+    assert state['task_id'] == 'task-1'
+
+
+def test_works_without_storage_permission():
+    """Test that a failing storage backend falls back to process memory"""
+    session = Mock()
+    session.storage.set.side_effect = RuntimeError('storage disabled')
+    session.storage.get.side_effect = RuntimeError('storage disabled')
+    store = WaitStateStore(session)
+
+    token = store.save(_state())
+
+    assert store.load(token)['task_id'] == 'task-1'
+    store.delete(token)
+    assert store.load(token) is None
+
+
+def test_expired_state_is_dropped():
+    """Test that a record past its deadline cannot be resumed"""
+    store = WaitStateStore(None)
+    token = store.save(_state(deadline=time.time() - 1))
+
+    assert store.load(token) is None
+
+
+def test_scheduler_snapshot_round_trip():
+    """Test that backoff position and counters carry over to a resumed wait"""
+    scheduler = AdaptivePollScheduler(jitter=0)
+    for _ in range(3):
+        scheduler.record_poll()
+        scheduler.next_delay({'status': 'processing'})
+
+    restored = AdaptivePollScheduler(jitter=0)
+    restored.restore(scheduler.snapshot())
+
+    assert restored.stats.polls == 3
+    assert restored.next_delay({'status': 'processing'}) == scheduler.next_delay({'status': 'processing'})
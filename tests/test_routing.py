@@ -0,0 +1,94 @@
+"""
+Tests for routing tasks across several Tianshu servers
+"""
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from tools.get_parse_result import GetParseResultTool
+from tools.utils.routing import ServerPool, get_server_pool, parse_servers, pin_task, pinned_server
+
+
+def _response(status_code=200, payload=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = {}
+    response.json.return_value = payload if payload is not None else {}
+    response.raise_for_status = Mock()
+    return response
+
+
+def test_parse_servers():
+    assert parse_servers('http://a:8100/|3, http://b:8100\nhttp://c:8100') == [
+        ('http://a:8100', 3), ('http://b:8100', 1), ('http://c:8100', 1)
+    ]
+    for value in ('', 'a:8100', 'http://a|0', 'http://a|x'):
+        with pytest.raises(ValueError):
+            parse_servers(value)
+
+
+def test_single_server_needs_no_probes():
+    pool = ServerPool(parse_servers('http://a:8100'))
+    with patch('tools.utils.client.requests.Session.get') as mock_get:
+        assert pool.choose().api_server_url == 'http://a:8100'
+        assert pool.client_for_task('task-1').api_server_url == 'http://a:8100'
+    mock_get.assert_not_called()
+
+
+def test_weighted_policy_follows_weights():
+    pool = ServerPool(parse_servers('http://a|3, http://b|1'), policy='weighted')
+    chosen = [pool.choose().api_server_url for _ in range(8)]
+    assert chosen.count('http://a') == 6
+    assert chosen.count('http://b') == 2
+
+
+def test_round_robin_skips_server_with_open_breaker():
+    pool = ServerPool(parse_servers('http://a, http://b, http://c'), policy='round_robin')
+    breaker = pool.client_for('http://b').resilience.breaker
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+
+    assert {pool.choose().api_server_url for _ in range(4)} == {'http://a', 'http://c'}
+
+
+def test_least_queue_routes_to_shortest_queue_and_ejects_failures():
+    pool = ServerPool(parse_servers('http://a, http://b, http://c'))
+    depths = {
+        'http://a/api/v1/queue/stats': _response(payload={'stats': {'pending': 5, 'processing': 2}}),
+        'http://b/api/v1/queue/stats': _response(payload={'stats': {'pending': 0, 'processing': 1}}),
+        'http://c/api/v1/queue/stats': _response(500),
+    }
+    depths['http://c/api/v1/queue/stats'].raise_for_status.side_effect = requests.HTTPError('down')
+
+    with patch('tools.utils.client.requests.Session.get', side_effect=lambda url, **kw: depths[url]):
+        assert pool.choose().api_server_url == 'http://b'
+
+    snapshot = {server['api_server_url']: server for server in pool.snapshot()}
+    assert snapshot['http://a']['queue_depth'] == 7
+    assert snapshot['http://c']['available'] is False
+
+
+def test_unpinned_task_is_located_and_pinned():
+    pool = ServerPool(parse_servers('http://a, http://b'))
+    responses = {
+        'http://a/api/v1/tasks/task-9': _response(404),
+        'http://b/api/v1/tasks/task-9': _response(payload={'success': True, 'status': 'pending'}),
+    }
+    with patch('tools.utils.client.requests.Session.get', side_effect=lambda url, **kw: responses[url]):
+        assert pool.client_for_task('task-9').api_server_url == 'http://b'
+    assert pinned_server('task-9') == 'http://b'
+
+
+def test_get_parse_result_uses_pinned_server(mock_session, mock_completed_task_response):
+    runtime = Mock()
+    runtime.credentials = {'api_server_url': 'http://a:8100, http://b:8100', 'api_key': 'key'}
+    pin_task('test-task-id-12345', 'http://b:8100')
+    tool = GetParseResultTool(runtime=runtime, session=mock_session)
+
+    with patch('tools.utils.client.requests.Session.get',
+               return_value=_response(payload=mock_completed_task_response)) as mock_get:
+        list(tool._invoke({'task_id': 'test-task-id-12345', 'use_cache': False}))
+
+    assert mock_get.call_args.args[0] == 'http://b:8100/api/v1/tasks/test-task-id-12345'
+    assert get_server_pool(runtime.credentials).urls == ['http://a:8100', 'http://b:8100']
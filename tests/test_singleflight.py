@@ -0,0 +1,74 @@
+"""
+Tests for in-flight request coalescing
+"""
+import threading
+import time
+
+import pytest
+
+from tools.utils.singleflight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, count, not_before=None):
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn, not_before=not_before)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'task-1'
+
+    threads, results = _run_concurrently(flight, 'doc', work, 4)
+    deadline = time.monotonic() + 5
+    while flight.stats()['shared'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [('task-1', False)] + [('task-1', True)] * 3
+
+
+def test_errors_are_shared_but_not_retained():
+    flight = SingleFlight(retain=30)
+
+    def fail():
+        raise RuntimeError('upload failed')
+
+    with pytest.raises(RuntimeError):
+        flight.do('doc', fail, not_before=0)
+    # The failed call is not handed to the next caller
+    assert flight.do('doc', lambda: 'ok', not_before=0) == ('ok', False)
+
+
+def test_finished_calls_only_reused_when_fresh_enough():
+    flight = SingleFlight(retain=30)
+    flight.do('status', lambda: 'processing')
+
+    before = time.monotonic() - 10
+    assert flight.do('status', lambda: 'completed', not_before=before) == ('processing', True)
+    assert flight.do('status', lambda: 'completed', not_before=time.monotonic()) == ('completed', False)
+
+
+def test_without_retain_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    flight.do('doc', lambda: 'task-1')
+
+    assert flight.do('doc', lambda: 'task-2') == ('task-2', False)
@@ -0,0 +1,109 @@
+"""
+Tests for server-side task timelines and completion estimates
+"""
+from unittest.mock import Mock, patch
+
+import pytest
+
+from tools.get_parse_result import GetParseResultTool
+from tools.utils.metrics import get_metrics_registry
+from tools.utils.timeline import (
+    TimelineStore, completion_estimate, get_timeline, parse_timestamp, percentile, task_durations,
+)
+
+
+def _completed(task_id, queue_wait, processing, backend='pipeline'):
+    return {
+        'success': True, 'status': 'completed', 'task_id': task_id, 'backend': backend,
+        'created_at': 1000.0, 'started_at': 1000.0 + queue_wait,
+        'completed_at': 1000.0 + queue_wait + processing,
+    }
+
+
+def _json_messages(messages):
+    return [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+
+
+def test_task_durations(mock_completed_task_response, mock_processing_task_response):
+    assert parse_timestamp('2024-01-01T00:00:10Z') - parse_timestamp('2024-01-01T00:00:00+00:00') == 10
+    assert parse_timestamp('not a date') is None
+    assert task_durations(mock_completed_task_response) == (10, 50)
+    assert task_durations(mock_processing_task_response) is None
+    assert task_durations({**mock_completed_task_response, 'started_at': '2023-12-31T00:00:00Z'}) is None
+
+
+class TestTimelineStore:
+    """Test cases for the rolling per-backend store"""
+
+    def test_records_each_task_once(self):
+        store = TimelineStore(max_samples=3, min_samples=1)
+        store.record(_completed('t-1', 1, 10))
+        store.record(_completed('t-1', 1, 10))
+        store.record({**_completed('t-2', 1, 10), 'is_parent': True})
+        store.record({**_completed('t-3', 1, 10), 'status': 'failed'})
+
+        assert store.summary()['pipeline']['samples'] == 1
+
+    def test_window_keeps_latest_samples(self):
+        store = TimelineStore(max_samples=3, min_samples=1)
+        for index, processing in enumerate([100, 1, 2, 3]):
+            store.record(_completed(f"t-{index}", 0, processing))
+
+        assert store.summary()['pipeline']['processing_seconds'] == {'p50': 2, 'p90': 3, 'p99': 3, 'mean': 2}
+
+    def test_estimates_per_backend(self):
+        store = TimelineStore(min_samples=3)
+        for index in range(5):
+            store.record(_completed(f"p-{index}", 5, 10 + index))
+        store.record(_completed('v-0', 60, 600, backend='video'))
+
+        assert store.estimate('pipeline') == 17
+        assert store.estimate('pipeline', 0.99) == 19
+        assert store.estimate('video') is None
+        # 'auto' pools every backend
+        assert store.estimate('auto', 0.99) == 660
+        assert store.suggested_wait('pipeline', 300) == 300
+        assert store.suggested_wait('auto', 300) == 990
+        assert store.suggested_wait('auto', 3000) == 3000
+
+    def test_durations_exported_as_histograms(self):
+        get_metrics_registry().clear()
+        TimelineStore().record(_completed('t-1', 2, 30, backend='sensevoice'))
+
+        text = get_metrics_registry().prometheus_text()
+        get_metrics_registry().clear()
+
+        assert 'tianshu_task_queue_seconds_count{backend="sensevoice"} 1' in text
+        assert 'tianshu_task_processing_seconds_sum{backend="sensevoice"} 30' in text
+
+
+def test_percentile_nearest_rank():
+    assert percentile([5, 1, 3, 2, 4], 0.5) == 3
+    assert percentile([5, 1, 3, 2, 4], 0.99) == 5
+    assert percentile([7], 0.9) == 7
+
+
+def test_get_parse_result_reports_timeline_and_estimate(
+    mock_runtime, mock_session, mock_completed_task_response, mock_pending_task_response
+):
+    for index in range(4):
+        get_timeline().record(_completed(f"earlier-{index}", 10, 50))
+    tool = GetParseResultTool(runtime=mock_runtime, session=mock_session)
+
+    with patch('tools.utils.client.requests.Session.get') as mock_get:
+        mock_get.return_value = Mock(status_code=200, headers={})
+        mock_get.return_value.json.return_value = mock_completed_task_response
+        completed = _json_messages(tool._invoke({'task_id': 'test-task-id-12345', 'use_cache': False}))[-1]
+
+        mock_get.return_value.json.return_value = {**mock_pending_task_response, 'task_id': 'next-task'}
+        pending = _json_messages(tool._invoke({'task_id': 'next-task', 'use_cache': False}))[-1]
+
+    assert completed['timeline']['queue_wait_seconds'] == 10
+    assert completed['timeline']['processing_seconds'] == 50
+    assert completed['timeline']['backend_summary']['samples'] == 5
+    assert pending['estimate']['estimated_seconds'] == 60
+    assert pending['estimate']['estimated_completion_at'] == parse_timestamp('2024-01-01T00:01:00Z')
+
+
+def test_no_estimate_without_history():
+    assert completion_estimate('pipeline', 1000.0) is None
@@ -0,0 +1,203 @@
+"""
+Tests for the streaming spool and multipart encoder
+"""
+import hashlib
+from email.parser import BytesParser
+from email.policy import HTTP
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+from tools.utils.client import TianshuClient
+from tools.utils.metrics import current_metrics, instrumented
+from tools.utils.upload import (
+    DOWNLOAD_CONNECT_TIMEOUT, MultipartEncoder, SpooledUpload, acquire_file, spool_bytes, spool_response,
+)
+
+
+def _parse_multipart(content_type: str, body: bytes) -> dict:
+    """Parse a multipart body with the stdlib email parser"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    parts = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        parts[name] = (part.get_filename(), part.get_payload(decode=True))
+    return parts
+
+
+class TestSpooledUpload:
+    """Test cases for SpooledUpload"""
+
+    def test_small_upload_stays_in_memory(self):
+        """Content below the threshold is not written to disk"""
+        with spool_bytes(b'hello') as upload:
+            assert upload.size == 5
+            assert upload.sha256 == hashlib.sha256(b'hello').hexdigest()
+            assert not upload.on_disk
+
+    def test_large_upload_rolls_over_to_disk(self):
+        """Content above the threshold is spooled to a temporary file"""
+        with SpooledUpload(max_memory=1024) as upload:
+            upload.write(b'x' * 4096)
+            assert upload.on_disk
+            assert b''.join(upload.iter_chunks(1000)) == b'x' * 4096
+
+    def test_spool_response_reads_in_chunks(self):
+        """Streaming responses are drained chunk by chunk"""
+        response = Mock()
+        response.iter_content.return_value = iter([b'abc', b'', b'def'])
+
+        with spool_response(response, chunk_size=3) as upload:
+            response.iter_content.assert_called_once_with(chunk_size=3)
+            assert upload.read() == b'abcdef'
+
+
+class TestMultipartEncoder:
+    """Test cases for MultipartEncoder"""
+
+    def test_body_is_valid_multipart(self):
+        """Fields and file part round-trip through a multipart parser"""
+        content = bytes(range(256)) * 100
+        with spool_bytes(content) as upload:
+            encoder = MultipartEncoder({'backend': 'pipeline', 'lang': 'ch'}, 'file', 'doc.pdf', upload)
+            body = b''.join(iter(lambda: encoder.read(777), b''))
+
+        assert len(body) == len(encoder)
+        parts = _parse_multipart(encoder.content_type, body)
+        assert parts['backend'] == (None, b'pipeline')
+        assert parts['lang'] == (None, b'ch')
+        assert parts['file'] == ('doc.pdf', content)
+
+    def test_rewind_allows_resending(self):
+        """The body can be read again after rewind"""
+        with spool_bytes(b'payload') as upload:
+            encoder = MultipartEncoder({}, 'file', 'a.txt', upload)
+            first = encoder.read()
+            encoder.rewind()
+            second = b''.join(encoder)
+
+        assert first == second
+
+
+class _BlobFile:
+    """A Dify file whose blob is fetched (and counted) on access, like the SDK's File"""
+
+    def __init__(self, url, content, materialized=False):
+        self.url = url
+        self._blob = content if materialized else None
+        self._content = content
+        self.fetches = 0
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self.fetches += 1
+            self._blob = self._content
+        return self._blob
+
+
+def _download_response(content):
+    response = Mock()
+    response.__enter__ = Mock(return_value=response)
+    response.__exit__ = Mock(return_value=False)
+    response.iter_content.return_value = [content]
+    return response
+
+
+class TestAcquireFile:
+    """Test cases for choosing how to obtain a Dify file"""
+
+    def test_materialized_bytes_skip_the_download(self):
+        client = TianshuClient('http://localhost:8000')
+        file = _BlobFile('http://dify/files/a.pdf', b'held', materialized=True)
+
+        with patch.object(client.session, 'get') as mock_get:
+            upload, report = acquire_file(client, file)
+
+        mock_get.assert_not_called()
+        assert upload.read() == b'held'
+        assert report['path'] == 'materialized'
+        assert report['bytes'] == 4
+
+    def test_url_is_streamed_with_a_short_connect_timeout(self):
+        client = TianshuClient('http://localhost:8000')
+        file = _BlobFile('http://dify/files/a.pdf', b'unused')
+
+        with patch.object(client.session, 'get', return_value=_download_response(b'streamed')) as mock_get:
+            upload, report = acquire_file(client, file)
+
+        assert upload.read() == b'streamed'
+        assert report['path'] == 'url'
+        assert mock_get.call_args.kwargs['timeout'][0] == DOWNLOAD_CONNECT_TIMEOUT
+        assert file.fetches == 0
+
+    def test_unreachable_files_url_is_skipped_after_first_failure(self):
+        client = TianshuClient('http://localhost:8000')
+        # How requests reports a DNS failure: the connection was never made
+        error = requests.exceptions.ConnectionError(
+            Mock(reason=NewConnectionError(None, 'Name or service not known')), 'Name or service not known',
+        )
+
+        with patch.object(client.session, 'get', side_effect=error) as mock_get:
+            _, first = acquire_file(client, _BlobFile('http://dify/files/a.pdf', b'a'))
+            _, second = acquire_file(client, _BlobFile('http://dify/files/b.pdf', b'b'))
+            _, other = acquire_file(client, _BlobFile('http://other/files/c.pdf', b'c'))
+
+        assert first['path'] == second['path'] == 'blob'
+        assert 'Name or service not known' in first['url_error']
+        assert second['url_skipped'] == f"file server failed earlier: {first['url_error']}"
+        assert 'url_skipped' not in other
+        # The second file from the broken host never hit the network
+        assert [call.args[0] for call in mock_get.call_args_list] == [
+            'http://dify/files/a.pdf', 'http://other/files/c.pdf',
+        ]
+
+    def test_reset_mid_download_does_not_mark_server_broken(self):
+        client = TianshuClient('http://localhost:8000')
+        response = _download_response(b'')
+        response.iter_content.side_effect = requests.exceptions.ChunkedEncodingError(
+            ProtocolError('Connection broken', ConnectionResetError(104, 'Connection reset by peer'))
+        )
+        reset = requests.exceptions.ConnectionError('Connection reset by peer')
+
+        with patch.object(client.session, 'get', side_effect=[response, reset, _download_response(b'c')]) as mock_get:
+            _, first = acquire_file(client, _BlobFile('http://dify/files/a.pdf', b'a'))
+            _, second = acquire_file(client, _BlobFile('http://dify/files/b.pdf', b'b'))
+            upload, third = acquire_file(client, _BlobFile('http://dify/files/c.pdf', b'unused'))
+
+        assert first['path'] == second['path'] == 'blob'
+        assert 'url_skipped' not in second and 'url_skipped' not in third
+        # The origin is still tried: one broken transfer says nothing about the next
+        assert mock_get.call_count == 3
+        assert third['path'] == 'url'
+        assert upload.read() == b'c'
+
+    def test_http_error_does_not_mark_server_broken(self):
+        client = TianshuClient('http://localhost:8000')
+        response = _download_response(b'')
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError('403 Forbidden')
+
+        with patch.object(client.session, 'get', return_value=response):
+            _, first = acquire_file(client, _BlobFile('http://dify/files/a.pdf', b'a'))
+            _, second = acquire_file(client, _BlobFile('http://dify/files/b.pdf', b'b'))
+
+        assert first['url_error'] == second['url_error'] == '403 Forbidden'
+        assert 'url_skipped' not in second
+
+    def test_acquisition_is_reported_in_metrics(self):
+        client = TianshuClient('http://localhost:8000')
+
+        class Tool:
+            @instrumented('demo')
+            def _invoke(self, tool_parameters):
+                acquire_file(client, SimpleNamespace(url=None, blob=b'content'))
+                yield current_metrics().snapshot()
+
+        snapshot = list(Tool()._invoke({}))[0]
+
+        assert snapshot['acquisition'][0]['path'] == 'blob'
+        assert snapshot['bytes']['downloaded'] == 7
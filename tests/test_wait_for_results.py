@@ -0,0 +1,167 @@
+"""
+Tests for wait_for_results tool
+"""
+import pytest
+from unittest.mock import Mock, patch
+from tests.fake_server import FakeTianshuServer
+from tools.utils.cache import ResultCache, get_result_cache
+from tools.utils.client import close_all_clients
+from tools.utils.task_group import parse_task_ids
+from tools.wait_for_results import WaitForResultsTool
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    """Discovered server capabilities live on the pooled client, so start clean"""
+    close_all_clients()
+    yield
+    close_all_clients()
+
+
+def _response(payload, status_code=200):
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    return response
+
+
+def _task(task_id, status, content=None):
+    result = {'success': True, 'task_id': task_id, 'status': status, 'file_name': f'{task_id}.pdf'}
+    if content is not None:
+        result['data'] = {'content': content}
+    return result
+
+
+def _json_messages(messages):
+    return [msg.message.json_object for msg in messages if hasattr(msg.message, 'json_object')]
+
+
+class TestWaitForResultsTool:
+    """Test cases for WaitForResultsTool"""
+
+    def test_results_returned_in_completion_order(self, mock_runtime, mock_session):
+        """Test per-task fallback when the batch endpoint is missing"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+        rounds = {
+            'a': [_task('a', 'processing'), _task('a', 'completed', '# A')],
+            'b': [_task('b', 'completed', '# B')],
+        }
+
+        def get(url, **kwargs):
+            return _response(rounds[url.rsplit('/', 1)[-1]].pop(0))
+
+        with patch('tools.utils.client.requests.Session.post', return_value=_response({}, 404)) as mock_post, \
+             patch('tools.utils.client.requests.Session.get', side_effect=get), \
+             patch('tools.utils.task_group.time.sleep'):
+            messages = list(tool._invoke({'task_ids': 'a, b'}))
+
+        results = _json_messages(messages)
+        assert [result['task_id'] for result in results[:2]] == ['b', 'a']
+        assert results[0]['markdown_content'] == '# B'
+        summary = results[-1]
+        assert summary['satisfied'] is True
+        assert summary['completed'] == ['b', 'a']
+        assert summary['batch_status_endpoint'] is False
+        # The missing batch endpoint is probed once, not every round
+        assert mock_post.call_count == 1
+
+    def test_batch_endpoint_and_any_policy(self, mock_runtime, mock_session):
+        """Test that one batch request serves the whole group"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+        payload = {'tasks': [_task('a', 'processing'), _task('b', 'completed', '# B')]}
+
+        with patch('tools.utils.client.requests.Session.post', return_value=_response(payload)) as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
+            messages = list(tool._invoke({'task_ids': '["a", "b"]', 'completion_policy': 'any'}))
+
+        summary = _json_messages(messages)[-1]
+        assert summary['completed'] == ['b']
+        assert summary['pending'] == ['a']
+        assert summary['batch_status_endpoint'] is True
+        assert mock_post.call_args[1]['json'] == {'task_ids': ['a', 'b']}
+        mock_get.assert_not_called()
+
+    def test_cached_results_skip_polling(self, mock_runtime, mock_session):
+        """Test that cached task results are returned without a request"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+        cache = get_result_cache()
+        cache.put(ResultCache.task_key('http://localhost:8100', 'a'), _task('a', 'completed', '# A'))
+
+        with patch('tools.utils.client.requests.Session.post') as mock_post, \
+             patch('tools.utils.client.requests.Session.get') as mock_get:
+            messages = list(tool._invoke({'task_ids': ['a']}))
+
+        assert _json_messages(messages)[-1]['completed'] == ['a']
+        mock_post.assert_not_called()
+        mock_get.assert_not_called()
+
+    def test_failed_task_reported(self, mock_runtime, mock_session):
+        """Test that a failed task makes the 'all' policy unsatisfiable"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+        failed = {**_task('a', 'failed'), 'error_message': 'Corrupt PDF'}
+
+        with patch('tools.utils.client.requests.Session.post', return_value=_response({}, 404)), \
+             patch('tools.utils.client.requests.Session.get', return_value=_response(failed)):
+            messages = list(tool._invoke({'task_ids': 'a'}))
+
+        results = _json_messages(messages)
+        assert results[0]['error_message'] == 'Corrupt PDF'
+        assert results[-1]['satisfied'] is False
+        assert results[-1]['failed'] == ['a']
+
+    def test_wait_capped_at_request_budget(self, mock_runtime, mock_session):
+        """Test that a long max_wait_time stops at the per-call budget and returns the pending ids"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+        payload = {'tasks': [_task('a', 'processing'), _task('b', 'completed', '# B')]}
+        clock = iter(range(0, 10000, 30))
+
+        with patch('tools.utils.client.requests.Session.post', return_value=_response(payload)), \
+             patch('tools.wait_for_results.REQUEST_BUDGET', 100), \
+             patch('tools.wait_for_results.time.time', side_effect=lambda: next(clock)), \
+             patch('tools.utils.task_group.time.sleep'):
+            messages = list(tool._invoke({'task_ids': 'a,b', 'max_wait_time': 3600}))
+
+        summary = _json_messages(messages)[-1]
+        assert summary['timed_out'] is False
+        assert summary['call_again'] is True
+        assert summary['pending'] == ['a']
+        assert summary['elapsed_seconds'] < 3600
+        assert any('Call this tool again' in str(msg) for msg in messages)
+
+    @pytest.mark.parametrize('params, error', [
+        ({'task_ids': ''}, 'task_ids is required'),
+        ({'task_ids': 'a', 'completion_policy': 'most'}, 'completion_policy'),
+        ({'task_ids': 'a', 'max_wait_time': 0}, 'max_wait_time'),
+        ({'task_ids': 'a', 'k': 'x'}, 'must be valid numbers'),
+    ])
+    def test_invalid_parameters(self, mock_runtime, mock_session, params, error):
+        """Test parameter validation"""
+        tool = WaitForResultsTool(runtime=mock_runtime, session=mock_session)
+
+        messages = list(tool._invoke(params))
+
+        assert any(error in str(msg) for msg in messages)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('a,b; c  d', ['a', 'b', 'c', 'd']),
+    ('["a", "b"]', ['a', 'b']),
+    (['a', ' b '], ['a', 'b']),
+    (None, []),
+])
+def test_parse_task_ids(value, expected):
+    assert parse_task_ids(value) == expected
+
+
+def test_unknown_task_is_final(mock_session):
+    """A 404 for one task finishes it as failed instead of waiting on it until the deadline"""
+    with FakeTianshuServer() as server:
+        runtime = Mock()
+        runtime.credentials = {'api_server_url': server.url, 'api_key': 'test-api-key'}
+        tool = WaitForResultsTool(runtime=runtime, session=mock_session)
+        messages = list(tool._invoke({'task_ids': 'no-such-task', 'max_wait_time': 60}))
+
+    summary = _json_messages(messages)[-1]
+    assert summary['failed'] == ['no-such-task']
+    assert summary['pending'] == []
+    assert summary['elapsed_seconds'] < 5
@@ -1,29 +1,33 @@
-from collections.abc import Generator
+from collections.abc import Generator, Iterator
 from typing import Any
 import requests
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from tools.utils.cache import get_result_cache
+from tools.utils.chunker import MarkdownChunker, chunk_markdown, parse_chunking_options, tee_chunks
+from tools.utils.content import chunk_payload, content_chunks, origin_data, parse_output_options
+from tools.utils.metrics import current_metrics, instrumented, measure
+from tools.utils.routing import get_server_pool
+from tools.utils.timeline import completion_estimate, get_timeline, parse_timestamp
+
 class GetParseResultTool(Tool):
     """
     Get parsing result for a submitted task.
     Retrieves the status and result of a document parsing task.
     """
 
+    @instrumented('get_parse_result')
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
-        # Get API server URL from credentials
-        api_server_url = (self.runtime.credentials.get('api_server_url') or '').rstrip('/')
-        if not api_server_url:
-            yield self.create_text_message("Error: API Server URL is not configured")
+        # API server(s), API key and SSL setting from credentials; the pool's
+        # keep-alive clients are shared across invocations
+        try:
+            pool = get_server_pool(self.runtime.credentials)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
             return
 
-        # Get optional API key from credentials
-        api_key = self.runtime.credentials.get('api_key', '')
-
-        # Get SSL verification setting
-        verify_ssl = self.runtime.credentials.get('verify_ssl', True)
-
         # Get parameters
         task_id = tool_parameters.get('task_id')
 
@@ -35,34 +39,53 @@ class GetParseResultTool(Tool):
         else:
             include_images = bool(include_images_raw)
 
+        use_cache = tool_parameters.get('use_cache', True)
+
         if not task_id:
             yield self.create_text_message("Error: task_id is required")
             return
 
         try:
-            yield self.create_text_message(f"🔍 Checking task status: {task_id}")
+            output_mode, chunk_size = parse_output_options(tool_parameters)
+            chunk_max_tokens = parse_chunking_options(tool_parameters)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
 
-            # Prepare headers with optional API key
-            headers = {}
-            if api_key:
-                headers['X-API-Key'] = api_key
+        # Talk to the server that created the task
+        client = pool.client_for_task(task_id)
+        api_server_url = client.api_server_url
+
+        try:
+            yield self.create_text_message(f"🔍 Checking task status: {task_id}")
 
             # Query task status and result
-            status_url = f"{api_server_url}/api/v1/tasks/{task_id}"
+            status_path = f"/api/v1/tasks/{task_id}"
             params = {}
             if include_images:
                 # Request image information to be included in the response
                 params['upload_images'] = 'true'
 
-            response = requests.get(status_url, params=params, headers=headers, timeout=30, verify=verify_ssl)
-            response.raise_for_status()
-            result = response.json()
+            # Completed results are served from the local result cache when available
+            cache = get_result_cache() if use_cache and not include_images else None
+            task_key = cache.task_key(api_server_url, task_id) if cache is not None else None
+            result = cache.get(task_key) if cache is not None else None
+            cache_hit = result is not None
+
+            if result is None:
+                with measure('fetch'):
+                    response = client.get(status_path, params=params, hedge=True, timeout=30)
+                    response.raise_for_status()
+                    result = response.json()
 
             if not result.get('success'):
                 error_msg = result.get('message', 'Unknown error')
                 yield self.create_text_message(f"❌ Failed to get task status: {error_msg}")
                 return
 
+            # Queue wait and processing time of finished tasks feed the completion estimates
+            durations = get_timeline().record(result, task_id)
+
             task_status = result.get('status')
             file_name = result.get('file_name')
             backend = result.get('backend')
@@ -109,10 +132,33 @@ class GetParseResultTool(Tool):
                 yield self.create_text_message(f"✅ **Completed at:** {completed_at}")
 
                 # Get the markdown content
-                data_field = result.get('data', {})
-                if data_field and 'content' in data_field:
+                data_field = result.get('data') or {}
+                markdown_file = data_field.get('markdown_file', '')
+                result_json = None
+                semantic_chunks = None
+
+                if output_mode == 'chunked':
+                    # Emit bounded chunks of the inlined content, or streamed from the server without it
+                    chunks = content_chunks(client, task_id, chunk_size, data_field)
+                    if chunks is not None:
+                        if chunk_max_tokens:
+                            # Semantic chunking runs in the same pass as emission
+                            semantic_chunks = []
+                            chunks = tee_chunks(chunks, MarkdownChunker(chunk_max_tokens), semantic_chunks)
+                        chunk_count, total_length = yield from self._chunk_messages(task_id, markdown_file, chunks)
+                        result_json = {
+                            'task_id': task_id,
+                            'status': 'completed',
+                            'file_name': file_name,
+                            'backend': backend,
+                            'markdown_file': markdown_file,
+                            'chunk_count': chunk_count,
+                            'chunk_size': chunk_size,
+                            'total_length': total_length,
+                        }
+
+                elif 'content' in data_field:
                     markdown_content = data_field['content']
-                    markdown_file = data_field.get('markdown_file', '')
 
                     # Truncate if content is too large (> 5000 characters)
                     max_preview_length = 5000
@@ -127,7 +173,6 @@ class GetParseResultTool(Tool):
                     else:
                         yield self.create_text_message(f"\n📄 **Parsed Document** ({markdown_file}):\n\n{markdown_content}")
 
-                    # Return structured result
                     result_json = {
                         'task_id': task_id,
                         'status': 'completed',
@@ -135,11 +180,31 @@ class GetParseResultTool(Tool):
                         'backend': backend,
                         'markdown_content': markdown_content,
                         'markdown_file': markdown_file,
+                    }
+                    if chunk_max_tokens:
+                        semantic_chunks = chunk_markdown(markdown_content, chunk_max_tokens)
+
+                if result_json is not None:
+                    # Return structured result
+                    result_json.update({
                         'created_at': created_at,
                         'started_at': started_at,
                         'completed_at': completed_at,
-                        'originData': result  # API 原始数据
-                    }
+                        'originData': origin_data(result, output_mode)  # API 原始数据
+                    })
+                    if semantic_chunks is not None:
+                        result_json['chunks'] = semantic_chunks
+                    if durations is not None:
+                        result_json['timeline'] = {
+                            'queue_wait_seconds': round(durations[0], 3),
+                            'processing_seconds': round(durations[1], 3),
+                            'backend_summary': get_timeline().summary().get(backend),
+                        }
+
+                    if cache is not None:
+                        if not cache_hit and 'content' in data_field:
+                            cache.put(task_key, result)
+                        result_json['cache'] = {'hit': cache_hit, **cache.stats()}
 
                     # Include images info if requested
                     if include_images:
@@ -154,6 +219,9 @@ class GetParseResultTool(Tool):
                             else:
                                 yield self.create_text_message(f"🖼️ This document contains extracted images")
 
+                    metrics = current_metrics()
+                    if metrics is not None:
+                        result_json['metrics'] = metrics.snapshot('completed')
                     yield self.create_json_message(result_json)
 
                 else:
@@ -163,7 +231,7 @@ class GetParseResultTool(Tool):
                         'status': 'completed',
                         'file_name': file_name,
                         'message': 'Result files have been cleaned up (older than retention period)',
-                        'originData': result  # API 原始数据
+                        'originData': origin_data(result, output_mode)  # API 原始数据
                     })
 
             elif task_status == 'failed':
@@ -173,7 +241,7 @@ class GetParseResultTool(Tool):
                     'status': 'failed',
                     'file_name': file_name,
                     'error_message': error_message,
-                    'originData': result  # API 原始数据
+                    'originData': origin_data(result, output_mode)  # API 原始数据
                 })
 
             elif task_status == 'processing':
@@ -185,7 +253,8 @@ class GetParseResultTool(Tool):
                     'file_name': file_name,
                     'started_at': started_at,
                     'message': 'Task is still being processed. Please check again later.',
-                    'originData': result  # API 原始数据
+                    'estimate': self._estimate(backend, created_at),
+                    'originData': origin_data(result, output_mode)  # API 原始数据
                 })
 
             elif task_status == 'pending':
@@ -197,7 +266,8 @@ class GetParseResultTool(Tool):
                     'file_name': file_name,
                     'created_at': created_at,
                     'message': 'Task is pending in the queue. Please check again later.',
-                    'originData': result  # API 原始数据
+                    'estimate': self._estimate(backend, created_at),
+                    'originData': origin_data(result, output_mode)  # API 原始数据
                 })
 
             else:
@@ -206,10 +276,33 @@ class GetParseResultTool(Tool):
                     'task_id': task_id,
                     'status': task_status,
                     'file_name': file_name,
-                    'originData': result  # API 原始数据
+                    'originData': origin_data(result, output_mode)  # API 原始数据
                 })
 
         except requests.exceptions.RequestException as e:
             yield self.create_text_message(f"❌ Network error: {str(e)}")
         except Exception as e:
             yield self.create_text_message(f"❌ Error: {str(e)}")
+
+    @staticmethod
+    def _estimate(backend: str | None, created_at: Any) -> dict[str, Any] | None:
+        """When an unfinished task should complete, judging by earlier tasks on its backend."""
+        submitted_at = parse_timestamp(created_at)
+        return completion_estimate(backend, submitted_at) if submitted_at is not None else None
+
+    def _chunk_messages(
+        self, task_id: str, markdown_file: str, chunks: Iterator[tuple[int, str]]
+    ) -> Generator[ToolInvokeMessage, None, tuple[int, int]]:
+        """Emit markdown chunks as JSON messages; returns (chunk count, total characters)."""
+        chunk_count = total_length = 0
+        for offset, text in chunks:
+            if chunk_count == 0:
+                yield self.create_text_message(
+                    f"\n📄 **Parsed Document (Preview)** ({markdown_file}):\n\n{text[:5000]}\n\n"
+                    f"... _(Full content follows as JSON chunk messages.)_"
+                )
+            yield self.create_json_message(chunk_payload(task_id, chunk_count, offset, text))
+            chunk_count += 1
+            total_length = offset + len(text)
+        yield self.create_text_message(f"📦 Emitted {chunk_count} chunk(s), {total_length} characters in total")
+        return chunk_count, total_length
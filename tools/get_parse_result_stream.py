@@ -0,0 +1,151 @@
+from collections.abc import Generator
+from typing import Any
+import time
+import requests
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.utils.metrics import current_snapshot, instrumented
+from tools.utils.polling import create_scheduler
+from tools.utils.resume import REQUEST_BUDGET
+from tools.utils.routing import get_server_pool
+from tools.utils.subtasks import SubtaskTracker, part_label
+from tools.utils.task_group import failed_status, fetch_task_status, parse_task_ids
+
+
+class GetParseResultStreamTool(Tool):
+    """
+    Streaming result retrieval tool.
+    Waits on a task and returns each part of a server-split document as soon as it finishes.
+    """
+
+    @instrumented('get_parse_result_stream')
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # Never wait past the plugin request ceiling; callers continue with emitted_subtasks
+        invocation_end = time.time() + REQUEST_BUDGET
+
+        # API server(s), API key and SSL setting from credentials; the pool's
+        # keep-alive clients are shared across invocations
+        try:
+            pool = get_server_pool(self.runtime.credentials)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        # Get parameters
+        task_id = (tool_parameters.get('task_id') or '').strip()
+        tracker = SubtaskTracker(parse_task_ids(tool_parameters.get('emitted_subtasks') or ''))
+
+        if not task_id:
+            yield self.create_text_message("Error: task_id is required")
+            return
+
+        # Convert and validate max_wait_time
+        try:
+            max_wait_time = int(tool_parameters.get('max_wait_time', 100))
+            if max_wait_time < 1 or max_wait_time > 3600:
+                yield self.create_text_message("Error: max_wait_time must be between 1 and 3600 seconds")
+                return
+        except (ValueError, TypeError):
+            yield self.create_text_message("Error: max_wait_time must be a valid number")
+            return
+
+        # Talk to the server that created the task
+        client = pool.client_for_task(task_id)
+
+        deadline = min(time.time() + max_wait_time, invocation_end)
+        scheduler = create_scheduler('adaptive')
+        last_poll = time.monotonic()
+
+        try:
+            yield self.create_text_message(f"🔍 Streaming results for task: {task_id}")
+
+            while True:
+                try:
+                    (status_response, status_result), _ = fetch_task_status(client, task_id, not_before=last_poll)
+                except requests.exceptions.RequestException as e:
+                    status_response, status_result = None, failed_status(task_id, e)
+                    if status_result['transient']:
+                        # A failed poll only delays the next one
+                        yield self.create_text_message(f"⚠️ Status check failed, will retry: {str(e)}")
+                        status_result = {'success': True, 'status': 'processing'}
+                last_poll = time.monotonic()
+                scheduler.record_poll()
+
+                if not status_result.get('success'):
+                    error_msg = status_result.get('message', 'Unknown error')
+                    yield self.create_text_message(f"❌ Failed to get task status: {error_msg}")
+                    yield self.create_json_message(status_result)
+                    return
+
+                task_status = status_result.get('status')
+
+                if status_result.get('is_parent'):
+                    for part in tracker.iter_new_parts(client, task_id, status_result):
+                        yield from self._part_messages(part)
+                elif task_status == 'completed' and task_id not in tracker.emitted:
+                    # An unsplit document is a single part
+                    tracker.emitted.append(task_id)
+                    yield from self._part_messages({
+                        'parent_task_id': task_id,
+                        'subtask_id': task_id,
+                        'part_index': 0,
+                        'part_count': 1,
+                        'start_page': None,
+                        'end_page': None,
+                        'content': (status_result.get('data') or {}).get('content'),
+                    })
+
+                if task_status in ('completed', 'failed'):
+                    break
+
+                delay = scheduler.next_delay(status_result, status_response)
+                if time.time() + delay > deadline:
+                    break
+                yield self.create_text_message(
+                    f"⏳ Status: {task_status}... ({len(tracker.emitted)} part(s) returned so far)"
+                )
+                time.sleep(delay)
+
+            if task_status == 'completed':
+                yield self.create_text_message(
+                    f"✅ Task completed. {len(tracker.emitted)} part(s) returned; "
+                    f"use 'get_parse_result' for the merged document."
+                )
+            elif task_status == 'failed':
+                yield self.create_text_message(
+                    f"❌ Processing failed: {status_result.get('error_message') or 'Unknown error'}"
+                )
+            else:
+                yield self.create_text_message(
+                    f"⏸️ Task is still {task_status}. Call this tool again with the returned "
+                    f"emitted_subtasks to receive the remaining parts."
+                )
+
+            yield self.create_json_message({
+                'task_id': task_id,
+                'status': task_status,
+                'file_name': status_result.get('file_name'),
+                'is_parent': bool(status_result.get('is_parent')),
+                'subtask_progress': status_result.get('subtask_progress'),
+                'emitted_subtasks': tracker.emitted,
+                'error_message': status_result.get('error_message'),
+                'poll_stats': scheduler.stats.to_dict(),
+                'metrics': current_snapshot(task_status),
+            })
+            yield self.create_variable_message('emitted_subtasks', ','.join(tracker.emitted))
+
+        except requests.exceptions.RequestException as e:
+            yield self.create_text_message(f"❌ Network error: {str(e)}")
+        except Exception as e:
+            yield self.create_text_message(f"❌ Error: {str(e)}")
+
+    def _part_messages(self, part: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Emit one finished part as a status line and a JSON message with its markdown."""
+        content = part.get('content')
+        if content is None:
+            yield self.create_text_message(f"⚠️ {part_label(part)} completed but its content is unavailable")
+        else:
+            yield self.create_text_message(f"📄 {part_label(part)} ready ({len(content)} characters)")
+        yield self.create_json_message(part)
@@ -1,42 +1,69 @@
+from collections import deque
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 import time
 import requests
-from io import BytesIO
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from tools.utils.backend_router import BackendRoute, choose_backend
+from tools.utils.cache import ResultCache, get_result_cache
+from tools.utils.chunker import chunk_markdown, parse_chunking_options
+from tools.utils.client import TianshuClient
+from tools.utils.content import chunk_payload, compact_result, content_chunks, parse_output_options
+from tools.utils.metrics import InvocationMetrics, current_metrics, instrumented, propagate
+from tools.utils.notify import CALLBACK_BACKSTOP, CALLBACK_GRACE, callback_fields, get_completion_registry
+from tools.utils.pages import apply_page_selection, parse_page_selection
+from tools.utils.pdf_split import (
+    SPLIT_CONCURRENCY, PdfSplitError, is_pdf, open_pdf, parse_split_pages, part_file_name, plan_parts,
+    stitch_parts, write_part,
+)
+from tools.utils.polling import PollScheduler, create_scheduler
+from tools.utils.resume import REQUEST_BUDGET, WaitStateStore
+from tools.utils.routing import get_server_pool, pin_task
+from tools.utils.submit import SubmitError, build_submit_data, find_reusable_task, parse_options, submit_upload_once
+from tools.utils.subtasks import SubtaskIndex, SubtaskTracker, part_label
+from tools.utils.task_group import TaskGroupWaiter, failed_status, fetch_task_status
+from tools.utils.timeline import get_timeline
+from tools.utils.upload import SpooledUpload, acquire_file
+
 class ParseDocumentTool(Tool):
     """
     Synchronous document parsing tool.
     Submits a document to MinerU Tianshu and waits for processing to complete.
     """
 
+    @instrumented('parse_document')
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
-        # Get API server URL from credentials
-        api_server_url = (self.runtime.credentials.get('api_server_url') or '').rstrip('/')
-        if not api_server_url:
-            yield self.create_text_message("Error: API Server URL is not configured")
-            return
-
-        # Get optional API key from credentials
-        api_key = self.runtime.credentials.get('api_key', '')
+        # The runtime kills the request at MAX_REQUEST_TIMEOUT; hand back a resume token before that
+        invocation_end = time.time() + REQUEST_BUDGET
 
-        # Get SSL verification setting
-        verify_ssl = self.runtime.credentials.get('verify_ssl', True)
+        # API server(s), API key and SSL setting from credentials; the pool's
+        # keep-alive clients are shared across invocations
+        try:
+            pool = get_server_pool(self.runtime.credentials)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
 
         # Get parameters
         file = tool_parameters.get('file')
-        backend = tool_parameters.get('backend', 'auto')
-        lang = tool_parameters.get('lang', 'auto')
-        method = tool_parameters.get('method', 'auto')
-        formula_enable = tool_parameters.get('formula_enable', True)
-        table_enable = tool_parameters.get('table_enable', True)
+        poll_strategy = tool_parameters.get('poll_strategy', 'adaptive')
+        use_cache = tool_parameters.get('use_cache', True)
+        stream_parts = tool_parameters.get('stream_parts', False)
+        if isinstance(stream_parts, str):
+            stream_parts = stream_parts.lower() in ('true', '1', 'yes')
+        resume_token = (tool_parameters.get('resume_token') or '').strip()
 
         # Convert and validate max_wait_time
         try:
-            max_wait_time = int(tool_parameters.get('max_wait_time', 300))
+            max_wait_time = tool_parameters.get('max_wait_time')
+            if max_wait_time in (None, ''):
+                # Without an explicit limit, allow for how long this backend's tasks have been taking
+                max_wait_time = get_timeline().suggested_wait(tool_parameters.get('backend', 'auto'), 300)
+            max_wait_time = int(max_wait_time)
             if max_wait_time < 1 or max_wait_time > 3600:
                 yield self.create_text_message("Error: max_wait_time must be between 1 and 3600 seconds")
                 return
@@ -44,12 +71,48 @@ class ParseDocumentTool(Tool):
             yield self.create_text_message("Error: max_wait_time must be a valid number")
             return
 
-        if not file:
+        if not file and not resume_token:
             yield self.create_text_message("Error: No file provided")
             return
 
+        # The raw API response is the only copy of the content here, so there is no compact mode
         try:
-            # Step 1: Submit the task
+            output_mode, chunk_size = parse_output_options(tool_parameters, modes=('full', 'chunked'))
+            chunk_max_tokens = parse_chunking_options(tool_parameters)
+            split_pages = parse_split_pages(tool_parameters)
+            page_ranges, max_pages = parse_page_selection(tool_parameters)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+        output = {'output_mode': output_mode, 'chunk_size': chunk_size, 'chunk_max_tokens': chunk_max_tokens}
+
+        upload = None
+        try:
+            if resume_token:
+                # Continue an earlier wait without downloading or resubmitting anything
+                wait_state = WaitStateStore(self.session).load(resume_token)
+                if wait_state is None or not wait_state.get('task_id'):
+                    yield self.create_text_message(
+                        "❌ Error: Resume token not found or expired. "
+                        "Use the 'get_parse_result' tool with the task ID instead."
+                    )
+                    return
+                client = pool.client_for(wait_state.get('api_server_url') or '')
+                if client is None:
+                    yield self.create_text_message("❌ Error: Resume token belongs to a different API server")
+                    return
+
+                yield self.create_text_message(
+                    f"🔁 Resuming wait for Task ID: {wait_state['task_id']} "
+                    f"({int(time.time() - wait_state['started_at'])}s since submission)"
+                )
+                cache = get_result_cache() if use_cache else None
+                yield from self._wait_for_task(client, wait_state, cache, invocation_end, output, resume_token)
+                return
+
+            # Step 1: Submit the task to the server picked by the routing policy
+            client = pool.choose()
+            api_server_url = client.api_server_url
             yield self.create_text_message(f"📤 Submitting document to MinerU Tianshu...")
 
             # Get file content
@@ -58,140 +121,236 @@ class ParseDocumentTool(Tool):
                 yield self.create_text_message("❌ Error: File object exists but filename is missing")
                 return
 
-            # Try to get file content using URL-based download to control SSL verification
-            file_content = None
+            # Use bytes Dify already holds, else stream the file from its URL into a
+            # bounded spool (memory, then disk), else fall back to the blob property
+            try:
+                upload, acquisition = acquire_file(client, file)
+            except Exception as e:
+                yield self.create_text_message(
+                    f"❌ Error: Unable to access file content. "
+                    f"This usually means SSL certificate verification failed or FILES_URL is not configured. "
+                    f"Error details: {str(e)}"
+                )
+                return
+            if acquisition.get('url_error'):
+                yield self.create_text_message(f"⚠️ Failed to download from URL: {acquisition['url_error']}")
+            yield self.create_text_message(
+                f"📥 File obtained via {acquisition['path']} "
+                f"({acquisition['bytes']} bytes in {acquisition['seconds']}s)"
+            )
+
+            if not upload.size:
+                yield self.create_text_message(
+                    f"❌ Error: Could not obtain file content through any method"
+                )
+                return
 
-            # Check if file has a URL we can download from
-            if hasattr(file, 'url') and file.url:
-                try:
-                    yield self.create_text_message(f"📥 Downloading file from URL...")
-                    download_response = requests.get(
-                        file.url,
-                        timeout=60,
-                        verify=verify_ssl
-                    )
-                    download_response.raise_for_status()
-                    file_content = download_response.content
-                except Exception as download_error:
-                    yield self.create_text_message(
-                        f"⚠️ Failed to download from URL: {str(download_error)}"
-                    )
+            # The caller's options identify the document in the result cache and among
+            # in-flight submissions; the backend picked by routing below does not
+            priority = tool_parameters.get('priority', 0)
+            requested = build_submit_data(tool_parameters, priority)
+            # Ask the server to call the plugin endpoint on completion, when configured
+            requested.update(callback_fields(self.runtime.credentials))
 
-            # Fallback: try blob property if URL download failed
-            if not file_content:
+            # Submit only the selected pages: PDFs are trimmed here, other formats by the server
+            upload, page_selection = apply_page_selection(upload, page_ranges, max_pages, requested)
+            if page_selection and page_selection['trimmed']:
+                yield self.create_text_message(
+                    f"✂️ Trimmed to {page_selection['submitted_pages']} of {page_selection['page_count']} pages before upload"
+                )
+
+            # Opt-in client-side splitting: upload page ranges concurrently instead of one large file
+            if split_pages and is_pdf(upload):
                 try:
-                    file_content = file.blob
-                except Exception as e:
+                    reader = open_pdf(upload)
+                except PdfSplitError as e:
+                    reader = None
                     yield self.create_text_message(
-                        f"❌ Error: Unable to access file content. "
-                        f"This usually means SSL certificate verification failed or FILES_URL is not configured. "
-                        f"Error details: {str(e)}"
+                        f"⚠️ Client-side splitting skipped ({str(e)}); submitting the whole document"
+                    )
+                if reader is not None and len(reader.pages) > split_pages:
+                    route = yield from self._route(file_name, upload, tool_parameters)
+                    data = {**requested, **build_submit_data(route.apply(tool_parameters), priority)}
+                    deadline = min(time.time() + max_wait_time, invocation_end)
+                    yield from self._parse_split(
+                        client, file_name, reader, split_pages, data, poll_strategy, deadline, output,
+                        route.to_dict(),
                     )
                     return
 
-            if not file_content:
-                yield self.create_text_message(
-                    f"❌ Error: Could not obtain file content through any method"
-                )
-                return
+            # Look the document up in the result cache before uploading (or inspecting) it again
+            cache = get_result_cache() if use_cache else None
+            cache_key = None
+            task_id = None
+            route = None
+            data = requested
+            if cache is not None:
+                cache_key = cache.document_key(api_server_url, upload.sha256, parse_options(requested))
+                # A task the server purged or failed is dropped from the cache instead of waited on
+                task_id = find_reusable_task(client, cache, api_server_url, cache_key)
+                if task_id is not None:
+                    cached_result = cache.get(cache.task_key(api_server_url, task_id))
+                    if cached_result:
+                        yield self.create_text_message(
+                            f"♻️ Identical document already parsed (Task ID: {task_id}). Returning cached result."
+                        )
+                        yield from self._completed_messages(cached_result, {'cache': {'hit': True, **cache.stats()}}, **output)
+                        return
+                    yield self.create_text_message(
+                        f"♻️ Identical document already submitted. Reusing Task ID: {task_id}"
+                    )
 
-            # Prepare form data
-            files = {
-                'file': (file_name, BytesIO(file_content), 'application/octet-stream')
-            }
-            data = {
-                'backend': backend,
-                'lang': lang,
-                'method': method,
-                'formula_enable': str(formula_enable).lower(),
-                'table_enable': str(table_enable).lower(),
-                'priority': '0'
-            }
+            if task_id is None:
+                # Routed on the pages actually submitted, so tracked throughput matches the upload
+                route = yield from self._route(file_name, upload, tool_parameters)
+                data = {**requested, **build_submit_data(route.apply(tool_parameters), priority)}
 
-            # Add video-specific parameters if backend is video
-            if backend == 'video':
-                enable_keyframe_ocr = tool_parameters.get('enable_keyframe_ocr', False)
-                keep_audio = tool_parameters.get('keep_audio', False)
-                ocr_backend = tool_parameters.get('ocr_backend', 'paddleocr-vl')
-                keep_keyframes = tool_parameters.get('keep_keyframes', False)
-                data.update({
-                    'enable_keyframe_ocr': str(enable_keyframe_ocr).lower(),
-                    'keep_audio': str(keep_audio).lower(),
-                    'ocr_backend': ocr_backend,
-                    'keep_keyframes': str(keep_keyframes).lower(),
-                })
-
-            # Add audio-specific parameters if backend is sensevoice
-            if backend == 'sensevoice':
-                enable_speaker_diarization = tool_parameters.get('enable_speaker_diarization', False)
-                data['enable_speaker_diarization'] = str(enable_speaker_diarization).lower()
-
-            # Add watermark removal parameters
-            remove_watermark = tool_parameters.get('remove_watermark', False)
-            if remove_watermark:
-                watermark_conf_threshold = tool_parameters.get('watermark_conf_threshold', 0.35)
-                watermark_dilation = tool_parameters.get('watermark_dilation', 10)
-                data.update({
-                    'remove_watermark': str(remove_watermark).lower(),
-                    'watermark_conf_threshold': str(watermark_conf_threshold),
-                    'watermark_dilation': str(watermark_dilation),
-                })
-
-            # Add convert_office_to_pdf parameter
-            convert_office_to_pdf = tool_parameters.get('convert_office_to_pdf', False)
-            if convert_office_to_pdf:
-                data['convert_office_to_pdf'] = str(convert_office_to_pdf).lower()
-
-            # Prepare headers with optional API key
-            headers = {}
-            if api_key:
-                headers['X-API-Key'] = api_key
-
-            # Submit the task
-            submit_url = f"{api_server_url}/api/v1/tasks/submit"
-            response = requests.post(submit_url, files=files, data=data, headers=headers, timeout=60, verify=verify_ssl)
-            response.raise_for_status()
-            result = response.json()
-
-            if not result.get('success'):
-                yield self.create_text_message(f"❌ Failed to submit task: {result.get('message', 'Unknown error')}")
-                return
+                # Submit the task, streaming the spooled file into the multipart body;
+                # an identical submission already in flight is joined instead
+                try:
+                    # Among local submissions waiting for a slot, this one ranks by
+                    # priority, then by when the caller stops waiting
+                    result, shared = submit_upload_once(
+                        client, file_name, upload, data, deadline=time.time() + max_wait_time,
+                        options=parse_options(requested),
+                    )
+                except SubmitError as e:
+                    yield self.create_text_message(f"❌ {str(e)}")
+                    return
+                task_id = result['task_id']
+                if not shared:
+                    route.track(task_id)
 
-            task_id = result.get('task_id')
-            if not task_id:
-                yield self.create_text_message(f"❌ Error: API returned success but no task_id. Response: {result}")
-                return
+                if shared:
+                    yield self.create_text_message(
+                        f"♻️ Identical document was being submitted by another run. Attached to Task ID: {task_id}"
+                    )
+                else:
+                    yield self.create_text_message(f"✅ Task submitted successfully! Task ID: {task_id}")
+                if cache is not None:
+                    cache.put(cache_key, {'task_id': task_id})
+            # Later lookups of this task go to the server that has it
+            pin_task(task_id, api_server_url)
 
-            yield self.create_text_message(f"✅ Task submitted successfully! Task ID: {task_id}")
+            # The spool is no longer needed once the task exists
+            upload.close()
 
             # Step 2: Poll for completion
             yield self.create_text_message(f"⏳ Waiting for processing to complete...")
 
-            status_url = f"{api_server_url}/api/v1/tasks/{task_id}"
             start_time = time.time()
-            poll_interval = 5  # Poll every 5 seconds
+            expected_seconds = get_timeline().estimate(data['backend'])
+            wait_state = {
+                'task_id': task_id,
+                'api_server_url': api_server_url,
+                'cache_key': cache_key,
+                'poll_strategy': poll_strategy,
+                'max_wait_time': max_wait_time,
+                'started_at': start_time,
+                'deadline': start_time + max_wait_time,
+                'expected_completion': start_time + expected_seconds if expected_seconds is not None else None,
+                'callbacks': 'callback_url' in data,
+                'stream_parts': bool(stream_parts),
+                'emitted_subtasks': [],
+                'route': route.to_dict() if route is not None else None,
+            }
+            yield from self._wait_for_task(client, wait_state, cache, invocation_end, output)
 
+        except requests.exceptions.RequestException as e:
+            yield self.create_text_message(f"❌ Network error: {str(e)}")
+        except Exception as e:
+            yield self.create_text_message(f"❌ Error: {str(e)}")
+        finally:
+            if upload is not None:
+                upload.close()
+
+    def _route(
+        self, file_name: str, upload: SpooledUpload, tool_parameters: dict[str, Any]
+    ) -> Generator[ToolInvokeMessage, None, BackendRoute]:
+        """With backend 'auto', pick the backend from the file itself and measured throughput."""
+        route = choose_backend(file_name, upload, tool_parameters)
+        if route.routed:
+            yield self.create_text_message(
+                f"🧭 Backend: {route.backend} (method: {route.method}) - {route.reason}"
+            )
+        return route
+
+    def _wait_for_task(
+        self,
+        client: TianshuClient,
+        wait_state: dict[str, Any],
+        cache: ResultCache | None,
+        invocation_end: float,
+        output: dict[str, Any],
+        resume_token: str | None = None,
+    ) -> Generator[ToolInvokeMessage]:
+        """
+        Poll a submitted task until it finishes, the caller's deadline passes, or
+        this invocation runs out of time, in which case the wait state is saved
+        and a resume token is returned.
+        """
+        task_id = wait_state['task_id']
+        cache_key = wait_state.get('cache_key')
+        api_server_url = wait_state['api_server_url']
+        max_wait_time = wait_state['max_wait_time']
+        deadline = wait_state['deadline']
+        store = WaitStateStore(self.session)
+        registry = get_completion_registry()
+        paused = False
+
+        scheduler = create_scheduler(wait_state.get('poll_strategy'))
+        scheduler.restore(wait_state.get('scheduler') or {})
+        scheduler.expect_completion(wait_state.get('expected_completion'))
+        # Parts of a split document already sent, carried across resumed waits
+        tracker = SubtaskTracker(wait_state.get('emitted_subtasks')) if wait_state.get('stream_parts') else None
+        subtask_index = tracker.index if tracker is not None else SubtaskIndex()
+
+        # Concurrent waiters on this task share status requests, but never reuse
+        # one that started before their own previous poll finished
+        last_poll = time.monotonic()
+        metrics = current_metrics() or InvocationMetrics('parse_document')
+        metrics.start_phase('queued')
+
+        try:
             while True:
                 # Check timeout
-                elapsed_time = time.time() - start_time
-                if elapsed_time > max_wait_time:
-                    yield self.create_text_message(f"⚠️ Timeout: Processing exceeded {max_wait_time} seconds. Task ID: {task_id}")
+                elapsed_time = time.time() - wait_state['started_at']
+                if time.time() > deadline:
+                    if resume_token:
+                        store.delete(resume_token)
+                    yield self.create_text_message(
+                        f"⚠️ Timeout: Processing exceeded {max_wait_time} seconds "
+                        f"({scheduler.stats.polls} status checks). Task ID: {task_id}"
+                    )
                     yield self.create_text_message("You can use the 'get_parse_result' tool to check the status later.")
                     return
 
                 # Query task status
-                status_response = requests.get(status_url, headers=headers, timeout=30, verify=verify_ssl)
-                status_response.raise_for_status()
-                status_result = status_response.json()
+                poll_started = time.time()
+                try:
+                    (status_response, status_result), _ = fetch_task_status(client, task_id, not_before=last_poll)
+                except requests.exceptions.RequestException as e:
+                    status_response, status_result = None, failed_status(task_id, e)
+                    if status_result['transient']:
+                        # The task keeps running on the server; a failed poll only delays the next one
+                        yield self.create_text_message(f"⚠️ Status check failed, will retry: {str(e)}")
+                        status_result = {'success': True, 'status': 'processing'}
+                last_poll = time.monotonic()
+                scheduler.record_poll()
 
                 # Check API-level success first
                 if not status_result.get('success'):
                     error_msg = status_result.get('message', 'Unknown error')
                     yield self.create_text_message(f"❌ API error: {error_msg}")
-                    yield self.create_json_message(status_result)
+                    if cache is not None and cache_key:
+                        cache.invalidate(cache_key)
+                    if resume_token:
+                        store.delete(resume_token)
+                    yield self.create_json_message({**status_result, 'poll_stats': scheduler.stats.to_dict()})
                     return
 
                 task_status = status_result.get('status')
+                metrics.observe_status(task_status)
 
                 # Check if this is a parent task (large PDF automatically split)
                 if status_result.get('is_parent'):
@@ -205,70 +364,329 @@ class ParseDocumentTool(Tool):
                         f"⏳ Progress: {completed}/{total} parts ({percentage:.1f}%)"
                     )
 
-                    # Check for failed subtasks
-                    subtasks = status_result.get('subtasks', [])
-                    if subtasks:
-                        failed = [st for st in subtasks if st.get('status') == 'failed']
-                        if failed:
-                            yield self.create_text_message(
-                                f"⚠️ Warning: {len(failed)} part(s) failed"
-                            )
-
-                if task_status == 'completed':
-                    # Check if parent task
-                    if status_result.get('is_parent'):
-                        subtask_progress = status_result.get('subtask_progress', {})
-                        total = subtask_progress.get('total', 0)
+                    # Check for failed subtasks (only changed subtasks are re-examined)
+                    subtask_index.update(status_result)
+                    if subtask_index.failed:
                         yield self.create_text_message(
-                            f"✅ All {total} parts merged successfully!"
+                            f"⚠️ Warning: {subtask_index.failed} part(s) failed"
                         )
-                    else:
-                        yield self.create_text_message(f"✅ Processing completed!")
-
-                    # Get the markdown content with smart truncation
-                    data_field = status_result.get('data', {})
-                    if data_field and 'content' in data_field:
-                        markdown_content = data_field['content']
-
-                        # Truncate if content is too large (> 5000 characters)
-                        max_preview_length = 5000
-                        if len(markdown_content) > max_preview_length:
-                            truncated_content = markdown_content[:max_preview_length]
-                            yield self.create_text_message(
-                                f"\n📄 **Parsed Document (Preview - {max_preview_length} characters):**\n\n"
-                                f"{truncated_content}\n\n"
-                                f"... _(Content truncated. Total length: {len(markdown_content)} characters. "
-                                f"Full content is available in the JSON response below.)_"
-                            )
-                        else:
-                            yield self.create_text_message(f"\n📄 **Parsed Document:**\n\n{markdown_content}")
-                    else:
-                        yield self.create_text_message("⚠️ Task completed but no content found. The result files may have been cleaned up.")
 
-                    # Return API raw response directly
-                    yield self.create_json_message(status_result)
+                    # Send each finished part now; the merged document follows on completion
+                    if tracker is not None and task_status != 'completed':
+                        for part in tracker.iter_new_parts(client, task_id, status_result):
+                            yield from self._subtask_messages(part)
+
+                if task_status == 'completed':
+                    # The poll that saw completion also carried the result
+                    metrics.add_phase('fetch', poll_started, time.time())
+                    if resume_token:
+                        store.delete(resume_token)
+                    extra = {'poll_stats': scheduler.stats.to_dict()}
+                    if wait_state.get('route'):
+                        extra['route'] = wait_state['route']
+                    if cache is not None:
+                        # Only results that still carry content are worth serving again
+                        if (status_result.get('data') or {}).get('content') is not None:
+                            cache.put(cache.task_key(api_server_url, task_id), status_result)
+                            if cache_key:
+                                cache.put(cache_key, {'task_id': task_id})
+                        extra['cache'] = {'hit': False, **cache.stats()}
+                    yield from self._completed_messages(status_result, extra, **output, client=client)
                     return
 
                 elif task_status == 'failed':
                     error_msg = status_result.get('error_message', 'Unknown error')
                     yield self.create_text_message(f"❌ Processing failed: {error_msg}")
+                    if cache is not None and cache_key:
+                        cache.invalidate(cache_key)
+                    if resume_token:
+                        store.delete(resume_token)
                     # Return API raw response directly
-                    yield self.create_json_message(status_result)
+                    yield self.create_json_message({
+                        **status_result, 'poll_stats': scheduler.stats.to_dict(), 'metrics': metrics.snapshot('failed'),
+                        **({'route': wait_state['route']} if wait_state.get('route') else {}),
+                    })
                     return
 
                 elif task_status in ['pending', 'processing']:
                     # Still processing, wait and retry
                     yield self.create_text_message(f"⏳ Status: {task_status}... ({int(elapsed_time)}s elapsed)")
-                    time.sleep(poll_interval)
+                    # Adaptive delay, never sleeping past the caller's deadline
+                    delay = scheduler.next_delay(status_result, status_response)
+                    if wait_state.get('callbacks') and time.time() - wait_state['started_at'] >= CALLBACK_GRACE:
+                        # Past the early polls a callback wakes us; polls are only a sparse backstop
+                        delay = max(delay, CALLBACK_BACKSTOP)
+                    sleep_for = min(delay, max(deadline - time.time(), 0))
+
+                    if time.time() + sleep_for > invocation_end and deadline > invocation_end:
+                        # The next poll would land after the request ceiling: save state and hand back a token
+                        resume_token = store.save({
+                            **wait_state,
+                            'scheduler': scheduler.snapshot(),
+                            'emitted_subtasks': tracker.emitted if tracker is not None else [],
+                        }, resume_token)
+                        paused = True
+                        yield from self._resumable_messages(task_id, task_status, resume_token, deadline, scheduler)
+                        return
+
+                    if wait_state.get('callbacks'):
+                        registry.wait(task_id, sleep_for)
+                    else:
+                        time.sleep(sleep_for)
 
                 else:
                     # Unexpected status
+                    if resume_token:
+                        store.delete(resume_token)
                     yield self.create_text_message(f"⚠️ Unexpected status: {task_status}. Full response: {status_result.get('message', 'No additional message')}")
                     # Return API raw response directly
-                    yield self.create_json_message(status_result)
+                    yield self.create_json_message({**status_result, 'poll_stats': scheduler.stats.to_dict()})
                     return
+        finally:
+            # Keep callbacks that arrive between invocations for the resumed wait
+            if not paused:
+                registry.discard(task_id)
+
+    def _parse_split(
+        self,
+        client: TianshuClient,
+        file_name: str,
+        reader: Any,
+        pages_per_part: int,
+        data: dict[str, str],
+        poll_strategy: str,
+        deadline: float,
+        output: dict[str, Any],
+        route: dict[str, Any] | None = None,
+    ) -> Generator[ToolInvokeMessage]:
+        """
+        Submit page-range parts of a PDF concurrently, emit each part's markdown
+        in page order as soon as it and all earlier parts are done, then emit the
+        stitched document.
+        """
+        page_count = len(reader.pages)
+        parts = plan_parts(page_count, pages_per_part)
+        yield self.create_text_message(
+            f"✂️ Splitting {page_count}-page PDF into {len(parts)} parts of up to {pages_per_part} pages..."
+        )
+
+        def collect(part: dict[str, Any], upload: Any, future: Any) -> None:
+            try:
+                result, _ = future.result()
+                part['task_id'] = result['task_id']
+            except (SubmitError, requests.exceptions.RequestException) as e:
+                part.update(status='failed', error_message=str(e))
+            finally:
+                upload.close()
+
+        # Each part is written while earlier ones upload; at most SPLIT_CONCURRENCY spools exist at once
+        with ThreadPoolExecutor(max_workers=SPLIT_CONCURRENCY) as executor:
+            in_flight = deque()
+            for part in parts:
+                if len(in_flight) >= SPLIT_CONCURRENCY:
+                    collect(*in_flight.popleft())
+                try:
+                    upload = write_part(reader, part['first_page'], part['last_page'])
+                except PdfSplitError as e:
+                    part.update(status='failed', error_message=str(e))
+                    continue
+                name = part_file_name(file_name, part['first_page'], part['last_page'])
+                in_flight.append((part, upload, executor.submit(propagate(submit_upload_once), client, name, upload, data, deadline=deadline)))
+            while in_flight:
+                collect(*in_flight.popleft())
+
+        # Identical parts submitted at the same time share one task
+        parts_by_task: dict[str, list[dict[str, Any]]] = {}
+        for part in parts:
+            if part.get('task_id'):
+                parts_by_task.setdefault(part['task_id'], []).append(part)
+                pin_task(part['task_id'], client.api_server_url)
+        if not parts_by_task:
+            yield self.create_text_message("❌ None of the parts could be submitted")
+            yield self.create_json_message({
+                'success': False,
+                'status': 'failed',
+                'client_split': {'page_count': page_count, 'pages_per_part': pages_per_part, 'parts': parts},
+            })
+            return
+        yield self.create_text_message(
+            f"✅ {len(parts_by_task)} parts submitted. Task IDs: {', '.join(parts_by_task)}"
+        )
+        yield self.create_text_message(f"⏳ Waiting for parts to complete...")
+
+        waiter = TaskGroupWaiter(client, list(parts_by_task), create_scheduler(poll_strategy))
+        emitted = 0
+        for task_id, status_result in waiter.iter_finished(deadline):
+            content = (status_result.get('data') or {}).get('content')
+            for part in parts_by_task[task_id]:
+                if status_result.get('status') == 'completed' and content is not None:
+                    part.update(status='completed', content=content)
+                else:
+                    part.update(
+                        status=status_result.get('status') or 'failed',
+                        error_message=status_result.get('error_message') or status_result.get('message')
+                        or 'no content returned',
+                    )
+            # Emit the finished prefix so content always arrives in page order
+            while emitted < len(parts) and parts[emitted].get('status'):
+                yield from self._part_messages(parts[emitted], len(parts))
+                emitted += 1
+
+        manifest = {
+            'page_count': page_count,
+            'pages_per_part': pages_per_part,
+            'parts': [{key: value for key, value in part.items() if key != 'content'} for part in parts],
+        }
+        poll_stats = waiter.scheduler.stats.to_dict()
+        if waiter.pending:
+            yield self.create_text_message(
+                f"⚠️ Timeout: {len(waiter.pending)} of {len(parts_by_task)} parts still processing. "
+                f"Use the 'wait_for_results' tool with task IDs {', '.join(waiter.pending)} to collect them."
+            )
+            yield self.create_json_message({
+                'success': True,
+                'status': 'processing',
+                'pending_task_ids': list(waiter.pending),
+                'client_split': manifest,
+                'poll_stats': poll_stats,
+            })
+            return
 
-        except requests.exceptions.RequestException as e:
-            yield self.create_text_message(f"❌ Network error: {str(e)}")
-        except Exception as e:
-            yield self.create_text_message(f"❌ Error: {str(e)}")
+        failed = [part for part in parts if part.get('status') != 'completed']
+        if failed:
+            yield self.create_text_message(
+                f"⚠️ Warning: {len(failed)} part(s) failed; their pages are marked in the merged document"
+            )
+        status_result = {
+            'success': True,
+            'status': 'partial' if failed else 'completed',
+            'file_name': file_name,
+            'client_split': manifest,
+            'data': {'content': stitch_parts(parts)},
+        }
+        extra = {'poll_stats': poll_stats}
+        if route is not None:
+            extra['route'] = route
+        yield from self._completed_messages(status_result, extra, **output)
+
+    def _part_messages(self, part: dict[str, Any], part_count: int) -> Generator[ToolInvokeMessage]:
+        """Emit one finished part of a client-side split document."""
+        label = f"Part {part['part_index'] + 1}/{part_count} (pages {part['first_page']}-{part['last_page']})"
+        if part.get('status') == 'completed':
+            yield self.create_text_message(f"📄 {label} ready")
+        else:
+            yield self.create_text_message(f"⚠️ {label} failed: {part.get('error_message')}")
+        yield self.create_json_message({**part, 'part_count': part_count})
+
+    def _subtask_messages(self, part: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """Emit one finished part of a server-split document ahead of the merged result."""
+        content = part.get('content')
+        if content is None:
+            yield self.create_text_message(f"⚠️ {part_label(part)} completed but its content is unavailable")
+        else:
+            yield self.create_text_message(f"📄 {part_label(part)} ready ({len(content)} characters)")
+        yield self.create_json_message(part)
+
+    def _resumable_messages(
+        self, task_id: str, task_status: str, resume_token: str, deadline: float, scheduler: PollScheduler
+    ) -> Generator[ToolInvokeMessage]:
+        """Emit the continuation result returned when a wait outlives this invocation."""
+        remaining = max(int(deadline - time.time()), 0)
+        yield self.create_text_message(
+            f"⏸️ Task {task_id} is still {task_status}. Waiting paused before the plugin request limit; "
+            f"run this tool again with resume_token '{resume_token}' to keep waiting "
+            f"(up to {remaining}s left) without resubmitting."
+        )
+        yield self.create_json_message({
+            'success': True,
+            'status': 'resumable',
+            'task_id': task_id,
+            'task_status': task_status,
+            'resume_token': resume_token,
+            'remaining_seconds': remaining,
+            'poll_stats': scheduler.stats.to_dict(),
+            'metrics': (current_metrics() or InvocationMetrics('parse_document')).snapshot('resumable'),
+        })
+        yield self.create_variable_message('resume_token', resume_token)
+
+    def _completed_messages(
+        self,
+        status_result: dict[str, Any],
+        extra: dict[str, Any],
+        output_mode: str = 'full',
+        chunk_size: int = 0,
+        chunk_max_tokens: int | None = None,
+        client: TianshuClient | None = None,
+    ) -> Generator[ToolInvokeMessage]:
+        """
+        Emit the completion summary, content preview and JSON result for a finished task.
+        ``client`` is given for tasks whose content the server can stream.
+        """
+        metrics = current_metrics() or InvocationMetrics('parse_document')
+        metrics.start_phase('emit')
+        # Check if parent task
+        if status_result.get('is_parent'):
+            subtask_progress = status_result.get('subtask_progress', {})
+            total = subtask_progress.get('total', 0)
+            yield self.create_text_message(
+                f"✅ All {total} parts merged successfully!"
+            )
+        elif status_result.get('client_split'):
+            total = len(status_result['client_split']['parts'])
+            yield self.create_text_message(f"✅ {total} parts merged in page order!")
+        else:
+            yield self.create_text_message(f"✅ Processing completed!")
+
+        # Get the markdown content with smart truncation
+        data_field = status_result.get('data', {})
+        if chunk_max_tokens and data_field and 'content' in data_field:
+            # RAG-ready chunks alongside the raw markdown
+            extra = {**extra, 'chunks': chunk_markdown(data_field['content'], chunk_max_tokens)}
+        # Chunked results slice the inlined content, or stream it from the server when it is missing
+        chunks = None
+        if output_mode == 'chunked':
+            chunks = content_chunks(client, status_result.get('task_id', ''), chunk_size, data_field or {})
+        if chunks is not None:
+            task_id = status_result.get('task_id', '')
+            chunk_count = total_length = 0
+            for offset, text in chunks:
+                if chunk_count == 0:
+                    yield self.create_text_message(
+                        f"\n📄 **Parsed Document (Preview):**\n\n{text[:5000]}\n\n"
+                        f"... _(Full content follows as JSON chunk messages.)_"
+                    )
+                yield self.create_json_message(chunk_payload(task_id, chunk_count, offset, text))
+                chunk_count += 1
+                total_length = offset + len(text)
+
+            # The final result carries chunk totals instead of another copy of the content
+            yield self.create_json_message({
+                **compact_result(status_result),
+                **extra,
+                'chunk_count': chunk_count,
+                'chunk_size': chunk_size,
+                'total_length': total_length,
+                'metrics': metrics.snapshot('completed'),
+            })
+            return
+
+        if data_field and 'content' in data_field:
+            markdown_content = data_field['content']
+
+            # Truncate if content is too large (> 5000 characters)
+            max_preview_length = 5000
+            if len(markdown_content) > max_preview_length:
+                truncated_content = markdown_content[:max_preview_length]
+                yield self.create_text_message(
+                    f"\n📄 **Parsed Document (Preview - {max_preview_length} characters):**\n\n"
+                    f"{truncated_content}\n\n"
+                    f"... _(Content truncated. Total length: {len(markdown_content)} characters. "
+                    f"Full content is available in the JSON response below.)_"
+                )
+            else:
+                yield self.create_text_message(f"\n📄 **Parsed Document:**\n\n{markdown_content}")
+        else:
+            yield self.create_text_message("⚠️ Task completed but no content found. The result files may have been cleaned up.")
+
+        # Return API raw response directly
+        yield self.create_json_message({**status_result, **extra, 'metrics': metrics.snapshot('completed')})
@@ -0,0 +1,218 @@
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any
+import time
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.utils.cache import ResultCache, get_result_cache
+from tools.utils.client import TianshuClient
+from tools.utils.metrics import current_metrics, instrumented, propagate
+from tools.utils.resume import REQUEST_BUDGET, WaitStateStore
+from tools.utils.routing import get_server_pool, pin_task
+from tools.utils.submit import build_submit_data, find_reusable_task, parse_options, submit_upload_once
+from tools.utils.upload import acquire_file
+
+# Upper bound for concurrent uploads, kept below the client's connection pool size
+MAX_CONCURRENCY = 16
+# Seconds a paused batch can be resumed for
+RESUME_TTL = 3600
+
+
+class ParseDocumentsBatchTool(Tool):
+    """
+    Batch document submission tool.
+    Submits many documents concurrently and returns a task_id manifest immediately.
+    """
+
+    @instrumented('parse_documents_batch')
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # The runtime kills the request at MAX_REQUEST_TIMEOUT; uploads not started
+        # by then are left for a resumed call
+        invocation_end = time.time() + REQUEST_BUDGET
+
+        # API server(s), API key and SSL setting from credentials; the pool's
+        # keep-alive clients are shared across invocations
+        try:
+            pool = get_server_pool(self.runtime.credentials)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        # Get parameters
+        files = tool_parameters.get('files') or []
+        if not isinstance(files, list):
+            files = [files]
+        priority = tool_parameters.get('priority', 0)
+        use_cache = tool_parameters.get('use_cache', True)
+        resume_token = (tool_parameters.get('resume_token') or '').strip()
+
+        # Convert and validate max_concurrency
+        try:
+            max_concurrency = int(tool_parameters.get('max_concurrency', 4))
+            if max_concurrency < 1 or max_concurrency > MAX_CONCURRENCY:
+                yield self.create_text_message(f"Error: max_concurrency must be between 1 and {MAX_CONCURRENCY}")
+                return
+        except (ValueError, TypeError):
+            yield self.create_text_message("Error: max_concurrency must be a valid number")
+            return
+
+        if not files:
+            yield self.create_text_message("Error: No files provided")
+            return
+
+        try:
+            data = build_submit_data(tool_parameters, priority)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+        cache = get_result_cache() if use_cache else None
+
+        # A resumed batch keeps the entries of files handled by earlier calls
+        store = WaitStateStore(self.session)
+        file_names = [getattr(file, 'filename', None) or '' for file in files]
+        entries: list[dict[str, Any]] = [{} for _ in files]
+        if resume_token:
+            state = store.load(resume_token)
+            if state is None:
+                yield self.create_text_message("❌ Error: Resume token not found or expired")
+                return
+            if state.get('file_names') != file_names:
+                yield self.create_text_message("❌ Error: Resume token belongs to a different set of files")
+                return
+            for entry in state.get('tasks') or []:
+                entries[entry['index']] = entry
+        pending = [index for index, entry in enumerate(entries) if not entry]
+
+        yield self.create_text_message(
+            f"📤 Submitting {len(pending)} document(s) with up to {max_concurrency} concurrent uploads..."
+        )
+
+        start_time = time.time()
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(pending))) as executor:
+                futures = {
+                    executor.submit(
+                        propagate(self._submit_one), pool.choose(), cache, files[index], data, invocation_end
+                    ): index
+                    for index in pending
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index = futures[future]
+                    result = future.result()
+                    if result is None:
+                        continue
+                    entry = {'index': index, **result}
+                    entries[index] = entry
+                    if entry['success']:
+                        yield self.create_text_message(
+                            f"✅ [{done}/{len(pending)}] {entry['file_name']} → {entry['task_id']}"
+                        )
+                    else:
+                        yield self.create_text_message(
+                            f"❌ [{done}/{len(pending)}] {entry['file_name']}: {entry['error']}"
+                        )
+
+        finished = [entry for entry in entries if entry]
+        task_ids = [entry['task_id'] for entry in finished if entry['success']]
+        failed = len(finished) - len(task_ids)
+        deferred = len(entries) - len(finished)
+        yield self.create_text_message(
+            f"📋 Submitted {len(task_ids)}/{len(entries)} document(s)"
+            + (f", {failed} failed" if failed else "")
+            + f" in {time.time() - start_time:.1f}s"
+        )
+
+        manifest = {
+            'total': len(entries),
+            'submitted': len(task_ids),
+            'failed': failed,
+            'pending': deferred,
+            'elapsed_seconds': round(time.time() - start_time, 3),
+            'task_ids': task_ids,
+            'tasks': finished,
+        }
+        if deferred:
+            # Out of time for this call: save what was done so a resumed call submits only the rest
+            resume_token = store.save({
+                'tasks': finished,
+                'file_names': file_names,
+                'deadline': time.time() + RESUME_TTL,
+            }, resume_token or None)
+            manifest['resume_token'] = resume_token
+            yield self.create_text_message(
+                f"⏸️ {deferred} document(s) were not started before the plugin request limit. "
+                f"Run this tool again with the same files and resume_token '{resume_token}' to submit them."
+            )
+        elif resume_token:
+            store.delete(resume_token)
+        if cache is not None:
+            manifest['cache'] = cache.stats()
+        metrics = current_metrics()
+        if metrics is not None:
+            manifest['metrics'] = metrics.snapshot(
+                'resumable' if deferred else 'submitted' if not failed else 'partial'
+            )
+        yield self.create_json_message(manifest)
+        yield self.create_variable_message('task_ids', task_ids)
+        if deferred:
+            yield self.create_variable_message('resume_token', resume_token)
+
+    @staticmethod
+    def _submit_one(
+        client: TianshuClient,
+        cache: ResultCache | None,
+        file: Any,
+        data: dict[str, str],
+        start_by: float,
+    ) -> dict[str, Any] | None:
+        """
+        Acquire and submit one file; never raises so one failure cannot stop the batch.
+        Returns None without touching the file once ``start_by`` has passed.
+        """
+        if time.time() >= start_by:
+            return None
+        file_name = getattr(file, 'filename', None) or ''
+        api_server_url = client.api_server_url
+        entry = {
+            'file_name': file_name,
+            'task_id': None,
+            'api_server_url': api_server_url,
+            'success': False,
+            'cached': False,
+            'coalesced': False,
+            'submit_latency_ms': None,
+            'error': None,
+        }
+        start_time = time.time()
+        upload = None
+        try:
+            if not file_name:
+                raise ValueError("File object exists but filename is missing")
+
+            upload, entry['acquisition'] = acquire_file(client, file)
+            if not upload.size:
+                raise ValueError("Could not obtain file content through any method")
+
+            cache_key = None
+            if cache is not None:
+                cache_key = cache.document_key(api_server_url, upload.sha256, parse_options(data))
+                cached_task_id = find_reusable_task(client, cache, api_server_url, cache_key)
+                if cached_task_id:
+                    pin_task(cached_task_id, api_server_url)
+                    entry.update({'task_id': cached_task_id, 'success': True, 'cached': True})
+                    return entry
+
+            result, shared = submit_upload_once(client, file_name, upload, data)
+            pin_task(result['task_id'], api_server_url)
+            entry.update({'task_id': result['task_id'], 'success': True, 'coalesced': shared})
+            if cache is not None:
+                cache.put(cache_key, {'task_id': result['task_id']})
+        except Exception as e:
+            entry['error'] = str(e)
+        finally:
+            if upload is not None:
+                upload.close()
+            entry['submit_latency_ms'] = round((time.time() - start_time) * 1000, 1)
+        return entry
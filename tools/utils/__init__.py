@@ -0,0 +1,3 @@
+"""
+Shared helpers for the MinerU Tianshu tools and provider.
+"""
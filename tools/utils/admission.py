@@ -0,0 +1,306 @@
+"""
+Client-side admission control for task submissions.
+
+Every submission passes through ``admit`` before it is uploaded:
+
+- A token bucket per server smooths bursts to ``TIANSHU_SUBMIT_RATE``
+  submissions per second, allowing up to ``TIANSHU_SUBMIT_BURST`` at once.
+- Concurrency caps bound the uploads in flight per server
+  (``TIANSHU_SUBMIT_CONCURRENCY``) and per API key
+  (``TIANSHU_KEY_CONCURRENCY``). Submissions waiting for a slot get it in
+  priority order, then soonest deadline first, so interactive requests
+  overtake bulk jobs queued behind the same cap.
+- ``TIANSHU_ADMISSION_MODE`` optionally checks the server's queue depth
+  first: ``wait`` holds the submission until the queue is shorter than
+  ``TIANSHU_MAX_QUEUE_DEPTH``, ``deprioritize`` submits it at priority 0.
+
+A limit set to 0 is disabled. A submission that cannot be admitted within
+``TIANSHU_ADMISSION_MAX_WAIT`` seconds fails with ``AdmissionError``; a
+queue that stays long only delays it by that much. The rate-limit token of
+a submission that never reaches the server (no slot was granted, or the
+connection was never made) is refunded.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from typing import Any
+
+import requests
+
+from tools.utils.client import TianshuClient
+from tools.utils.resilience import request_not_sent
+from tools.utils.routing import STATS_TTL, read_queue_depth
+
+SUBMIT_RATE = float(os.environ.get('TIANSHU_SUBMIT_RATE', 10))
+SUBMIT_BURST = int(os.environ.get('TIANSHU_SUBMIT_BURST', 20))
+SERVER_CONCURRENCY = int(os.environ.get('TIANSHU_SUBMIT_CONCURRENCY', 16))
+KEY_CONCURRENCY = int(os.environ.get('TIANSHU_KEY_CONCURRENCY', 32))
+ADMISSION_MODE = os.environ.get('TIANSHU_ADMISSION_MODE', 'off')
+MAX_QUEUE_DEPTH = int(os.environ.get('TIANSHU_MAX_QUEUE_DEPTH', 50))
+ADMISSION_MAX_WAIT = float(os.environ.get('TIANSHU_ADMISSION_MAX_WAIT', 30))
+QUEUE_RECHECK_INTERVAL = 2.0
+
+
+class AdmissionError(Exception):
+    """
+    Raised when a submission cannot be admitted within the allowed wait.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket with reservations: a caller takes a token even when the
+    bucket is empty and is told how long to wait before using it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> float:
+        """
+        Take a token and return the seconds to wait before using it.
+
+        Raises ``AdmissionError`` (taking nothing) when that exceeds ``max_wait``.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise AdmissionError(
+                    f"Submission rate limit of {self.rate:g}/s reached; retry in {wait:.0f}s"
+                )
+            self.tokens -= 1
+            return wait
+
+    def refund(self) -> None:
+        """Give back a reserved token that was never used for a submission."""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class PrioritySlots:
+    """
+    Counting semaphore that hands free slots to waiters by priority (highest
+    first), then deadline (soonest first), then arrival.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[int, float, int]] = []
+        self._arrivals = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+    def acquire(self, priority: int = 0, deadline: float | None = None, timeout: float = 0) -> bool:
+        """Wait up to ``timeout`` seconds for a slot; returns whether one was taken."""
+        entry = (-priority, deadline if deadline is not None else math.inf, next(self._arrivals))
+        give_up_at = time.monotonic() + max(timeout, 0)
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while self.in_use >= self.size or self._waiters[0] != entry:
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.in_use += 1
+                return True
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                # The next waiter in line may now be at the head
+                self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+
+class ServerAdmission:
+    """
+    Admission state of one server: rate limit, concurrency cap, cached queue depth and counters.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bucket = TokenBucket(SUBMIT_RATE, SUBMIT_BURST) if SUBMIT_RATE > 0 else None
+        self.slots = PrioritySlots(SERVER_CONCURRENCY) if SERVER_CONCURRENCY > 0 else None
+        self.depth: int | None = None
+        self.depth_at = 0.0
+        self._lock = threading.Lock()
+        self.counters = {
+            'admitted': 0, 'delayed': 0, 'rejected': 0, 'deprioritized': 0, 'wait_seconds': 0.0,
+        }
+
+    def queue_depth(self, client: TianshuClient, refresh: bool = False) -> int | None:
+        """The server's queue depth, re-read at most every STATS_TTL seconds; None if unknown."""
+        now = time.monotonic()
+        if refresh or now - self.depth_at >= STATS_TTL:
+            try:
+                depth = read_queue_depth(client)
+            except (requests.exceptions.RequestException, ValueError):
+                # A failed probe never blocks submissions
+                depth = None
+            with self._lock:
+                self.depth, self.depth_at = depth, time.monotonic()
+        return self.depth
+
+    def record(self, wait: float, deprioritized: bool) -> None:
+        with self._lock:
+            self.counters['admitted'] += 1
+            self.counters['delayed'] += 1 if wait > 0 else 0
+            self.counters['deprioritized'] += 1 if deprioritized else 0
+            self.counters['wait_seconds'] = round(self.counters['wait_seconds'] + wait, 3)
+
+    def record_rejection(self) -> None:
+        with self._lock:
+            self.counters['rejected'] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            snapshot = {'api_server_url': self.name, 'queue_depth': self.depth, **self.counters}
+        snapshot['waiting'] = self.slots.waiting if self.slots is not None else 0
+        return snapshot
+
+
+_servers: dict[str, ServerAdmission] = {}
+_key_slots: dict[str, PrioritySlots] = {}
+_registry_lock = threading.Lock()
+
+
+def get_admission(api_server_url: str) -> ServerAdmission:
+    key = api_server_url.rstrip('/')
+    with _registry_lock:
+        admission = _servers.get(key)
+        if admission is None:
+            admission = _servers[key] = ServerAdmission(key)
+        return admission
+
+
+def _key_semaphore(api_key: str) -> PrioritySlots | None:
+    if KEY_CONCURRENCY <= 0:
+        return None
+    with _registry_lock:
+        slots = _key_slots.get(api_key)
+        if slots is None:
+            slots = _key_slots[api_key] = PrioritySlots(KEY_CONCURRENCY)
+        return slots
+
+
+@contextmanager
+def _hold(
+    slots: PrioritySlots, priority: int, deadline: float | None, timeout: float, what: str
+) -> Iterator[None]:
+    if not slots.acquire(priority, deadline, timeout):
+        raise AdmissionError(f"Too many submissions in flight {what}; try again later")
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+@contextmanager
+def admit(
+    client: TianshuClient, data: dict[str, str], deadline: float | None = None
+) -> Iterator[dict[str, Any]]:
+    """
+    Hold an admission for one submission to ``client``'s server.
+
+    ``deadline`` (a ``time.time()`` value, e.g. when a synchronous caller
+    stops waiting) ranks the submission among waiters of equal priority.
+    Yields a ticket with the form ``data`` to submit (priority lowered in
+    ``deprioritize`` mode), the seconds spent waiting and the queue depth
+    seen. Raises ``AdmissionError`` when the submission cannot be admitted
+    within ``ADMISSION_MAX_WAIT`` seconds.
+    """
+    admission = get_admission(client.api_server_url)
+    priority = submit_priority(data)
+    started = time.monotonic()
+    give_up_at = started + ADMISSION_MAX_WAIT
+    ticket: dict[str, Any] = {'data': data, 'wait_seconds': 0.0, 'queue_depth': None, 'deprioritized': False}
+
+    try:
+        if ADMISSION_MODE in ('wait', 'deprioritize'):
+            depth = admission.queue_depth(client)
+            if ADMISSION_MODE == 'wait':
+                # Hold back while the queue is long; give up waiting (not submitting) at the deadline
+                while depth is not None and depth >= MAX_QUEUE_DEPTH and time.monotonic() < give_up_at:
+                    time.sleep(min(QUEUE_RECHECK_INTERVAL, max(give_up_at - time.monotonic(), 0)))
+                    depth = admission.queue_depth(client, refresh=True)
+            elif depth is not None and depth >= MAX_QUEUE_DEPTH and priority > 0:
+                ticket['data'] = {**data, 'priority': '0'}
+                ticket['deprioritized'] = True
+            ticket['queue_depth'] = depth
+
+        if admission.bucket is not None:
+            wait = admission.bucket.reserve(max(give_up_at - time.monotonic(), 0))
+            if wait > 0:
+                time.sleep(wait)
+
+        try:
+            with ExitStack() as stack:
+                if admission.slots is not None:
+                    stack.enter_context(_hold(
+                        admission.slots, priority, deadline, give_up_at - time.monotonic(), 'to this server'
+                    ))
+                key_slots = _key_semaphore(client.api_key)
+                if key_slots is not None:
+                    stack.enter_context(_hold(
+                        key_slots, priority, deadline, give_up_at - time.monotonic(), 'for this API key'
+                    ))
+
+                ticket['wait_seconds'] = round(time.monotonic() - started, 2)
+                admission.record(ticket['wait_seconds'], ticket['deprioritized'])
+                yield ticket
+        except Exception as e:
+            # A submission that never reached the server leaves its token for the next one
+            if admission.bucket is not None and (
+                isinstance(e, AdmissionError)
+                or isinstance(e, requests.exceptions.RequestException) and request_not_sent(e)
+            ):
+                admission.bucket.refund()
+            raise
+    except AdmissionError:
+        admission.record_rejection()
+        raise
+
+
+def submit_priority(data: dict[str, str]) -> int:
+    try:
+        return int(data.get('priority') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def ticket_summary(ticket: dict[str, Any]) -> dict[str, Any]:
+    """The reportable part of an admission ticket."""
+    return {key: value for key, value in ticket.items() if key != 'data'}
+
+
+def admission_stats() -> list[dict[str, Any]]:
+    """Admission counters for every server submitted to in this process."""
+    with _registry_lock:
+        return [admission.snapshot() for admission in _servers.values()]
+
+
+def reset_admission() -> None:
+    with _registry_lock:
+        _servers.clear()
+        _key_slots.clear()
@@ -0,0 +1,250 @@
+"""
+Client-side backend selection for ``backend=auto`` submissions.
+
+The plugin has the whole file before it uploads, so instead of leaving
+``auto`` to the server it can look at the document and pick a backend and
+method itself:
+
+- born-digital PDFs (a text layer on the sampled pages) go to ``pipeline``
+  with ``method=txt``, which skips OCR entirely
+- scanned PDFs and images go to whichever OCR-capable backend
+  (``pipeline`` with ``method=ocr``, ``paddleocr-vl``,
+  ``paddleocr-vl-vllm``) has been finishing tasks fastest, judged by its
+  median queue wait plus processing time for this many pages (see
+  ``tools.utils.timeline``)
+- audio, video, FASTA and GenBank files go to ``sensevoice``, ``video``,
+  ``fasta`` and ``genbank``
+- anything else (Office files, text, unknown formats) stays ``auto``
+
+Only backends the server is known to run are chosen: those listed in
+``TIANSHU_ROUTING_BACKENDS``, plus any backend the plugin has seen complete a
+task. A small share of OCR submissions (``TIANSHU_ROUTING_EXPLORE``) tries an
+eligible backend without history, so new backends get measured. Routing is
+turned off with ``TIANSHU_BACKEND_ROUTING=off``; an explicit backend or
+method from the caller is never overridden. ``pypdf`` (used to count pages
+and find a text layer) is optional: without it PDFs stay ``auto``.
+"""
+import os
+import random
+from typing import Any
+
+from tools.utils.pdf_split import PdfSplitError, is_pdf, open_pdf
+from tools.utils.timeline import get_timeline
+from tools.utils.upload import SpooledUpload
+
+BACKEND_ROUTING = os.environ.get('TIANSHU_BACKEND_ROUTING', 'on').lower() not in ('off', 'false', '0', 'no')
+# paddleocr-vl-vllm needs a separate engine, so it is used once configured here or seen working
+ROUTING_BACKENDS = tuple(
+    backend.strip() for backend in os.environ.get(
+        'TIANSHU_ROUTING_BACKENDS', 'pipeline,paddleocr-vl,sensevoice,video,fasta,genbank'
+    ).split(',') if backend.strip()
+)
+ROUTING_EXPLORE = float(os.environ.get('TIANSHU_ROUTING_EXPLORE', 0.05))
+
+# Pages sampled for a text layer, and the characters per page that count as one
+TEXT_SAMPLE_PAGES = 3
+MIN_TEXT_CHARS_PER_PAGE = 50
+
+# OCR-capable (backend, method) pairs, in order of preference without history
+OCR_ROUTES = (('pipeline', 'ocr'), ('paddleocr-vl', 'auto'), ('paddleocr-vl-vllm', 'auto'))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp', '.gif', '.jp2')
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.opus', '.wma', '.amr')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.webm', '.flv', '.wmv', '.m4v', '.mpeg', '.mpg')
+FASTA_EXTENSIONS = ('.fasta', '.fa', '.fna', '.ffn', '.faa', '.frn')
+GENBANK_EXTENSIONS = ('.gb', '.gbk', '.genbank')
+KIND_BACKENDS = {'audio': 'sensevoice', 'video': 'video', 'fasta': 'fasta', 'genbank': 'genbank'}
+
+
+def sniff_kind(file_name: str, head: bytes) -> str:
+    """
+    Classify a file as pdf, image, audio, video, fasta, genbank, office or
+    other from its first bytes, falling back to its extension.
+    """
+    extension = os.path.splitext(file_name.lower())[1]
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith((b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'BM', b'II*\x00', b'MM\x00*')):
+        return 'image'
+    if head[:4] == b'RIFF':
+        return {b'WEBP': 'image', b'WAVE': 'audio', b'AVI ': 'video'}.get(head[8:12], 'other')
+    if head.startswith((b'ID3', b'fLaC', b'OggS', b'\xff\xfb', b'\xff\xf3', b'\xff\xf2')):
+        return 'audio'
+    if head[4:8] == b'ftyp':
+        # ISO media: M4A is audio, the other brands are video
+        return 'audio' if head[8:12] in (b'M4A ', b'M4B ') else 'video'
+    if head.startswith(b'\x1aE\xdf\xa3'):
+        return 'video'
+    if head.startswith((b'PK\x03\x04', b'\xd0\xcf\x11\xe0')):
+        return 'office'
+    if head.startswith(b'LOCUS') or extension in GENBANK_EXTENSIONS:
+        return 'genbank'
+    if extension in FASTA_EXTENSIONS:
+        return 'fasta'
+    for kind, extensions in (('image', IMAGE_EXTENSIONS), ('audio', AUDIO_EXTENSIONS), ('video', VIDEO_EXTENSIONS)):
+        if extension in extensions:
+            return kind
+    return 'other'
+
+
+def inspect_pdf(upload: SpooledUpload) -> tuple[int | None, bool | None]:
+    """(page count, whether the sampled pages have a text layer); (None, None) when unreadable."""
+    try:
+        reader = open_pdf(upload)
+    except PdfSplitError:
+        return None, None
+    page_count = len(reader.pages)
+    if not page_count:
+        return 0, False
+    # First, middle and last pages, so a scanned body behind a digital cover is noticed
+    sampled = sorted({0, page_count // 2, page_count - 1})[:TEXT_SAMPLE_PAGES]
+    characters = 0
+    for index in sampled:
+        try:
+            characters += len((reader.pages[index].extract_text() or '').strip())
+        except Exception:
+            return page_count, None
+    return page_count, characters >= MIN_TEXT_CHARS_PER_PAGE * len(sampled)
+
+
+class BackendRoute:
+    """
+    The backend and method chosen for one submission, and why.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        method: str,
+        reason: str,
+        file_kind: str | None = None,
+        pages: int | None = None,
+        text_layer: bool | None = None,
+        routed: bool = False,
+        estimated_seconds: float | None = None,
+    ):
+        self.backend = backend
+        self.method = method
+        self.reason = reason
+        self.file_kind = file_kind
+        self.pages = pages
+        self.text_layer = text_layer
+        self.routed = routed
+        self.estimated_seconds = estimated_seconds
+
+    def apply(self, tool_parameters: dict[str, Any]) -> dict[str, Any]:
+        """Tool parameters with the chosen backend and method, for ``build_submit_data``."""
+        if not self.routed:
+            return tool_parameters
+        return {**tool_parameters, 'backend': self.backend, 'method': self.method}
+
+    def track(self, task_id: str) -> None:
+        """Let the task's completion time count towards its backend's seconds per page."""
+        if self.pages:
+            get_timeline().expect_pages(task_id, self.pages)
+
+    def to_dict(self) -> dict[str, Any]:
+        route = {
+            'backend': self.backend,
+            'method': self.method,
+            'routed': self.routed,
+            'reason': self.reason,
+            'file_kind': self.file_kind,
+            'pages': self.pages,
+            'text_layer': self.text_layer,
+        }
+        if self.estimated_seconds is not None:
+            route['estimated_seconds'] = round(self.estimated_seconds, 3)
+        return route
+
+
+def available_backends() -> set[str]:
+    """Backends the server is configured with or has been seen completing tasks on."""
+    return set(ROUTING_BACKENDS) | set(get_timeline().backends())
+
+
+def _estimated_seconds(backend: str, pages: int | None) -> float | None:
+    """Median time to completion on ``backend`` for a document of ``pages`` pages."""
+    profile = get_timeline().backend_profile(backend)
+    if profile is None:
+        return None
+    processing = profile['processing_seconds']
+    if pages and 'seconds_per_page' in profile:
+        processing = profile['seconds_per_page'] * pages
+    return profile['queue_wait_seconds'] + processing
+
+
+def _fastest_ocr_route(pages: int | None, available: set[str]) -> tuple[str, str, str, float | None]:
+    """(backend, method, reason, estimate) of the OCR-capable backend expected to finish first."""
+    candidates = [(backend, method) for backend, method in OCR_ROUTES if backend in available]
+    if not candidates:
+        return 'auto', 'auto', 'no OCR-capable backend is known to be available', None
+
+    estimates = {backend: _estimated_seconds(backend, pages) for backend, _ in candidates}
+    measured = [(estimates[backend], backend, method) for backend, method in candidates if estimates[backend] is not None]
+    unmeasured = [(backend, method) for backend, method in candidates if estimates[backend] is None]
+
+    if unmeasured and (not measured or random.random() < ROUTING_EXPLORE):
+        backend, method = unmeasured[0]
+        reason = 'no history yet' if not measured else 'exploring a backend without history'
+        return backend, method, reason, None
+    estimate, backend, method = min(measured)
+    others = ', '.join(f"{other} ~{round(seconds)}s" for seconds, other, _ in sorted(measured) if other != backend)
+    reason = f"fastest measured ({backend} ~{round(estimate)}s" + (f"; {others})" if others else ")")
+    return backend, method, reason, estimate
+
+
+def choose_backend(file_name: str, upload: SpooledUpload, tool_parameters: dict[str, Any]) -> BackendRoute:
+    """Pick the backend and method for a submission whose backend is ``auto``."""
+    backend = tool_parameters.get('backend', 'auto')
+    method = tool_parameters.get('method', 'auto')
+    if backend != 'auto':
+        return BackendRoute(backend, method, 'backend chosen by the caller')
+    if not BACKEND_ROUTING:
+        return BackendRoute(backend, method, 'client-side routing is disabled')
+
+    upload.seek(0)
+    head = upload.read(16)
+    upload.seek(0)
+    kind = sniff_kind(file_name, head)
+    available = available_backends()
+
+    if kind in KIND_BACKENDS:
+        target = KIND_BACKENDS[kind]
+        if target not in available:
+            return BackendRoute(backend, method, f"{kind} file, but {target} is not known to be available", kind)
+        return BackendRoute(
+            target, method, f"{kind} file", kind, routed=True,
+            estimated_seconds=_estimated_seconds(target, None),
+        )
+
+    if kind not in ('pdf', 'image'):
+        return BackendRoute(backend, method, f"{kind} file: left to the server", kind)
+
+    pages, text_layer = (1, False) if kind == 'image' else (None, None)
+    if kind == 'pdf' and is_pdf(upload):
+        pages, text_layer = inspect_pdf(upload)
+        upload.seek(0)
+        if pages is None:
+            return BackendRoute(backend, method, 'PDF could not be inspected: left to the server', kind)
+
+    if text_layer:
+        if 'pipeline' not in available:
+            return BackendRoute(
+                backend, method, 'PDF has a text layer, but pipeline is not known to be available',
+                kind, pages, text_layer,
+            )
+        # The text layer is read directly, so no OCR backend is needed
+        return BackendRoute(
+            'pipeline', method if method != 'auto' else 'txt', 'PDF has a text layer', kind, pages, text_layer,
+            routed=True, estimated_seconds=_estimated_seconds('pipeline', pages),
+        )
+
+    target, ocr_method, reason, estimate = _fastest_ocr_route(pages, available)
+    description = 'image' if kind == 'image' else 'scanned PDF'
+    if target == 'auto':
+        return BackendRoute(backend, method, f"{description}: {reason}", kind, pages, text_layer)
+    return BackendRoute(
+        target, method if method != 'auto' else ocr_method, f"{description}: {reason}", kind, pages, text_layer,
+        routed=True, estimated_seconds=estimate,
+    )
@@ -0,0 +1,208 @@
+"""
+Content-hash result cache.
+
+Documents are keyed by the SHA-256 of their bytes plus the normalized parse
+options, and map to the Tianshu task that parsed them. Completed task results
+are cached separately by task_id, so a resubmitted document returns its
+markdown immediately, and a document whose task is still running attaches to
+that task instead of uploading again.
+
+Entries live in an in-memory LRU bounded by count, bytes and TTL, with an
+optional on-disk tier enabled through ``TIANSHU_CACHE_DIR``.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+CACHE_MAX_ENTRIES = int(os.environ.get('TIANSHU_CACHE_MAX_ENTRIES', 512))
+CACHE_MAX_BYTES = int(os.environ.get('TIANSHU_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get('TIANSHU_CACHE_TTL', 24 * 3600))
+CACHE_DIR = os.environ.get('TIANSHU_CACHE_DIR', '')
+CACHE_DISK_MAX_BYTES = int(os.environ.get('TIANSHU_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of JSON-serializable values with TTL and an optional disk tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: float = CACHE_TTL,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = CACHE_DISK_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, tuple[float, int, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # Keys
+
+    @staticmethod
+    def document_key(api_server_url: str, sha256: str, options: dict[str, Any]) -> str:
+        normalized = json.dumps(options, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(f"{api_server_url}\n{sha256}\n{normalized}".encode('utf-8')).hexdigest()
+        return f"doc:{digest}"
+
+    @staticmethod
+    def task_key(api_server_url: str, task_id: str) -> str:
+        digest = hashlib.sha256(f"{api_server_url}\n{task_id}".encode('utf-8')).hexdigest()
+        return f"task:{digest}"
+
+    # Public API
+
+    def get(self, key: str) -> Any | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, size, payload = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(payload)
+                self._remove(key)
+
+            payload = self._disk_get(key, now)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, payload, now)
+            return json.loads(payload)
+
+    def put(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            self._insert(key, payload, now)
+            self._disk_put(key, payload)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            path = self._disk_path(key)
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'disk_tier': bool(self.disk_dir),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    # Memory tier (lock held)
+
+    def _insert(self, key: str, payload: str, now: float) -> None:
+        self._remove(key)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (now, size, payload)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    # Disk tier (lock held)
+
+    def _disk_path(self, key: str) -> str | None:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, key.replace(':', '_') + '.json')
+
+    def _disk_get(self, key: str, now: float) -> str | None:
+        path = self._disk_path(key)
+        if not path:
+            return None
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, payload: str) -> None:
+        path = self._disk_path(key)
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._disk_prune()
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _disk_prune(self) -> None:
+        """Drop the least recently written files once the disk tier exceeds its budget."""
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+_cache: ResultCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """The process-wide result cache shared by all tools."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(disk_dir=CACHE_DIR or None)
+        return _cache
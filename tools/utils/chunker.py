@@ -0,0 +1,279 @@
+"""
+RAG-ready semantic chunking of parsed markdown.
+
+``MarkdownChunker`` is a single-pass, push-based parser: text is fed in
+arbitrary pieces (the whole document, or the bounded chunks streamed by
+``tools.utils.content``) and finished chunks are returned as soon as they are
+complete, so memory stays proportional to one chunk rather than the document.
+
+Chunks break at headings and are bounded by an estimated token budget.
+Tables (markdown and HTML), display formulas and code blocks are never split;
+an atomic block larger than the budget becomes a chunk of its own. Each
+chunk carries a stable content-derived id and its heading path.
+
+Source pages come only from ``<!-- page: N -->`` markers. The Tianshu API
+returns plain markdown without page-level data, so the markers exist only
+in documents the plugin split into page ranges itself (``split_pages``, see
+``tools.utils.pdf_split.stitch_parts``), where each part is anchored at its
+first page. For any other result a chunk's ``pages`` is None.
+"""
+import hashlib
+import math
+import re
+from collections.abc import Iterator
+from typing import Any
+
+DEFAULT_MAX_TOKENS = 512
+MIN_MAX_TOKENS = 64
+MAX_MAX_TOKENS = 8192
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_PAGE_MARKER = re.compile(r'^\s*<!--\s*page[:\s]\s*(\d+)\s*-->\s*$', re.IGNORECASE)
+_CODE_FENCE = re.compile(r'^\s*(```|~~~)')
+# Zero-width, so splitting loses no characters
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？；;])')
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free estimate: one token per CJK character, ~4 characters otherwise."""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def parse_chunking_options(tool_parameters: dict[str, Any]) -> int | None:
+    """
+    Return the chunk token budget when ``semantic_chunks`` is enabled, else None.
+
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    enabled = tool_parameters.get('semantic_chunks', False)
+    if isinstance(enabled, str):
+        enabled = enabled.lower() in ('true', '1', 'yes')
+    if not enabled:
+        return None
+    try:
+        max_tokens = int(tool_parameters.get('chunk_max_tokens') or DEFAULT_MAX_TOKENS)
+    except (TypeError, ValueError):
+        raise ValueError("chunk_max_tokens must be a valid number")
+    if max_tokens < MIN_MAX_TOKENS or max_tokens > MAX_MAX_TOKENS:
+        raise ValueError(f"chunk_max_tokens must be between {MIN_MAX_TOKENS} and {MAX_MAX_TOKENS}")
+    return max_tokens
+
+
+class MarkdownChunker:
+    """
+    Incremental markdown chunker. Call ``feed`` with successive pieces of text
+    and ``close`` at the end; both return the chunks completed so far.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self._partial = ''
+        self._offset = 0
+        self._page: int | None = None
+        self._headings: list[tuple[int, str]] = []
+        self._seen_ids: dict[str, int] = {}
+        self._index = 0
+        self._ready: list[dict[str, Any]] = []
+
+        # Block being assembled from lines
+        self._block_type: str | None = None
+        self._block_lines: list[str] = []
+        self._block_start = 0
+        self._block_page: int | None = None
+        self._fence: str | None = None
+
+        # Chunk being assembled from blocks
+        self._blocks: list[tuple[str, str, int]] = []
+        self._chunk_tokens = 0
+        self._chunk_start = 0
+        self._chunk_end = 0
+        self._chunk_headings: list[str] = []
+        self._chunk_pages: list[int] = []
+
+    def feed(self, text: str) -> list[dict[str, Any]]:
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+            self._offset += len(line) + 1
+        return self._take()
+
+    def close(self) -> list[dict[str, Any]]:
+        if self._partial:
+            self._line(self._partial)
+            self._offset += len(self._partial)
+            self._partial = ''
+        self._end_block()
+        self._flush()
+        return self._take()
+
+    def _take(self) -> list[dict[str, Any]]:
+        ready, self._ready = self._ready, []
+        return ready
+
+    # Line level: group lines into blocks
+
+    def _line(self, line: str) -> None:
+        stripped = line.strip()
+
+        if self._fence is not None:
+            self._block_lines.append(line)
+            if self._fence in stripped:
+                self._fence = None
+                self._end_block()
+            return
+
+        page_marker = _PAGE_MARKER.match(line)
+        if page_marker:
+            self._end_block()
+            self._page = int(page_marker.group(1))
+            return
+
+        if not stripped:
+            self._end_block()
+            return
+
+        heading = _HEADING.match(line)
+        if heading:
+            self._end_block()
+            # Headings always start a new chunk
+            self._flush()
+            level = len(heading.group(1))
+            self._headings = [h for h in self._headings if h[0] < level] + [(level, heading.group(2))]
+            self._start_block('heading', line)
+            self._end_block()
+            return
+
+        if stripped.startswith('$$'):
+            self._end_block()
+            self._start_block('formula', line)
+            if stripped == '$$' or not stripped.endswith('$$') or len(stripped) < 4:
+                self._fence = '$$'
+            else:
+                self._end_block()
+            return
+
+        code_fence = _CODE_FENCE.match(line)
+        if code_fence:
+            self._end_block()
+            self._start_block('code', line)
+            self._fence = code_fence.group(1)
+            return
+
+        if stripped.startswith('<table'):
+            self._end_block()
+            self._start_block('table', line)
+            if '</table>' in stripped:
+                self._end_block()
+            else:
+                self._fence = '</table>'
+            return
+
+        if stripped.startswith('|'):
+            if self._block_type != 'table':
+                self._end_block()
+                self._start_block('table', line)
+            else:
+                self._block_lines.append(line)
+            return
+
+        if self._block_type != 'paragraph':
+            self._end_block()
+            self._start_block('paragraph', line)
+        else:
+            self._block_lines.append(line)
+
+    def _start_block(self, block_type: str, line: str) -> None:
+        self._block_type = block_type
+        self._block_lines = [line]
+        self._block_start = self._offset
+        self._block_page = self._page
+
+    def _end_block(self) -> None:
+        if self._block_type is None:
+            return
+        block_type, text = self._block_type, '\n'.join(self._block_lines)
+        start, page = self._block_start, self._block_page
+        self._block_type, self._block_lines = None, []
+
+        tokens = estimate_tokens(text)
+        if block_type == 'paragraph' and tokens > self.max_tokens:
+            for piece_start, piece in self._split_paragraph(text, start):
+                self._add_block('paragraph', piece, piece_start, page)
+        else:
+            self._add_block(block_type, text, start, page)
+
+    def _split_paragraph(self, text: str, start: int) -> Iterator[tuple[int, str]]:
+        """Split an oversized paragraph at sentence ends (or hard limits) into budget-sized pieces."""
+        max_chars = self.max_tokens * 4
+        piece, piece_start, position = '', start, start
+        for sentence in _SENTENCE_END.split(text):
+            while sentence:
+                part, sentence = sentence[:max_chars], sentence[max_chars:]
+                if piece and estimate_tokens(piece + part) > self.max_tokens:
+                    yield piece_start, piece
+                    piece, piece_start = '', position
+                piece += part
+                position += len(part)
+        if piece:
+            yield piece_start, piece
+
+    # Block level: pack blocks into chunks
+
+    def _add_block(self, block_type: str, text: str, start: int, page: int | None) -> None:
+        tokens = estimate_tokens(text)
+        only_headings = all(b[0] == 'heading' for b in self._blocks)
+        # Keep headings attached to the content that follows them
+        if self._blocks and not only_headings and self._chunk_tokens + tokens > self.max_tokens:
+            self._flush()
+        if not self._blocks:
+            self._chunk_start = start
+            self._chunk_headings = [title for _, title in self._headings]
+        self._blocks.append((block_type, text, tokens))
+        self._chunk_tokens += tokens
+        self._chunk_end = start + len(text)
+        if page is not None:
+            self._chunk_pages.append(page)
+
+    def _flush(self) -> None:
+        if not self._blocks:
+            return
+        text = '\n\n'.join(block[1] for block in self._blocks)
+        digest = hashlib.sha1(('\x1f'.join(self._chunk_headings) + '\x00' + text).encode()).hexdigest()[:16]
+        # Identical chunks under identical headings get an occurrence suffix
+        occurrence = self._seen_ids.get(digest, 0) + 1
+        self._seen_ids[digest] = occurrence
+        chunk_id = digest if occurrence == 1 else f"{digest}-{occurrence}"
+
+        types = list(dict.fromkeys(block[0] for block in self._blocks))
+        self._ready.append({
+            'id': chunk_id,
+            'index': self._index,
+            'text': text,
+            'tokens': self._chunk_tokens,
+            'headings': list(self._chunk_headings),
+            'pages': [min(self._chunk_pages), max(self._chunk_pages)] if self._chunk_pages else None,
+            'block_types': types,
+            'char_start': self._chunk_start,
+            'char_end': self._chunk_end,
+        })
+        self._index += 1
+        self._blocks, self._chunk_tokens, self._chunk_pages = [], 0, []
+
+
+def chunk_markdown(text: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> list[dict[str, Any]]:
+    """Chunk a complete markdown document."""
+    chunker = MarkdownChunker(max_tokens)
+    return chunker.feed(text) + chunker.close()
+
+
+def tee_chunks(
+    chunks: Iterator[tuple[int, str]], chunker: MarkdownChunker, out: list[dict[str, Any]]
+) -> Iterator[tuple[int, str]]:
+    """Pass (offset, text) content chunks through while feeding them to ``chunker``."""
+    for offset, text in chunks:
+        out.extend(chunker.feed(text))
+        yield offset, text
+    out.extend(chunker.close())
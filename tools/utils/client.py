@@ -0,0 +1,296 @@
+"""
+Pooled HTTP client for the MinerU Tianshu API.
+
+Every tool invocation and the provider's credential check share one client per
+(api_server_url, verify_ssl, api_key) in the plugin process, so file downloads,
+task submissions and status polls reuse keep-alive connections instead of
+opening a new TCP+TLS connection for every request.
+"""
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from tools.utils.compression import CompressionStats, response_encodings
+from tools.utils.metrics import current_metrics, trace_headers
+from tools.utils.resilience import ResilientCaller, get_resilience
+
+# Pool sizing and idle eviction, overridable through the plugin environment
+POOL_CONNECTIONS = int(os.environ.get('TIANSHU_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.environ.get('TIANSHU_POOL_MAXSIZE', 20))
+IDLE_TIMEOUT = float(os.environ.get('TIANSHU_POOL_IDLE_TIMEOUT', 300))
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters for new vs. reused pooled connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_checkout(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused_connections': max(self.requests - self.new_connections, 0),
+            }
+
+
+def _counting_pool_class(base: type[HTTPConnectionPool], stats: ConnectionStats) -> type[HTTPConnectionPool]:
+    """Build a urllib3 pool class that reports connection checkouts to ``stats``."""
+
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.record_new_connection()
+            return super()._new_conn()
+
+        def _get_conn(self, timeout=None):
+            stats.record_checkout()
+            return super()._get_conn(timeout)
+
+    CountingPool.__name__ = f"Counting{base.__name__}"
+    return CountingPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools count new vs. reused connections.
+    """
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+
+class TianshuClient:
+    """
+    Keep-alive HTTP client bound to one Tianshu API server.
+
+    API calls (``get``/``post``) are resolved against ``api_server_url``, carry
+    the ``X-API-Key`` header and go through the server's retry/circuit-breaker
+    layer; ``download`` fetches arbitrary URLs (e.g. Dify file URLs) over the
+    same pooled session without leaking the API key.
+    """
+
+    def __init__(
+        self,
+        api_server_url: str,
+        verify_ssl: bool = True,
+        api_key: str = '',
+        pool_connections: int | None = None,
+        pool_maxsize: int | None = None,
+    ):
+        self.api_server_url = api_server_url.rstrip('/')
+        self.verify_ssl = verify_ssl
+        self.api_key = api_key or ''
+        self.connection_stats = ConnectionStats()
+        self.compression_stats = CompressionStats()
+        self.last_used = time.monotonic()
+        # Requests running now, including streamed responses not yet closed
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Optional server features discovered at runtime (e.g. batch status endpoint)
+        self.capabilities: dict[str, bool] = {}
+
+        self.session = requests.Session()
+        # Let the server compress responses with the best encoding we can decode
+        self.session.headers['Accept-Encoding'] = response_encodings()
+        adapter = CountingHTTPAdapter(
+            self.connection_stats,
+            pool_connections=pool_connections or POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or POOL_MAXSIZE,
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path: str) -> str:
+        """Resolve an API path (or pass through an absolute URL)."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.api_server_url}/{path.lstrip('/')}"
+
+    @property
+    def resilience(self) -> ResilientCaller:
+        """Retry and circuit-breaker state shared with every other client of this server."""
+        return get_resilience(self.api_server_url)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {}
+        if self.api_key:
+            headers['X-API-Key'] = self.api_key
+        return headers
+
+    @property
+    def busy(self) -> bool:
+        """Whether a request or streamed transfer is running on this client."""
+        with self._in_flight_lock:
+            return self._in_flight > 0
+
+    def _finish_request(self) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+        self.last_used = time.monotonic()
+
+    def _tracked(self, send: Callable[[], requests.Response], stream: bool) -> requests.Response:
+        """
+        Run ``send`` counted as in flight, so the client is not evicted as idle
+        mid-transfer. A streamed response stays in flight until it is closed.
+        """
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            response = send()
+        except BaseException:
+            self._finish_request()
+            raise
+        if not stream:
+            self._finish_request()
+            return response
+
+        close = response.close
+        pending = [True]
+
+        def close_and_finish() -> None:
+            try:
+                close()
+            finally:
+                with self._in_flight_lock:
+                    finishing, pending[:] = bool(pending), []
+                if finishing:
+                    self._finish_request()
+
+        response.close = close_and_finish
+        return response
+
+    def _api_kwargs(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+        self.last_used = time.monotonic()
+        kwargs.setdefault('verify', self.verify_ssl)
+        kwargs['headers'] = {**self.headers, **trace_headers(), **(kwargs.get('headers') or {})}
+        return kwargs
+
+    @staticmethod
+    def _record_transfer(kwargs: dict[str, Any], response: requests.Response) -> None:
+        """Count an API call's body bytes against the running tool invocation."""
+        metrics = current_metrics()
+        if metrics is None:
+            return
+        body = kwargs.get('data')
+        sent = len(body) if hasattr(body, '__len__') else 0
+        if kwargs.get('json') is not None:
+            sent = len(json.dumps(kwargs['json']))
+        received = 0
+        if getattr(response, '_content_consumed', False) is True and isinstance(response.content, bytes):
+            received = len(response.content)
+        metrics.record_transfer(sent, received)
+
+    def get(self, path: str, hedge: bool = False, **kwargs) -> requests.Response:
+        """GET an API path; ``hedge`` allows a duplicate request when the first is slow."""
+        url, kwargs = self.url(path), self._api_kwargs(kwargs)
+        response = self._tracked(
+            lambda: self.resilience.call(lambda: self.session.get(url, **kwargs), idempotent=True, hedge=hedge),
+            bool(kwargs.get('stream')),
+        )
+        self.compression_stats.record_response(response)
+        self._record_transfer(kwargs, response)
+        return response
+
+    def post(self, path: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        """POST to an API path; only ``idempotent`` calls are retried after reaching the server."""
+        url, kwargs = self.url(path), self._api_kwargs(kwargs)
+        rewind = getattr(kwargs.get('data'), 'rewind', None)
+        response = self._tracked(
+            lambda: self.resilience.call(
+                lambda: self.session.post(url, **kwargs), idempotent=idempotent, rewind=rewind
+            ),
+            bool(kwargs.get('stream')),
+        )
+        self.compression_stats.record_response(response)
+        self._record_transfer(kwargs, response)
+        return response
+
+    def download(self, url: str, **kwargs) -> requests.Response:
+        """GET a non-API URL over the pooled session, without API credentials."""
+        self.last_used = time.monotonic()
+        kwargs.setdefault('verify', self.verify_ssl)
+        return self._tracked(lambda: self.session.get(url, **kwargs), bool(kwargs.get('stream')))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'api_server_url': self.api_server_url,
+            **self.connection_stats.snapshot(),
+            'resilience': self.resilience.snapshot(),
+            'compression': self.compression_stats.snapshot(),
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_clients: dict[tuple[str, bool, str], TianshuClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _evict_idle_clients(now: float) -> None:
+    """
+    Close clients that have not been used for IDLE_TIMEOUT seconds and have
+    no request or streamed transfer running (lock held).
+    """
+    for key, client in list(_clients.items()):
+        if now - client.last_used > IDLE_TIMEOUT and not client.busy:
+            del _clients[key]
+            client.close()
+
+
+def get_client(api_server_url: str, verify_ssl: bool = True, api_key: str = '') -> TianshuClient:
+    """
+    Return the process-wide client for this server/credential combination,
+    creating it on first use and evicting clients that have gone idle.
+    """
+    key = (api_server_url.rstrip('/'), bool(verify_ssl), api_key or '')
+    with _clients_lock:
+        _evict_idle_clients(time.monotonic())
+        client = _clients.get(key)
+        if client is None:
+            client = TianshuClient(key[0], verify_ssl=key[1], api_key=key[2])
+            _clients[key] = client
+        client.last_used = time.monotonic()
+        return client
+
+
+def get_client_stats() -> list[dict[str, Any]]:
+    """Connection counters for every live client in the process."""
+    with _clients_lock:
+        return [client.stats() for client in _clients.values()]
+
+
+def close_all_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
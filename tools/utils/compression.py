@@ -0,0 +1,177 @@
+"""
+Compression of API traffic.
+
+Responses: every client advertises the encodings it can decode (``zstd``
+when the optional ``zstandard`` package is installed, then ``gzip`` and
+``deflate``), so a server or proxy that compresses JSON sends status
+payloads with full markdown and ``originData`` compressed.
+
+Uploads (opt-in): with ``TIANSHU_UPLOAD_COMPRESSION`` set to ``gzip`` or
+``zstd``, submissions of compressible documents (text and markup, legacy
+Office files, uncompressed images) are sent with a compressed body and a
+``Content-Encoding`` header. The Tianshu server (or a proxy in front of it)
+must accept compressed request bodies. Already-compressed formats (PDF,
+Office Open XML and other ZIP containers, JPEG/PNG, media) are sent as is,
+and so is any body that does not shrink by at least ``MIN_SAVING``.
+"""
+import os
+import threading
+import zlib
+from collections.abc import Iterator
+from typing import Any
+
+import requests
+
+try:
+    from urllib3.response import HAS_ZSTD
+except ImportError:
+    # urllib3 1.x cannot decode zstd
+    HAS_ZSTD = False
+
+from tools.utils.upload import CHUNK_SIZE, MultipartEncoder, SpooledUpload
+
+UPLOAD_COMPRESSION = os.environ.get('TIANSHU_UPLOAD_COMPRESSION', 'off')
+# Smaller uploads are not worth the CPU time
+MIN_COMPRESS_SIZE = int(os.environ.get('TIANSHU_MIN_COMPRESS_SIZE', 16 * 1024))
+# Fraction of the body a compressed upload must save to be used
+MIN_SAVING = 0.1
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.txt', '.md', '.markdown', '.html', '.htm', '.xml', '.json', '.csv', '.tsv', '.rtf', '.svg',
+    '.doc', '.xls', '.ppt', '.bmp', '.tif', '.tiff', '.pnm', '.ppm', '.pgm',
+)
+# Magic numbers of containers that are already compressed (ZIP covers docx/xlsx/pptx/odt)
+COMPRESSED_SIGNATURES = (b'PK\x03\x04', b'%PDF-', b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'\x1f\x8b', b'(\xb5/\xfd')
+
+
+def response_encodings() -> str:
+    """The ``Accept-Encoding`` value for API requests, best encoding first."""
+    return ', '.join((['zstd'] if HAS_ZSTD else []) + ['gzip', 'deflate'])
+
+
+def upload_encoding() -> str | None:
+    """The configured upload encoding, falling back to gzip when zstd is unavailable."""
+    if UPLOAD_COMPRESSION not in ('gzip', 'zstd'):
+        return None
+    if UPLOAD_COMPRESSION == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return 'gzip'
+    return UPLOAD_COMPRESSION
+
+
+def is_compressible(file_name: str, upload: SpooledUpload) -> bool:
+    """Whether a document is likely to shrink: a compressible type that is not already compressed."""
+    if upload.size < MIN_COMPRESS_SIZE:
+        return False
+    upload.seek(0)
+    head = upload.read(8)
+    upload.seek(0)
+    if head.startswith(COMPRESSED_SIGNATURES):
+        return False
+    return file_name.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def _compressor(encoding: str) -> Any:
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    # wbits=31 writes a gzip container
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+class CompressedBody:
+    """
+    Compressed request body spooled ahead of time, so its length is known and
+    it can be rewound for a retry like ``MultipartEncoder``.
+    """
+
+    def __init__(self, spool: SpooledUpload, encoding: str, raw_size: int):
+        self.spool = spool
+        self.encoding = encoding
+        self.raw_size = raw_size
+        self.rewind()
+
+    def __len__(self) -> int:
+        return self.spool.size
+
+    def rewind(self) -> None:
+        self.spool.seek(0)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.spool.read(size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self.spool.close()
+
+
+def compress_body(encoder: MultipartEncoder, encoding: str) -> CompressedBody | None:
+    """
+    Compress a multipart body; None when it does not save at least ``MIN_SAVING``.
+
+    The encoder is rewound either way, ready to be sent uncompressed.
+    """
+    compressor = _compressor(encoding)
+    spool = SpooledUpload()
+    try:
+        encoder.rewind()
+        for chunk in encoder:
+            spool.write(compressor.compress(chunk))
+        spool.write(compressor.flush())
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        encoder.rewind()
+
+    if spool.size > len(encoder) * (1 - MIN_SAVING):
+        spool.close()
+        return None
+    return CompressedBody(spool, encoding, len(encoder))
+
+
+class CompressionStats:
+    """
+    Thread-safe counters for bytes sent and received with and without compression.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = {'compressed': 0, 'raw_bytes': 0, 'wire_bytes': 0}
+        self.responses = {'compressed': 0, 'decoded_bytes': 0, 'wire_bytes': 0}
+
+    def record_upload(self, raw_bytes: int, wire_bytes: int) -> None:
+        with self._lock:
+            self.uploads['compressed'] += 1
+            self.uploads['raw_bytes'] += raw_bytes
+            self.uploads['wire_bytes'] += wire_bytes
+
+    def record_response(self, response: requests.Response) -> None:
+        """Count a fully read response that arrived compressed."""
+        encoding = response.headers.get('Content-Encoding')
+        if not isinstance(encoding, str) or encoding.lower() == 'identity':
+            return
+        if getattr(response, '_content_consumed', False) is not True:
+            return
+        wire_bytes = getattr(response.raw, 'tell', lambda: None)()
+        if not isinstance(wire_bytes, int) or not isinstance(response.content, bytes):
+            return
+        with self._lock:
+            self.responses['compressed'] += 1
+            self.responses['decoded_bytes'] += len(response.content)
+            self.responses['wire_bytes'] += wire_bytes
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            uploads, responses = dict(self.uploads), dict(self.responses)
+        uploads['saved_bytes'] = uploads['raw_bytes'] - uploads['wire_bytes']
+        responses['saved_bytes'] = responses['decoded_bytes'] - responses['wire_bytes']
+        return {'uploads': uploads, 'responses': responses}
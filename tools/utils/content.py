@@ -0,0 +1,143 @@
+"""
+Bounded-size emission of parsed markdown.
+
+Results can be returned in three output modes:
+
+- ``full``: the original behaviour, with the markdown both in
+  ``markdown_content`` and inside ``originData``.
+- ``compact``: the same, but ``originData`` drops its copy of ``data.content``.
+- ``chunked``: the markdown is emitted as a sequence of JSON chunk messages
+  (index, character offset, text), each at most ``chunk_size`` characters.
+
+In chunked mode markdown the status payload already inlines as
+``data.content`` is sliced in place. Only when it is absent (or flagged
+``content_truncated``) is it read incrementally from the server's content
+endpoint, decoding the streamed body as it arrives, so the whole document
+never has to sit in one string.
+"""
+import codecs
+import os
+from collections.abc import Iterator
+from typing import Any
+
+import requests
+
+from tools.utils.client import TianshuClient
+
+CONTENT_PATH = '/api/v1/tasks/{task_id}/content'
+OUTPUT_MODES = ('full', 'compact', 'chunked')
+DEFAULT_CHUNK_SIZE = int(os.environ.get('TIANSHU_CONTENT_CHUNK_SIZE', 100000))
+MIN_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 1000000
+# Bytes read from the network per iteration while streaming content
+READ_SIZE = 64 * 1024
+
+
+def parse_output_options(
+    tool_parameters: dict[str, Any], modes: tuple[str, ...] = OUTPUT_MODES
+) -> tuple[str, int]:
+    """
+    Read and validate ``output_mode`` and ``chunk_size`` from tool parameters.
+
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    output_mode = tool_parameters.get('output_mode') or 'full'
+    if output_mode not in modes:
+        raise ValueError(f"output_mode must be one of: {', '.join(modes)}")
+    try:
+        chunk_size = int(tool_parameters.get('chunk_size') or DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError("chunk_size must be a valid number")
+    if chunk_size < MIN_CHUNK_SIZE or chunk_size > MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} characters")
+    return output_mode, chunk_size
+
+
+def compact_result(result: dict[str, Any]) -> dict[str, Any]:
+    """Shallow copy of an API result without ``data.content``."""
+    data = result.get('data')
+    if not isinstance(data, dict) or 'content' not in data:
+        return result
+    return {**result, 'data': {key: value for key, value in data.items() if key != 'content'}}
+
+
+def origin_data(result: dict[str, Any], output_mode: str) -> dict[str, Any]:
+    """The ``originData`` value for a given output mode."""
+    return result if output_mode == 'full' else compact_result(result)
+
+
+def slice_chunks(content: str, chunk_size: int) -> Iterator[tuple[int, str]]:
+    """Yield (offset, text) slices of a string already in memory."""
+    for offset in range(0, len(content), chunk_size):
+        yield offset, content[offset:offset + chunk_size]
+
+
+def iter_response_chunks(response: requests.Response, chunk_size: int) -> Iterator[tuple[int, str]]:
+    """
+    Decode a streamed UTF-8 response incrementally and yield (offset, text)
+    chunks of ``chunk_size`` characters; only one chunk is buffered at a time.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    pending = ''
+    offset = 0
+    try:
+        for raw in response.iter_content(chunk_size=READ_SIZE):
+            pending += decoder.decode(raw)
+            while len(pending) >= chunk_size:
+                yield offset, pending[:chunk_size]
+                offset += chunk_size
+                pending = pending[chunk_size:]
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield offset, pending
+    finally:
+        response.close()
+
+
+def stream_content(client: TianshuClient, task_id: str, chunk_size: int) -> Iterator[tuple[int, str]] | None:
+    """
+    Open the task's content endpoint as a stream.
+
+    Returns None when the server has no content endpoint (remembered on the
+    client) or no content for the task, so callers can report missing content.
+    """
+    if client.capabilities.get('content_stream') is False:
+        return None
+    response = client.get(CONTENT_PATH.format(task_id=task_id), stream=True, timeout=60)
+    if response.status_code in (405, 501):
+        client.capabilities['content_stream'] = False
+        response.close()
+        return None
+    if response.status_code == 404:
+        # Either the endpoint or the content is missing; neither can be streamed
+        response.close()
+        return None
+    response.raise_for_status()
+    client.capabilities['content_stream'] = True
+    return iter_response_chunks(response, chunk_size)
+
+
+def content_chunks(
+    client: TianshuClient | None, task_id: str, chunk_size: int, data: dict[str, Any]
+) -> Iterator[tuple[int, str]] | None:
+    """
+    (offset, text) chunks of a completed task's markdown: sliced from
+    ``data['content']`` when the payload carries all of it, otherwise streamed
+    from the content endpoint (when a client is given). None when neither
+    source has the content.
+    """
+    if isinstance(data.get('content'), str) and not data.get('content_truncated'):
+        return slice_chunks(data['content'], chunk_size)
+    if client is not None and task_id:
+        return stream_content(client, task_id, chunk_size)
+    return None
+
+
+def chunk_payload(task_id: str, index: int, offset: int, text: str) -> dict[str, Any]:
+    return {
+        'task_id': task_id,
+        'chunk_index': index,
+        'offset': offset,
+        'length': len(text),
+        'content': text,
+    }
@@ -0,0 +1,389 @@
+"""
+Per-invocation metrics and tracing.
+
+Every tool invocation runs under an ``InvocationMetrics`` (see
+``instrumented``) that records where its time went:
+
+- ``download``: fetching the file from its Dify URL
+- ``upload``: admission and the multipart upload to the server
+- ``queued`` / ``processing``: waiting for the task, split at the first
+  status that is no longer ``pending`` (so accurate to one poll interval)
+- ``fetch``: the request that returned the finished result
+- ``emit``: building the tool's output messages
+
+plus the bytes sent to and received from the API, bytes downloaded, API
+calls, status polls and how each input file was obtained. A snapshot is attached to the tool's JSON output
+under ``metrics``; when the invocation ends its numbers are added to
+process-wide histograms and counters, rendered in the Prometheus text
+format by ``prometheus_text`` (served by the plugin's metrics endpoint).
+When ``opentelemetry-api`` is installed, the invocation and each phase are
+also reported as spans to the configured tracer provider.
+
+Each invocation has a trace id that is sent to the Tianshu server with every
+API call, as a W3C ``traceparent`` header and as ``X-Trace-Id``, so server
+logs can be matched with plugin metrics and spans.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+try:
+    from opentelemetry import trace as otel_trace
+    HAS_OTEL = True
+except ImportError:
+    otel_trace = None
+    HAS_OTEL = False
+
+PHASES = ('download', 'upload', 'queued', 'processing', 'fetch', 'emit')
+TRACE_HEADER = 'X-Trace-Id'
+# Histogram bucket bounds in seconds, from quick status calls to long GPU jobs
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_current: contextvars.ContextVar['InvocationMetrics | None'] = contextvars.ContextVar(
+    'tianshu_invocation_metrics', default=None
+)
+
+
+class InvocationMetrics:
+    """
+    Phase timings, byte counts and poll counts of one tool invocation.
+
+    Safe to update from the worker threads of the invocation.
+    """
+
+    def __init__(self, tool: str, trace_id: str | None = None):
+        self.tool = tool
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_id = os.urandom(8).hex()
+        self.started_at = time.time()
+        self.outcome = 'incomplete'
+        self.phases: dict[str, float] = {}
+        # (phase, start, end) in wall-clock seconds, for spans
+        self.intervals: list[tuple[str, float, float]] = []
+        self.bytes = {'downloaded': 0, 'sent': 0, 'received': 0}
+        self.api_calls = 0
+        self.polls = 0
+        # How each input file was obtained (see ``tools.utils.upload.acquire_file``)
+        self.acquisitions: list[dict[str, Any]] = []
+        self.finished_at: float | None = None
+        self._open: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def add_phase(self, name: str, start: float, end: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + max(end - start, 0.0)
+            self.intervals.append((name, start, end))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.time())
+
+    def start_phase(self, name: str) -> None:
+        """Start a phase that ends at a later event; a no-op if it already ran or is running."""
+        with self._lock:
+            if name not in self._open and name not in self.phases:
+                self._open[name] = time.time()
+
+    def end_phase(self, name: str) -> None:
+        with self._lock:
+            start = self._open.pop(name, None)
+        if start is not None:
+            self.add_phase(name, start, time.time())
+
+    def observe_status(self, status: str | None) -> None:
+        """Move between the queued and processing phases as a polled task advances."""
+        if status == 'pending':
+            return
+        self.end_phase('queued')
+        if status == 'processing':
+            self.start_phase('processing')
+        else:
+            self.end_phase('processing')
+
+    def record_transfer(self, sent: int = 0, received: int = 0) -> None:
+        with self._lock:
+            self.api_calls += 1
+            self.bytes['sent'] += sent
+            self.bytes['received'] += received
+
+    def record_download(self, size: int) -> None:
+        with self._lock:
+            self.bytes['downloaded'] += size
+
+    def record_polls(self, count: int = 1) -> None:
+        with self._lock:
+            self.polls += count
+
+    def record_acquisition(self, report: dict[str, Any]) -> None:
+        with self._lock:
+            self.acquisitions.append(dict(report))
+
+    def snapshot(self, outcome: str | None = None) -> dict[str, Any]:
+        """The metrics so far, for a tool's JSON output; running phases count up to now."""
+        now = time.time()
+        with self._lock:
+            if outcome is not None:
+                self.outcome = outcome
+            phases = dict(self.phases)
+            for name, start in self._open.items():
+                phases[name] = phases.get(name, 0.0) + max(now - start, 0.0)
+            snapshot = {
+                'trace_id': self.trace_id,
+                'phases': {name: round(phases[name], 3) for name in PHASES if name in phases},
+                'total_seconds': round((self.finished_at or now) - self.started_at, 3),
+                'bytes': dict(self.bytes),
+                'api_calls': self.api_calls,
+                'polls': self.polls,
+            }
+            if self.acquisitions:
+                snapshot['acquisition'] = [dict(report) for report in self.acquisitions]
+            return snapshot
+
+    def finish(self) -> None:
+        """End running phases and record the invocation in the process-wide metrics (once)."""
+        with self._lock:
+            if self.finished_at is not None:
+                return
+            open_phases = list(self._open)
+        for name in open_phases:
+            self.end_phase(name)
+        with self._lock:
+            self.finished_at = time.time()
+        get_metrics_registry().record(self)
+        if HAS_OTEL:
+            _export_spans(self)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _labels(labels: tuple[tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _le(bound: Any) -> str:
+    return f'le="{bound}"'
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms and counters aggregated from finished invocations.
+    """
+
+    HELP = {
+        'tianshu_invocation_seconds': ('histogram', 'Duration of tool invocations'),
+        'tianshu_phase_seconds': ('histogram', 'Time spent per phase of tool invocations'),
+        'tianshu_bytes_total': ('counter', 'Bytes transferred by tool invocations'),
+        'tianshu_api_calls_total': ('counter', 'Tianshu API calls made by tool invocations'),
+        'tianshu_polls_total': ('counter', 'Task status polls made by tool invocations'),
+        'tianshu_file_acquisitions_total': ('counter', 'Input files obtained, by path (materialized, url, blob)'),
+        'tianshu_task_queue_seconds': ('histogram', 'Time finished tasks waited in the server queue'),
+        'tianshu_task_processing_seconds': ('histogram', 'Time finished tasks spent processing on the server'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+
+    def observe(self, name: str, labels: dict[str, str], value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, labels: dict[str, str], value: float = 1) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self, metrics: InvocationMetrics) -> None:
+        tool = {'tool': metrics.tool}
+        self.observe(
+            'tianshu_invocation_seconds', {**tool, 'outcome': metrics.outcome},
+            metrics.finished_at - metrics.started_at,
+        )
+        for name, seconds in metrics.phases.items():
+            self.observe('tianshu_phase_seconds', {**tool, 'phase': name}, seconds)
+        for direction, size in metrics.bytes.items():
+            if size:
+                self.increment('tianshu_bytes_total', {**tool, 'direction': direction}, size)
+        if metrics.api_calls:
+            self.increment('tianshu_api_calls_total', tool, metrics.api_calls)
+        if metrics.polls:
+            self.increment('tianshu_polls_total', tool, metrics.polls)
+        for report in metrics.acquisitions:
+            self.increment('tianshu_file_acquisitions_total', {**tool, 'path': str(report.get('path'))})
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.count, h.sum, h.buckets) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for name, (kind, help_text) in self.HELP.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (metric, labels), (counts, count, total, buckets) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_labels(labels, _le(bound))} {bucket_count}")
+                lines.append(f"{name}_bucket{_labels(labels, _le('+Inf'))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(round(total, 6))}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+
+def prometheus_text() -> str:
+    return _registry.prometheus_text()
+
+
+def current_metrics() -> InvocationMetrics | None:
+    """The metrics of the invocation running in this context, if any."""
+    return _current.get()
+
+
+def current_snapshot(outcome: str | None = None) -> dict[str, Any] | None:
+    """A snapshot of the current invocation's metrics, or None outside one."""
+    metrics = _current.get()
+    return metrics.snapshot(outcome) if metrics is not None else None
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Time a phase of the current invocation; does nothing outside one."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.phase(name):
+        yield
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Wrap ``fn`` so it runs under the current invocation's metrics, e.g. when it
+    is handed to an executor whose worker threads do not share this context.
+    """
+    metrics = _current.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(metrics)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def trace_headers() -> dict[str, str]:
+    """Headers that carry the current invocation's trace id to the server."""
+    metrics = _current.get()
+    if metrics is None:
+        return {}
+    return {'traceparent': metrics.traceparent, TRACE_HEADER: metrics.trace_id}
+
+
+def instrumented(tool: str) -> Callable:
+    """
+    Decorate a tool's ``_invoke`` so it runs under a fresh ``InvocationMetrics``
+    that is finished (recorded and exported) when the invocation ends.
+    """
+    def decorator(invoke: Callable) -> Callable:
+        @functools.wraps(invoke)
+        def wrapper(self, tool_parameters: dict[str, Any]):
+            metrics = InvocationMetrics(tool)
+            token = _current.set(metrics)
+            try:
+                yield from invoke(self, tool_parameters)
+            finally:
+                metrics.finish()
+                try:
+                    _current.reset(token)
+                except ValueError:
+                    # Closed from another context (e.g. garbage collected elsewhere)
+                    pass
+        return wrapper
+    return decorator
+
+
+def _export_spans(metrics: InvocationMetrics) -> None:
+    """Report an invocation and its phases as OpenTelemetry spans under its trace id."""
+    tracer = otel_trace.get_tracer('mineru-tianshu')
+    parent = otel_trace.NonRecordingSpan(otel_trace.SpanContext(
+        trace_id=int(metrics.trace_id, 16),
+        span_id=int(metrics.span_id, 16),
+        is_remote=True,
+        trace_flags=otel_trace.TraceFlags(otel_trace.TraceFlags.SAMPLED),
+    ))
+    span = tracer.start_span(
+        f"tianshu.{metrics.tool}",
+        context=otel_trace.set_span_in_context(parent),
+        start_time=int(metrics.started_at * 1e9),
+        attributes={
+            'tianshu.outcome': metrics.outcome,
+            'tianshu.polls': metrics.polls,
+            'tianshu.api_calls': metrics.api_calls,
+            **{f"tianshu.bytes.{direction}": size for direction, size in metrics.bytes.items()},
+        },
+    )
+    context = otel_trace.set_span_in_context(span)
+    for name, start, end in metrics.intervals:
+        tracer.start_span(f"tianshu.{name}", context=context, start_time=int(start * 1e9)).end(int(end * 1e9))
+    span.end(int(metrics.finished_at * 1e9))
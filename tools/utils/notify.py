@@ -0,0 +1,111 @@
+"""
+Push-based task completion.
+
+When a callback URL is configured, submissions ask the Tianshu server to POST
+to the plugin's ``tianshu_callback`` endpoint once a task finishes. The
+endpoint hands the notification to the in-process ``CompletionRegistry``,
+which wakes any invocation waiting on that task_id. Waiters then fetch the
+status once from the API, so a callback only ever triggers a poll and never
+supplies the result itself.
+
+Callbacks are best effort: the endpoint may run in another process, or the
+server may not support callbacks at all. Waiters therefore keep the normal
+adaptive polls during the grace window, where most short tasks finish, and
+only later in the wait stretch polls to a sparse backstop interval.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Any
+
+# Seconds of normal adaptive polling before relying on callbacks
+CALLBACK_GRACE = float(os.environ.get('TIANSHU_CALLBACK_GRACE', 60))
+# Minimum seconds between backstop polls once the grace window has passed
+CALLBACK_BACKSTOP = float(os.environ.get('TIANSHU_CALLBACK_BACKSTOP', 30))
+# How long an unclaimed notification is kept for a waiter that registers late
+NOTIFICATION_TTL = float(os.environ.get('TIANSHU_NOTIFICATION_TTL', 600))
+SIGNATURE_HEADER = 'X-Tianshu-Signature'
+
+
+def callback_fields(credentials: dict[str, Any]) -> dict[str, str]:
+    """Submit form fields that request a completion callback, if one is configured."""
+    callback_url = (credentials.get('callback_url') or '').strip()
+    if not callback_url:
+        return {}
+    return {'callback_url': callback_url}
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Check an ``X-Tianshu-Signature`` header; any request passes when no secret is set."""
+    if not secret:
+        return True
+    return bool(signature) and hmac.compare_digest(sign_payload(secret, body), signature)
+
+
+class CompletionRegistry:
+    """
+    Thread-safe map of task_id to completion events.
+
+    ``notify`` may arrive before ``wait`` (a fast task, or a waiter between
+    polls), so notifications are kept until claimed or NOTIFICATION_TTL expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: dict[str, threading.Event] = {}
+        self._notifications: dict[str, tuple[float, dict[str, Any]]] = {}
+        self.callbacks_received = 0
+
+    def _event(self, task_id: str) -> threading.Event:
+        # Lock held by the caller
+        event = self._events.get(task_id)
+        if event is None:
+            event = self._events[task_id] = threading.Event()
+        return event
+
+    def notify(self, task_id: str, payload: dict[str, Any] | None = None) -> None:
+        """Record a completion callback and wake waiters on ``task_id``."""
+        now = time.monotonic()
+        with self._lock:
+            self.callbacks_received += 1
+            for stale_id, (received_at, _) in list(self._notifications.items()):
+                if now - received_at > NOTIFICATION_TTL:
+                    del self._notifications[stale_id]
+                    self._events.pop(stale_id, None)
+            self._notifications[task_id] = (now, payload or {})
+            self._event(task_id).set()
+
+    def wait(self, task_id: str, timeout: float) -> dict[str, Any] | None:
+        """
+        Block up to ``timeout`` seconds for a callback on ``task_id``.
+
+        Returns the callback payload, or None when the timeout passes first.
+        """
+        with self._lock:
+            event = self._event(task_id)
+        if not event.wait(max(timeout, 0)):
+            return None
+        with self._lock:
+            _, payload = self._notifications.pop(task_id, (0.0, {}))
+            event.clear()
+        return payload
+
+    def discard(self, task_id: str) -> None:
+        """Forget a task once its waiter is done with it."""
+        with self._lock:
+            self._events.pop(task_id, None)
+            self._notifications.pop(task_id, None)
+
+
+_registry = CompletionRegistry()
+
+
+def get_completion_registry() -> CompletionRegistry:
+    """The process-wide registry shared by the callback endpoint and the tools."""
+    return _registry
@@ -0,0 +1,125 @@
+"""
+Page selection for submissions.
+
+``page_ranges`` (e.g. ``"1-5, 8, 20-"``, 1-based and inclusive, open-ended
+ranges allowed) and ``max_pages`` restrict a submission to the pages that
+are actually needed. PDFs are trimmed locally before upload, so discarded
+pages cost neither bandwidth nor GPU time. For other formats, or PDFs that
+cannot be read locally, the selection is forwarded on the submit request
+for the server to apply.
+"""
+import re
+from typing import Any
+
+from tools.utils.pdf_split import PdfSplitError, is_pdf, open_pdf, write_pages
+from tools.utils.upload import SpooledUpload
+
+MAX_PAGES_LIMIT = 10000
+
+_RANGE = re.compile(r'^(\d+)\s*(?:-\s*(\d*))?$')
+
+
+def parse_page_selection(tool_parameters: dict[str, Any]) -> tuple[list[tuple[int, int | None]], int]:
+    """
+    Read and validate ``page_ranges`` and ``max_pages``; returns (ranges, max_pages).
+
+    An empty range list selects every page and ``max_pages`` 0 means no limit.
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    ranges: list[tuple[int, int | None]] = []
+    for item in re.split(r'[,;]', str(tool_parameters.get('page_ranges') or '')):
+        item = item.strip()
+        if not item:
+            continue
+        match = _RANGE.match(item)
+        if not match:
+            raise ValueError(f"Invalid page range '{item}'; use e.g. '1-5, 8, 20-'")
+        start = int(match.group(1))
+        end = start if match.group(2) is None else (int(match.group(2)) if match.group(2) else None)
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Invalid page range '{item}'; pages start at 1 and ranges must not be reversed")
+        ranges.append((start, end))
+
+    try:
+        max_pages = int(tool_parameters.get('max_pages') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("max_pages must be a valid number")
+    if max_pages < 0 or max_pages > MAX_PAGES_LIMIT:
+        raise ValueError(f"max_pages must be between 0 and {MAX_PAGES_LIMIT}")
+    return ranges, max_pages
+
+
+def format_page_ranges(ranges: list[tuple[int, int | None]]) -> str:
+    return ','.join(
+        str(start) if end == start else f"{start}-{end if end is not None else ''}" for start, end in ranges
+    )
+
+
+def selected_pages(ranges: list[tuple[int, int | None]], max_pages: int, page_count: int) -> list[int]:
+    """The 1-based pages a selection keeps, in document order and capped at ``max_pages``."""
+    if ranges:
+        pages = sorted({
+            page for start, end in ranges
+            for page in range(start, min(end or page_count, page_count) + 1)
+        })
+    else:
+        pages = list(range(1, page_count + 1))
+    return pages[:max_pages] if max_pages else pages
+
+
+def page_selection_fields(ranges: list[tuple[int, int | None]], max_pages: int) -> dict[str, str]:
+    """Submit form fields that ask the server to apply a page selection."""
+    fields = {}
+    if ranges:
+        fields['page_ranges'] = format_page_ranges(ranges)
+    if max_pages:
+        fields['max_pages'] = str(max_pages)
+    return fields
+
+
+def apply_page_selection(
+    upload: SpooledUpload,
+    ranges: list[tuple[int, int | None]],
+    max_pages: int,
+    data: dict[str, str],
+) -> tuple[SpooledUpload, dict[str, Any] | None]:
+    """
+    Restrict a submission to the selected pages.
+
+    PDFs are rewritten with only those pages and the original spool is closed;
+    otherwise the selection is added to ``data`` for the server. Returns the
+    upload to submit and a summary (None when nothing is selected). Raises
+    ``ValueError`` when the selection matches no page of the document.
+    """
+    if not ranges and not max_pages:
+        return upload, None
+
+    reader = None
+    if is_pdf(upload):
+        try:
+            reader = open_pdf(upload)
+        except PdfSplitError:
+            reader = None
+    if reader is None:
+        return upload, _forward(ranges, max_pages, data)
+
+    page_count = len(reader.pages)
+    pages = selected_pages(ranges, max_pages, page_count)
+    if not pages:
+        raise ValueError(f"page_ranges selects no pages (the document has {page_count} pages)")
+    summary = {'trimmed': len(pages) < page_count, 'page_count': page_count, 'submitted_pages': len(pages)}
+    if len(pages) == page_count:
+        return upload, summary
+
+    try:
+        trimmed = write_pages(reader, pages)
+    except PdfSplitError:
+        return upload, _forward(ranges, max_pages, data)
+    upload.close()
+    return trimmed, summary
+
+
+def _forward(ranges: list[tuple[int, int | None]], max_pages: int, data: dict[str, str]) -> dict[str, Any]:
+    fields = page_selection_fields(ranges, max_pages)
+    data.update(fields)
+    return {'trimmed': False, 'forwarded': fields}
@@ -0,0 +1,126 @@
+"""
+Client-side splitting of large PDFs into page-range parts.
+
+The server only splits a large PDF into subtasks after the whole file has
+been uploaded, so the first pages cannot start processing until the last
+byte has arrived. With client-side splitting the PDF is cut locally into
+parts of ``pages_per_part`` pages, each written to its own spool and
+submitted as soon as it is ready, and the parts' markdown is stitched back
+together in page order with ``<!-- page: N -->`` anchors (the markers
+``tools.utils.chunker`` uses for page references).
+
+``pypdf`` is imported lazily so the other tools never pay for it.
+"""
+import os
+from typing import Any
+
+from tools.utils.upload import SpooledUpload
+
+MAX_PAGES_PER_PART = 500
+# Parts uploaded at the same time
+SPLIT_CONCURRENCY = int(os.environ.get('TIANSHU_SPLIT_CONCURRENCY', 4))
+
+
+class PdfSplitError(Exception):
+    """
+    Raised when a document cannot be split locally; callers fall back to a
+    single upload.
+    """
+
+
+def parse_split_pages(tool_parameters: dict[str, Any]) -> int:
+    """
+    Return ``split_pages`` (pages per part, 0 when splitting is off).
+
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    try:
+        pages_per_part = int(tool_parameters.get('split_pages') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("split_pages must be a valid number")
+    if pages_per_part < 0 or pages_per_part > MAX_PAGES_PER_PART:
+        raise ValueError(f"split_pages must be between 0 and {MAX_PAGES_PER_PART}")
+    return pages_per_part
+
+
+def is_pdf(upload: SpooledUpload) -> bool:
+    upload.seek(0)
+    header = upload.read(5)
+    upload.seek(0)
+    return header == b'%PDF-'
+
+
+def open_pdf(upload: SpooledUpload) -> Any:
+    """Open a spooled PDF for page access without reading it into memory."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise PdfSplitError("client-side splitting requires the 'pypdf' package")
+    try:
+        upload.seek(0)
+        reader = PdfReader(upload)
+        if reader.is_encrypted:
+            raise PdfSplitError("encrypted PDFs cannot be split locally")
+        # Forces the page tree to be read, so broken files fail here
+        len(reader.pages)
+    except PdfSplitError:
+        raise
+    except Exception as e:
+        raise PdfSplitError(f"unreadable PDF: {str(e)}")
+    return reader
+
+
+def plan_parts(page_count: int, pages_per_part: int) -> list[dict[str, Any]]:
+    """Page ranges (1-based, inclusive) covering the document in order."""
+    return [
+        {'part_index': index, 'first_page': first, 'last_page': min(first + pages_per_part - 1, page_count)}
+        for index, first in enumerate(range(1, page_count + 1, pages_per_part))
+    ]
+
+
+def write_pages(reader: Any, page_numbers: list[int]) -> SpooledUpload:
+    """Write the given 1-based pages, in order, into a new spool as a standalone PDF."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    part = SpooledUpload()
+    try:
+        for page_number in page_numbers:
+            writer.add_page(reader.pages[page_number - 1])
+        writer.write(part)
+    except Exception as e:
+        part.close()
+        raise PdfSplitError(f"could not write pages: {str(e)}")
+    part.seek(0)
+    return part
+
+
+def write_part(reader: Any, first_page: int, last_page: int) -> SpooledUpload:
+    """Write pages ``first_page``..``last_page`` into a new spool as a standalone PDF."""
+    return write_pages(reader, list(range(first_page, last_page + 1)))
+
+
+def part_file_name(file_name: str, first_page: int, last_page: int) -> str:
+    stem, _ = os.path.splitext(file_name)
+    return f"{stem}.pages-{first_page}-{last_page}.pdf"
+
+
+def page_anchor(page: int) -> str:
+    return f"<!-- page: {page} -->"
+
+
+def stitch_parts(parts: list[dict[str, Any]]) -> str:
+    """
+    Join the parts' markdown in page order, each preceded by an anchor for its
+    first page. Parts without content leave a marker so the gap is visible.
+    """
+    sections = []
+    for part in parts:
+        content = part.get('content')
+        if content is None:
+            content = (
+                f"<!-- pages {part['first_page']}-{part['last_page']} missing: "
+                f"{part.get('error_message') or part.get('status', 'unknown')} -->"
+            )
+        sections.append(f"{page_anchor(part['first_page'])}\n\n{content.strip()}")
+    return '\n\n'.join(sections)
@@ -0,0 +1,234 @@
+"""
+Poll schedulers for waiting on Tianshu tasks.
+
+A scheduler decides how long to sleep before the next ``/api/v1/tasks/{id}``
+request. The adaptive scheduler polls quickly at first, backs off
+exponentially with jitter up to a cap, and shortens or stretches the wait
+using hints from the server: a ``Retry-After`` header, an ETA or queue
+position in the status payload, or the rate at which
+``subtask_progress.percentage`` advances. Without server hints it falls back
+on how long earlier tasks on the same backend took (see
+``tools.utils.timeline``).
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import requests
+
+# Status payload fields that may carry a server-side ETA, in seconds
+ETA_FIELDS = ('eta_seconds', 'estimated_remaining_seconds', 'estimated_time_remaining', 'eta')
+QUEUE_POSITION_FIELDS = ('queue_position', 'position')
+
+
+class PollStats:
+    """
+    Per-task polling counters.
+    """
+
+    def __init__(self):
+        self.polls = 0
+        self.total_wait = 0.0
+        self.hints: dict[str, int] = {}
+
+    def record_poll(self) -> None:
+        self.polls += 1
+
+    def record_wait(self, delay: float, hint: str) -> None:
+        self.total_wait += delay
+        self.hints[hint] = self.hints.get(hint, 0) + 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'polls': self.polls,
+            'total_wait_seconds': round(self.total_wait, 3),
+            'delay_sources': dict(self.hints),
+        }
+
+
+class PollScheduler:
+    """
+    Base scheduler: subclasses implement ``_delay`` and return (seconds, hint name).
+    """
+
+    def __init__(self):
+        self.stats = PollStats()
+        # Wall-clock time the task is expected to finish, from completion history
+        self.expected_completion: float | None = None
+
+    def record_poll(self) -> None:
+        self.stats.record_poll()
+
+    def expect_completion(self, at: float | None) -> None:
+        self.expected_completion = at
+
+    def next_delay(self, status_result: dict[str, Any], response: requests.Response | None = None) -> float:
+        """Seconds to wait before the next poll, given the latest status."""
+        delay, hint = self._delay(status_result, response)
+        delay = max(delay, 0.0)
+        self.stats.record_wait(delay, hint)
+        return delay
+
+    def _delay(self, status_result: dict[str, Any], response: requests.Response | None) -> tuple[float, str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict[str, Any]:
+        """JSON-serializable poll state, so a wait can be resumed by a later invocation."""
+        return {'polls': self.stats.polls, 'total_wait': self.stats.total_wait, 'hints': dict(self.stats.hints)}
+
+    def restore(self, state: dict[str, Any]) -> None:
+        self.stats.polls = int(state.get('polls', 0))
+        self.stats.total_wait = float(state.get('total_wait', 0.0))
+        self.stats.hints = dict(state.get('hints') or {})
+
+
+class FixedPollScheduler(PollScheduler):
+    """
+    Constant interval polling (the plugin's original 5 second behaviour).
+    """
+
+    def __init__(self, interval: float = 5.0):
+        super().__init__()
+        self.interval = interval
+
+    def _delay(self, status_result, response):
+        return self.interval, 'fixed'
+
+
+def parse_retry_after(response: requests.Response | None) -> float | None:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if response is None or not getattr(response, 'headers', None):
+        return None
+    value = response.headers.get('Retry-After')
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def first_number(payload: dict[str, Any], fields: tuple[str, ...]) -> float | None:
+    """First numeric value found under any of ``fields`` in a status payload."""
+    for field in fields:
+        value = payload.get(field)
+        if isinstance(value, bool):
+            continue
+        try:
+            if value is not None:
+                return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class AdaptivePollScheduler(PollScheduler):
+    """
+    Exponential backoff with jitter, refined by server hints.
+
+    Hints are applied in order of trust: Retry-After (a floor), a server ETA,
+    an estimate from progress percentage, queue position, then the expected
+    completion time from earlier tasks. Without hints the delay grows from
+    ``initial_delay`` by ``multiplier`` up to ``max_delay``.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float = 0.5,
+        multiplier: float = 1.6,
+        max_delay: float = 15.0,
+        min_delay: float = 0.25,
+        jitter: float = 0.2,
+        seconds_per_queue_position: float = 2.0,
+    ):
+        super().__init__()
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.min_delay = min_delay
+        self.jitter = jitter
+        self.seconds_per_queue_position = seconds_per_queue_position
+        self._attempt = 0
+        self._progress: tuple[float, float] | None = None
+
+    def _clamp(self, delay: float) -> float:
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def _backoff(self) -> float:
+        return self._clamp(self.initial_delay * (self.multiplier ** self._attempt))
+
+    def _progress_estimate(self, status_result: dict[str, Any]) -> float | None:
+        """Estimate remaining seconds from how fast the progress percentage moves."""
+        progress = status_result.get('subtask_progress') or {}
+        percentage = first_number(progress, ('percentage',))
+        if percentage is None:
+            return None
+
+        now = time.monotonic()
+        previous, self._progress = self._progress, (now, percentage)
+        if previous is None or percentage <= previous[1] or percentage >= 100:
+            return None
+        rate = (percentage - previous[1]) / max(now - previous[0], 1e-6)
+        return (100 - percentage) / rate
+
+    def _expected_remaining(self, status_result: dict[str, Any]) -> float | None:
+        """Seconds until the expected completion, while the task runs and before it is overdue."""
+        if self.expected_completion is None or status_result.get('status') not in ('pending', 'processing'):
+            return None
+        remaining = self.expected_completion - time.time()
+        return remaining if remaining > 0 else None
+
+    def _delay(self, status_result, response):
+        backoff = self._backoff()
+        self._attempt += 1
+
+        delay, hint = backoff, 'backoff'
+        eta = first_number(status_result, ETA_FIELDS)
+        progress_eta = self._progress_estimate(status_result)
+        queue_position = first_number(status_result, QUEUE_POSITION_FIELDS)
+        expected_remaining = self._expected_remaining(status_result)
+
+        if eta is not None:
+            delay, hint = self._clamp(eta), 'eta'
+        elif progress_eta is not None:
+            # Poll around when the task should finish, but never slower than backoff
+            delay, hint = self._clamp(min(progress_eta, backoff)), 'progress'
+        elif queue_position is not None and status_result.get('status') == 'pending':
+            delay, hint = self._clamp(max(queue_position * self.seconds_per_queue_position, backoff)), 'queue'
+        elif expected_remaining is not None:
+            # Halve the expected remaining time each poll, so an early finish is caught soon
+            delay, hint = self._clamp(max(expected_remaining / 2, backoff)), 'history'
+
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        # Retry-After is a server floor and is honoured even above max_delay
+        retry_after = parse_retry_after(response)
+        if retry_after is not None and retry_after > delay:
+            delay, hint = retry_after, 'retry_after'
+
+        return delay, hint
+
+    def snapshot(self):
+        return {**super().snapshot(), 'attempt': self._attempt}
+
+    def restore(self, state):
+        super().restore(state)
+        self._attempt = int(state.get('attempt', 0))
+
+
+SCHEDULERS: dict[str, type[PollScheduler]] = {
+    'adaptive': AdaptivePollScheduler,
+    'fixed': FixedPollScheduler,
+}
+
+
+def create_scheduler(name: str | None = None, **kwargs) -> PollScheduler:
+    """Build a poll scheduler by name, defaulting to the adaptive one."""
+    scheduler_class = SCHEDULERS.get(name or 'adaptive', AdaptivePollScheduler)
+    return scheduler_class(**kwargs)
@@ -0,0 +1,304 @@
+"""
+Resilience layer for Tianshu API calls.
+
+Every ``TianshuClient.get``/``post`` goes through the ``ResilientCaller`` of
+its server, which is shared by all clients and invocations in the plugin
+process:
+
+- Retries with exponential backoff and jitter. Idempotent calls (GETs, the
+  batch status POST) are retried on transport errors and 429/502/503/504.
+  Other calls (task submission) are only resent when the server cannot have
+  processed them: the connection was never established, or the server
+  answered 429/503. Streamed request bodies are rewound before a resend.
+- A circuit breaker that opens after consecutive failed calls and then fails
+  fast with ``CircuitOpenError`` until a probe request succeeds. A call
+  counts once however many attempts it made: it fails when its last attempt
+  fails, and any answer other than a 5xx counts as a success.
+- Optional hedged GETs (``TIANSHU_HEDGE_DELAY`` > 0): when a status request
+  has not answered within the delay, a second identical request is sent and
+  whichever answers first wins.
+"""
+import os
+import random
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from tools.utils.polling import parse_retry_after
+
+RETRY_ATTEMPTS = int(os.environ.get('TIANSHU_RETRY_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.environ.get('TIANSHU_RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.environ.get('TIANSHU_RETRY_MAX_DELAY', 8))
+BREAKER_THRESHOLD = int(os.environ.get('TIANSHU_BREAKER_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('TIANSHU_BREAKER_RESET_TIMEOUT', 30))
+# Seconds before a slow status GET is hedged; 0 disables hedging
+HEDGE_DELAY = float(os.environ.get('TIANSHU_HEDGE_DELAY', 0))
+
+# Responses worth retrying for idempotent calls
+RETRY_STATUSES = (429, 502, 503, 504)
+# Responses that mean the server did not process the request at all
+NOT_PROCESSED_STATUSES = (429, 503)
+# Responses that count against the circuit breaker
+FAILURE_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without contacting the server while its circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker: closed → open after ``threshold``
+    failures → half-open after ``reset_timeout`` (one probe) → closed again
+    on success, or open again on failure.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            # Half-open: let exactly one probe through
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            return True
+
+    def available(self) -> bool:
+        """Whether a request would be let through now, without claiming the half-open probe."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self._probing
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """Give back a half-open probe without a verdict, so the next request may probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+
+def request_not_sent(error: requests.exceptions.RequestException) -> bool:
+    """True when the request provably never reached the server."""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, CircuitOpenError)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def transient_error(error: requests.exceptions.RequestException) -> bool:
+    """
+    True when a failed request is worth repeating later: the server could not
+    be reached or timed out, the connection broke, the server answered 5xx or
+    429, or its circuit breaker is open. Other 4xx answers (unknown task, bad
+    API key) will not change by asking again.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        status_code = getattr(error.response, 'status_code', None)
+        return not isinstance(status_code, int) or status_code >= 500 or status_code == 429
+    return isinstance(error, (
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError,
+    ))
+
+
+def _close_response(future: Future) -> None:
+    if future.exception() is None:
+        future.result().close()
+
+
+# Runs hedged requests; created on first use so it picks up the runtime's (gevent) threading
+_hedge_executor: ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tianshu-hedge')
+        return _hedge_executor
+
+
+class ResilientCaller:
+    """
+    Retries, circuit breaking and hedging for the API calls of one server.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def call(
+        self,
+        send: Callable[[], requests.Response],
+        idempotent: bool,
+        hedge: bool = False,
+        rewind: Callable[[], None] | None = None,
+    ) -> requests.Response:
+        """
+        Send a request through the breaker, retrying as the call allows.
+
+        Raises ``CircuitOpenError`` while the server's breaker is open and the
+        last ``requests`` exception once retries are exhausted.
+        """
+        self._count('calls')
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"Tianshu API at {self.name} is failing; requests are paused for "
+                    f"{self.breaker.retry_in():.0f}s (circuit breaker open)"
+                )
+
+            try:
+                if attempt > 1 and rewind is not None:
+                    rewind()
+                response = self._hedged(send) if hedge and HEDGE_DELAY > 0 else send()
+            except requests.exceptions.RequestException as e:
+                if attempt == RETRY_ATTEMPTS or not (idempotent or request_not_sent(e)):
+                    # A logical call counts against the breaker once, when its last attempt fails
+                    self.breaker.record_failure()
+                    raise
+                self.breaker.release()
+                delay = self._backoff(attempt)
+            except BaseException:
+                # Not a verdict on the server (e.g. the upload spool failed): free a half-open probe
+                self.breaker.release()
+                raise
+            else:
+                retryable = response.status_code in (RETRY_STATUSES if idempotent else NOT_PROCESSED_STATUSES)
+                retry_after = parse_retry_after(response) if retryable else None
+                # The server may ask for a longer pause than a retry should take
+                final = not retryable or attempt == RETRY_ATTEMPTS or (
+                    retry_after is not None and retry_after > RETRY_MAX_DELAY
+                )
+                if response.status_code not in FAILURE_STATUSES:
+                    self.breaker.record_success()
+                elif final:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if final:
+                    return response
+                delay = max(self._backoff(attempt), retry_after or 0)
+                response.close()
+
+            self._count('retries')
+            time.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with equal jitter."""
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _hedged(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """Send ``send`` and, if it is slow, a second copy; return the first success."""
+        executor = _get_hedge_executor()
+        first = executor.submit(send)
+        try:
+            return first.result(timeout=HEDGE_DELAY)
+        except FutureTimeoutError:
+            pass
+
+        self._count('hedged')
+        second = executor.submit(send)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None:
+                error = next(iter(done)).exception()
+                continue
+            for loser in pending | (done - {winner}):
+                loser.add_done_callback(_close_response)
+            if winner is second:
+                self._count('hedge_wins')
+            return winner.result()
+        raise error
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, 'circuit': self.breaker.snapshot()}
+
+
+_callers: dict[str, ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def get_resilience(api_server_url: str) -> ResilientCaller:
+    """The process-wide caller for a server, shared by every client of it."""
+    key = api_server_url.rstrip('/')
+    with _callers_lock:
+        caller = _callers.get(key)
+        if caller is None:
+            caller = _callers[key] = ResilientCaller(key)
+        return caller
+
+
+def reset_resilience() -> None:
+    with _callers_lock:
+        _callers.clear()
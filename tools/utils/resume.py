@@ -0,0 +1,88 @@
+"""
+Wait-state persistence for resumable synchronous parses.
+
+The plugin runtime kills an invocation after ``MAX_REQUEST_TIMEOUT`` (120 s,
+see ``main.py``) while ``parse_document`` may be asked to wait up to an hour.
+Before the ceiling is reached the tool saves a small record (task_id,
+deadline, poll state) and returns a resume token; a later invocation with
+that token continues waiting on the same task instead of resubmitting it.
+
+``parse_documents_batch`` uses the same store for batches that run out of
+time: its record lists the files already handled, and a call with the same
+files and the token submits only the rest.
+
+Records are written to the plugin's persistent storage when the session
+provides it and are always mirrored in process memory, so resuming works
+both across plugin restarts and when storage is unavailable.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any
+
+# Seconds of waiting allowed per invocation, kept below MAX_REQUEST_TIMEOUT
+# to leave room for the final messages
+REQUEST_BUDGET = float(os.environ.get('TIANSHU_REQUEST_BUDGET', 100))
+STORAGE_PREFIX = 'tianshu:wait:'
+
+_memory: dict[str, dict[str, Any]] = {}
+_memory_lock = threading.Lock()
+
+
+class WaitStateStore:
+    """
+    Saves, loads and deletes wait-state records keyed by resume token.
+    """
+
+    def __init__(self, session: Any = None):
+        self.storage = getattr(session, 'storage', None)
+
+    def save(self, state: dict[str, Any], token: str | None = None) -> str:
+        """Persist ``state`` and return its resume token."""
+        token = token or uuid.uuid4().hex
+        state = {**state, 'updated_at': time.time()}
+        with _memory_lock:
+            _evict_expired(time.time())
+            _memory[token] = state
+        if self.storage is not None:
+            try:
+                self.storage.set(STORAGE_PREFIX + token, json.dumps(state).encode())
+            except Exception:
+                # Storage permission missing or backend unavailable: memory only
+                pass
+        return token
+
+    def load(self, token: str) -> dict[str, Any] | None:
+        """Return the record for ``token``, or None if unknown or expired."""
+        with _memory_lock:
+            state = _memory.get(token)
+        if state is None and self.storage is not None:
+            try:
+                raw = self.storage.get(STORAGE_PREFIX + token)
+                state = json.loads(raw) if isinstance(raw, (bytes, str)) and raw else None
+            except Exception:
+                state = None
+        if not isinstance(state, dict) or not (state.get('task_id') or 'tasks' in state):
+            return None
+        if state.get('deadline', 0) < time.time():
+            self.delete(token)
+            return None
+        return state
+
+    def delete(self, token: str) -> None:
+        with _memory_lock:
+            _memory.pop(token, None)
+        if self.storage is not None:
+            try:
+                self.storage.delete(STORAGE_PREFIX + token)
+            except Exception:
+                pass
+
+
+def _evict_expired(now: float) -> None:
+    """Drop in-memory records whose deadline has passed (lock held)."""
+    for token, state in list(_memory.items()):
+        if state.get('deadline', 0) < now:
+            del _memory[token]
@@ -0,0 +1,293 @@
+"""
+Routing across several Tianshu servers.
+
+The ``api_server_url`` credential may list several servers, separated by
+commas or new lines, each optionally weighted as ``url|weight``. New tasks
+are routed by the ``routing_policy`` credential:
+
+- ``least_queue`` (default): the server with the fewest pending and
+  processing tasks per unit of weight, read from ``/api/v1/queue/stats``
+  (or ``/api/v1/health``) and refreshed every ``TIANSHU_ROUTING_STATS_TTL``
+  seconds.
+- ``round_robin``: servers in turn, ignoring weights.
+- ``weighted``: smooth weighted round-robin.
+
+Servers whose circuit breaker is open, or whose queue probe just failed,
+are ejected until they recover. Every task is pinned to the server that
+created it; task IDs that are not pinned in this process (e.g. after a
+restart) are located by asking each server in turn.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import requests
+
+from tools.utils.client import TianshuClient, get_client
+from tools.utils.resilience import BREAKER_RESET_TIMEOUT
+
+ROUTING_POLICIES = ('least_queue', 'round_robin', 'weighted')
+QUEUE_STATS_PATHS = ('/api/v1/queue/stats', '/api/v1/health')
+STATS_TTL = float(os.environ.get('TIANSHU_ROUTING_STATS_TTL', 5))
+MAX_PINNED_TASKS = int(os.environ.get('TIANSHU_MAX_PINNED_TASKS', 10000))
+
+
+def parse_servers(value: Any) -> list[tuple[str, int]]:
+    """
+    Parse the ``api_server_url`` credential into (url, weight) pairs.
+
+    Raises ``ValueError`` with a user-facing message on invalid input.
+    """
+    servers: dict[str, int] = {}
+    for item in re.split(r'[,;\s]+', str(value or '')):
+        if not item:
+            continue
+        url, _, weight = item.partition('|')
+        url = url.rstrip('/')
+        if not (url.startswith('http://') or url.startswith('https://')):
+            raise ValueError(f"API Server URL must start with http:// or https:// (got '{url}')")
+        try:
+            weight = int(weight) if weight else 1
+        except ValueError:
+            raise ValueError(f"Invalid weight '{weight}' for {url}; use e.g. '{url}|2'")
+        if weight < 1:
+            raise ValueError(f"Weight for {url} must be at least 1")
+        servers[url] = weight
+    if not servers:
+        raise ValueError("API Server URL is not configured")
+    return list(servers.items())
+
+
+def queue_depth(payload: dict[str, Any]) -> int | None:
+    """Pending plus processing tasks from a queue stats or health payload."""
+    stats = payload.get('stats') or payload.get('queue_stats') or payload.get('queue') or {}
+    if not isinstance(stats, dict):
+        return None
+    counts = [stats.get(name) for name in ('pending', 'processing')]
+    if not any(isinstance(count, (int, float)) for count in counts):
+        return None
+    return int(sum(count for count in counts if isinstance(count, (int, float))))
+
+
+def read_queue_depth(client: TianshuClient) -> int | None:
+    """
+    Ask a server for its queue depth; None when it does not report one.
+
+    Raises ``requests.exceptions.RequestException`` or ``ValueError`` when the
+    probe fails.
+    """
+    for path in QUEUE_STATS_PATHS:
+        response = client.get(path, timeout=5)
+        if response.status_code == 404:
+            continue
+        response.raise_for_status()
+        return queue_depth(response.json())
+    return None
+
+
+_pins: OrderedDict[str, str] = OrderedDict()
+_pins_lock = threading.Lock()
+
+
+def pin_task(task_id: str, api_server_url: str) -> None:
+    """Remember which server owns a task (bounded, least recently used first out)."""
+    with _pins_lock:
+        _pins[task_id] = api_server_url
+        _pins.move_to_end(task_id)
+        while len(_pins) > MAX_PINNED_TASKS:
+            _pins.popitem(last=False)
+
+
+def pinned_server(task_id: str) -> str | None:
+    with _pins_lock:
+        return _pins.get(task_id)
+
+
+class _Server:
+    """Routing state of one server in a pool."""
+
+    def __init__(self, client: TianshuClient, weight: int):
+        self.client = client
+        self.weight = weight
+        self.depth: int | None = None
+        self.stats_at = 0.0
+        # Tasks routed here since the last queue probe, so bursts spread out
+        self.routed_since_stats = 0
+        self.ejected_until = 0.0
+        self.current_weight = 0
+        self.routed = 0
+
+    @property
+    def url(self) -> str:
+        return self.client.api_server_url
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until and self.client.resilience.breaker.available()
+
+
+class ServerPool:
+    """
+    The servers of one provider configuration and the policy that routes tasks to them.
+    """
+
+    def __init__(
+        self,
+        servers: list[tuple[str, int]],
+        policy: str = 'least_queue',
+        verify_ssl: bool = True,
+        api_key: str = '',
+    ):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"routing_policy must be one of: {', '.join(ROUTING_POLICIES)}")
+        self.policy = policy
+        self.verify_ssl = verify_ssl
+        self.api_key = api_key
+        self.servers = [_Server(get_client(url, verify_ssl, api_key), weight) for url, weight in servers]
+        self._lock = threading.Lock()
+        self._next = 0
+
+    @property
+    def urls(self) -> list[str]:
+        return [server.url for server in self.servers]
+
+    def _live_client(self, server: _Server) -> TianshuClient:
+        # Shared clients are evicted when idle; look the current one up again
+        server.client = get_client(server.url, self.verify_ssl, self.api_key)
+        return server.client
+
+    def client_for(self, api_server_url: str) -> TianshuClient | None:
+        """The client of a server in this pool, or None if it is not part of it."""
+        for server in self.servers:
+            if server.url == api_server_url.rstrip('/'):
+                return self._live_client(server)
+        return None
+
+    def choose(self) -> TianshuClient:
+        """Pick the server for a new task according to the routing policy."""
+        if len(self.servers) == 1:
+            return self._live_client(self.servers[0])
+
+        now = time.monotonic()
+        if self.policy == 'least_queue':
+            for server in self.servers:
+                if server.available(now) and now - server.stats_at >= STATS_TTL:
+                    self._refresh_depth(server)
+
+        with self._lock:
+            now = time.monotonic()
+            candidates = [server for server in self.servers if server.available(now)]
+            if not candidates:
+                # Everything is ejected: try the server that comes back soonest
+                candidates = [min(self.servers, key=lambda server: server.ejected_until)]
+
+            if self.policy == 'least_queue':
+                server = min(candidates, key=self._load)
+            elif self.policy == 'weighted':
+                total = sum(server.weight for server in candidates)
+                for candidate in candidates:
+                    candidate.current_weight += candidate.weight
+                server = max(candidates, key=lambda candidate: candidate.current_weight)
+                server.current_weight -= total
+            else:
+                server = candidates[self._next % len(candidates)]
+                self._next += 1
+
+            server.routed += 1
+            server.routed_since_stats += 1
+        return self._live_client(server)
+
+    @staticmethod
+    def _load(server: _Server) -> tuple[bool, float]:
+        # Servers that did not report a queue depth rank after those that did
+        if server.depth is None:
+            return True, server.routed_since_stats / server.weight
+        return False, (server.depth + server.routed_since_stats) / server.weight
+
+    def _refresh_depth(self, server: _Server) -> None:
+        """Read a server's queue depth; a failed probe ejects the server for a while."""
+        try:
+            depth = read_queue_depth(self._live_client(server))
+        except (requests.exceptions.RequestException, ValueError):
+            with self._lock:
+                server.ejected_until = time.monotonic() + BREAKER_RESET_TIMEOUT
+                server.stats_at = time.monotonic()
+            return
+        with self._lock:
+            server.depth = depth
+            server.stats_at = time.monotonic()
+            server.routed_since_stats = 0
+            server.ejected_until = 0.0
+
+    def client_for_task(self, task_id: str) -> TianshuClient:
+        """
+        The client of the server that owns ``task_id``.
+
+        Unpinned tasks are looked up on each server; when no server knows the
+        task the first one is returned so its "not found" answer is reported.
+        """
+        if len(self.servers) == 1:
+            return self._live_client(self.servers[0])
+
+        pinned = pinned_server(task_id)
+        client = self.client_for(pinned) if pinned else None
+        if client is not None:
+            return client
+
+        now = time.monotonic()
+        for server in sorted(self.servers, key=lambda server: not server.available(now)):
+            client = self._live_client(server)
+            try:
+                response = client.get(f"/api/v1/tasks/{task_id}", timeout=30)
+                found = response.status_code == 200 and response.json().get('success', True)
+            except (requests.exceptions.RequestException, ValueError):
+                continue
+            if found:
+                pin_task(task_id, client.api_server_url)
+                return client
+        return self._live_client(self.servers[0])
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'api_server_url': server.url,
+                    'weight': server.weight,
+                    'available': server.available(now),
+                    'queue_depth': server.depth,
+                    'routed': server.routed,
+                }
+                for server in self.servers
+            ]
+
+
+_pools: dict[tuple, ServerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_server_pool(credentials: dict[str, Any]) -> ServerPool:
+    """
+    The process-wide pool for a provider configuration.
+
+    Raises ``ValueError`` when the server list or routing policy is invalid.
+    """
+    servers = parse_servers(credentials.get('api_server_url'))
+    policy = credentials.get('routing_policy') or 'least_queue'
+    verify_ssl = credentials.get('verify_ssl', True)
+    api_key = credentials.get('api_key', '') or ''
+    key = (tuple(servers), policy, bool(verify_ssl), api_key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ServerPool(servers, policy, verify_ssl, api_key)
+        return pool
+
+
+def reset_routing() -> None:
+    with _pools_lock:
+        _pools.clear()
+    with _pins_lock:
+        _pins.clear()
@@ -0,0 +1,96 @@
+"""
+Process-wide coalescing of duplicate in-flight work.
+
+``SingleFlight.do(key, fn)`` runs ``fn`` once for any number of concurrent
+callers with the same key: the first caller (the leader) runs it and the
+others block until it finishes and receive the same result or exception.
+
+With ``retain`` set, finished results are also kept for that many seconds and
+handed to callers whose ``not_before`` is earlier than the call's start, so
+concurrent pollers of one task share status requests while each still
+sees a status at least as new as the one it saw last.
+"""
+import threading
+import time
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+class _Call:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key; see the module docstring.
+    """
+
+    def __init__(self, retain: float = 0.0):
+        self.retain = retain
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], not_before: float | None = None) -> tuple[Any, bool]:
+        """
+        Run ``fn`` or join an equivalent call; returns (result, shared).
+
+        ``not_before`` is a ``time.monotonic()`` value: only calls started at
+        or after it are joined. Without it only in-flight calls are joined.
+        """
+        with self._lock:
+            self._prune(time.monotonic())
+            call = self._calls.get(key)
+            if call is not None and not_before is None and call.done.is_set():
+                call = None
+            if call is not None and not_before is not None and call.started_at < not_before:
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+            with self._lock:
+                # Failures and non-retained results are never handed to later callers
+                if (call.error is not None or not self.retain) and self._calls.get(key) is call:
+                    del self._calls[key]
+        return call.result, False
+
+    def _prune(self, now: float) -> None:
+        """Drop retained results older than ``retain`` (lock held)."""
+        for key, call in list(self._calls.items()):
+            if call.finished_at is not None and now - call.finished_at > self.retain:
+                del self._calls[key]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'leaders': self.leaders, 'shared': self.shared, 'in_flight': sum(
+                1 for call in self._calls.values() if not call.done.is_set()
+            )}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self.leaders = self.shared = 0
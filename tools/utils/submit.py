@@ -0,0 +1,216 @@
+"""
+Submit path shared by the parse tools: payload construction, the upload
+itself and reuse of identical earlier or concurrent submissions.
+"""
+from typing import Any
+
+import requests
+
+from tools.utils.admission import AdmissionError, admit, ticket_summary
+from tools.utils.cache import ResultCache
+from tools.utils.client import TianshuClient
+from tools.utils.compression import compress_body, is_compressible, upload_encoding
+from tools.utils.metrics import measure
+from tools.utils.singleflight import SingleFlight
+from tools.utils.upload import MultipartEncoder, SpooledUpload
+
+# Submit fields that only affect scheduling or delivery, not the parse output
+NON_OUTPUT_FIELDS = ('priority', 'callback_url')
+
+
+def parse_priority(value: Any) -> int:
+    """
+    Read a priority parameter (higher runs first); raises ``ValueError`` if it is not a number.
+    """
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError):
+        raise ValueError("priority must be a valid number")
+
+
+def build_submit_data(tool_parameters: dict[str, Any], priority: Any = 0) -> dict[str, str]:
+    """
+    Build the form fields for ``/api/v1/tasks/submit`` from tool parameters.
+
+    Backend-specific options (video, sensevoice) and watermark removal are only
+    included when they apply, matching what the server expects.
+    """
+    backend = tool_parameters.get('backend', 'auto')
+    data = {
+        'backend': backend,
+        'lang': tool_parameters.get('lang', 'auto'),
+        'method': tool_parameters.get('method', 'auto'),
+        'formula_enable': str(tool_parameters.get('formula_enable', True)).lower(),
+        'table_enable': str(tool_parameters.get('table_enable', True)).lower(),
+        'priority': str(parse_priority(priority))
+    }
+
+    # Add video-specific parameters if backend is video
+    if backend == 'video':
+        enable_keyframe_ocr = tool_parameters.get('enable_keyframe_ocr', False)
+        keep_audio = tool_parameters.get('keep_audio', False)
+        ocr_backend = tool_parameters.get('ocr_backend', 'paddleocr-vl')
+        keep_keyframes = tool_parameters.get('keep_keyframes', False)
+        data.update({
+            'enable_keyframe_ocr': str(enable_keyframe_ocr).lower(),
+            'keep_audio': str(keep_audio).lower(),
+            'ocr_backend': ocr_backend,
+            'keep_keyframes': str(keep_keyframes).lower(),
+        })
+
+    # Add audio-specific parameters if backend is sensevoice
+    if backend == 'sensevoice':
+        enable_speaker_diarization = tool_parameters.get('enable_speaker_diarization', False)
+        data['enable_speaker_diarization'] = str(enable_speaker_diarization).lower()
+
+    # Add watermark removal parameters
+    remove_watermark = tool_parameters.get('remove_watermark', False)
+    if remove_watermark:
+        watermark_conf_threshold = tool_parameters.get('watermark_conf_threshold', 0.35)
+        watermark_dilation = tool_parameters.get('watermark_dilation', 10)
+        data.update({
+            'remove_watermark': str(remove_watermark).lower(),
+            'watermark_conf_threshold': str(watermark_conf_threshold),
+            'watermark_dilation': str(watermark_dilation),
+        })
+
+    # Text-only fast path: read the text layer and skip the layout-heavy models
+    text_only = tool_parameters.get('text_only', False)
+    if isinstance(text_only, str):
+        text_only = text_only.lower() in ('true', '1', 'yes')
+    if text_only:
+        data.update({
+            'method': 'txt',
+            'formula_enable': 'false',
+            'table_enable': 'false',
+        })
+
+    # Add convert_office_to_pdf parameter
+    convert_office_to_pdf = tool_parameters.get('convert_office_to_pdf', False)
+    if convert_office_to_pdf:
+        data['convert_office_to_pdf'] = str(convert_office_to_pdf).lower()
+
+    return data
+
+
+def parse_options(data: dict[str, str]) -> dict[str, str]:
+    """The submit fields that affect the parse output (everything except scheduling and delivery)."""
+    return {key: value for key, value in data.items() if key not in NON_OUTPUT_FIELDS}
+
+
+class SubmitError(Exception):
+    """
+    Raised when the server accepts the request but rejects the submission.
+    """
+
+
+def submit_upload(
+    client: TianshuClient,
+    file_name: str,
+    upload: SpooledUpload,
+    data: dict[str, str],
+    timeout: float = 60,
+    deadline: float | None = None,
+) -> dict[str, Any]:
+    """
+    Submit a spooled file to ``/api/v1/tasks/submit`` and return the API response.
+
+    The upload waits for admission (rate limit, concurrency caps, queue
+    depth) first, ahead of lower-priority or later-``deadline`` uploads. Raises ``requests.exceptions.RequestException`` for
+    transport/HTTP errors and ``SubmitError`` when the submission is not
+    admitted, or the response is unsuccessful or carries no task_id.
+    """
+    try:
+        with measure('upload'), admit(client, data, deadline) as ticket:
+            # Stream the spooled file into the multipart body
+            encoder = MultipartEncoder(ticket['data'], 'file', file_name, upload)
+            body, headers = encoder, {'Content-Type': encoder.content_type}
+
+            # Optionally send compressible documents with a compressed body
+            encoding = upload_encoding()
+            compressed = compress_body(encoder, encoding) if encoding and is_compressible(file_name, upload) else None
+            if compressed is not None:
+                body, headers['Content-Encoding'] = compressed, compressed.encoding
+            try:
+                response = client.post('/api/v1/tasks/submit', data=body, headers=headers, timeout=timeout)
+            finally:
+                if compressed is not None:
+                    compressed.close()
+            if compressed is not None:
+                client.compression_stats.record_upload(compressed.raw_size, len(compressed))
+    except AdmissionError as e:
+        raise SubmitError(f"Failed to submit task: {str(e)}")
+    response.raise_for_status()
+    result = response.json()
+
+    if not result.get('success'):
+        error_msg = result.get('message') or result.get('error_message', 'Unknown error')
+        raise SubmitError(f"Failed to submit task: {error_msg}")
+    if not result.get('task_id'):
+        raise SubmitError(f"API returned success but no task_id. Response: {result}")
+    if ticket['wait_seconds'] or ticket['deprioritized']:
+        result = {**result, 'admission': ticket_summary(ticket)}
+    return result
+
+
+# Identical submissions (same client, content hash and parse options) in flight at once
+_submit_flight = SingleFlight()
+
+
+def get_submit_flight() -> SingleFlight:
+    return _submit_flight
+
+
+def submit_upload_once(
+    client: TianshuClient,
+    file_name: str,
+    upload: SpooledUpload,
+    data: dict[str, str],
+    timeout: float = 60,
+    deadline: float | None = None,
+    options: dict[str, str] | None = None,
+) -> tuple[dict[str, Any], bool]:
+    """
+    ``submit_upload``, coalesced with identical submissions already in flight.
+
+    Submissions are identical when they share the content hash and ``options``
+    (by default the parse options in ``data``); callers that route the backend
+    pass the options they were asked for, so routing does not split them.
+    Returns (API response, shared); when shared is True another caller did the
+    upload and this one attaches to its task instead of creating a duplicate.
+    """
+    options = parse_options(data) if options is None else options
+    key = (id(client), ResultCache.document_key(client.api_server_url, upload.sha256, options))
+    return _submit_flight.do(key, lambda: submit_upload(client, file_name, upload, data, timeout, deadline))
+
+
+def find_reusable_task(
+    client: TianshuClient,
+    cache: ResultCache,
+    api_server_url: str,
+    cache_key: str,
+) -> str | None:
+    """
+    Return the task_id of an identical earlier submission if it can be reused.
+
+    A task is reusable when its result is cached, or when the server still
+    knows it and it has not failed. Stale document entries are invalidated.
+    """
+    cached_document = cache.get(cache_key)
+    if not cached_document:
+        return None
+
+    task_id = cached_document['task_id']
+    if cache.get(cache.task_key(api_server_url, task_id)) is not None:
+        return task_id
+    try:
+        response = client.get(f"/api/v1/tasks/{task_id}", timeout=30)
+        response.raise_for_status()
+        status_result = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        status_result = {}
+    if status_result.get('success') and status_result.get('status') != 'failed':
+        return task_id
+
+    cache.invalidate(cache_key)
+    return None
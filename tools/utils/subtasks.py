@@ -0,0 +1,154 @@
+"""
+Progressive results from parent tasks.
+
+When the server splits a large PDF it reports a parent task whose
+``subtasks`` list carries each part's task_id, status and page range. Parts
+are ordinary tasks, so a finished part's markdown can be fetched by its own
+task_id while the rest of the document is still processing.
+
+``SubtaskIndex`` follows the subtask list across polls incrementally: an
+unchanged status (the same payload after a ``304``, or progress counters
+that did not move) costs nothing, and otherwise only subtasks whose status
+changed are recorded. ``SubtaskTracker`` builds on it and remembers which
+parts were already emitted, so a part is never sent twice across polls,
+resumed waits or repeated tool calls.
+"""
+from collections.abc import Iterator
+from typing import Any
+
+import requests
+
+from tools.utils.client import TianshuClient
+from tools.utils.task_group import fetch_task_status
+
+
+def subtask_id(subtask: dict[str, Any]) -> str | None:
+    return subtask.get('task_id') or subtask.get('id')
+
+
+def subtask_pages(subtask: dict[str, Any]) -> tuple[int | None, int | None]:
+    """(start_page, end_page) from the subtask or its ``chunk_info``, when reported."""
+    info = subtask.get('chunk_info') or subtask
+    return info.get('start_page'), info.get('end_page')
+
+
+def ordered_subtasks(status_result: dict[str, Any]) -> list[dict[str, Any]]:
+    """A parent's subtasks in page order (server order when pages are not reported)."""
+    subtasks = [
+        subtask for subtask in status_result.get('subtasks') or []
+        if isinstance(subtask, dict) and subtask_id(subtask)
+    ]
+    # sorted() is stable, so subtasks without pages keep their relative order at the end
+    return sorted(subtasks, key=lambda subtask: (subtask_pages(subtask)[0] is None, subtask_pages(subtask)[0] or 0))
+
+
+def part_label(part: dict[str, Any]) -> str:
+    label = f"Part {part['part_index'] + 1}/{part['part_count']}"
+    if part.get('start_page') is not None:
+        label += f" (pages {part['start_page']}-{part['end_page']})"
+    return label
+
+
+class SubtaskIndex:
+    """
+    Subtask statuses of one parent task, updated from successive status payloads.
+
+    Newly completed subtasks are appended to ``completed``; readers keep their
+    own cursor into it.
+    """
+
+    def __init__(self):
+        self.statuses: dict[str, str | None] = {}
+        self.subtasks: dict[str, dict[str, Any]] = {}
+        self.positions: dict[str, int] = {}
+        self.completed: list[str] = []
+        self.failed = 0
+        self._last_result: dict[str, Any] | None = None
+        self._last_progress: tuple | None = None
+        self._listed = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.positions)
+
+    def update(self, status_result: dict[str, Any]) -> None:
+        if status_result is self._last_result:
+            return
+        self._last_result = status_result
+        progress = status_result.get('subtask_progress')
+        if isinstance(progress, dict) and 'completed' in progress and 'failed' in progress:
+            fingerprint = (progress.get('total'), progress['completed'], progress['failed'])
+            if fingerprint == self._last_progress:
+                return
+            self._last_progress = fingerprint
+
+        subtasks = status_result.get('subtasks') or []
+        if len(subtasks) != self._listed:
+            # Page order only changes when parts are added
+            self._listed = len(subtasks)
+            self.positions = {
+                subtask_id(subtask): index for index, subtask in enumerate(ordered_subtasks(status_result))
+            }
+        for subtask in subtasks:
+            task_id = subtask_id(subtask) if isinstance(subtask, dict) else None
+            if not task_id:
+                continue
+            status = subtask.get('status')
+            previous = self.statuses.get(task_id)
+            if task_id in self.statuses and previous == status:
+                continue
+            self.statuses[task_id] = status
+            self.subtasks[task_id] = subtask
+            self.failed += (status == 'failed') - (previous == 'failed')
+            if status == 'completed':
+                self.completed.append(task_id)
+
+
+class SubtaskTracker:
+    """
+    Yields the parts of a parent task that completed since the last call.
+    """
+
+    def __init__(self, emitted: list[str] | None = None, index: SubtaskIndex | None = None):
+        self.emitted: list[str] = list(emitted or [])
+        self.index = index or SubtaskIndex()
+        self._cursor = 0
+        # Completed parts not emitted yet, including ones whose fetch failed
+        self._ready: list[str] = []
+
+    def iter_new_parts(
+        self, client: TianshuClient, parent_task_id: str, status_result: dict[str, Any]
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Fetch and yield a part payload for every newly completed subtask, in page order.
+
+        A part whose content cannot be fetched right now is left for the next
+        call rather than being marked as emitted.
+        """
+        index = self.index
+        index.update(status_result)
+        emitted = set(self.emitted)
+        for task_id in index.completed[self._cursor:]:
+            if task_id not in emitted and task_id not in self._ready:
+                self._ready.append(task_id)
+        self._cursor = len(index.completed)
+
+        for task_id in sorted(self._ready, key=lambda task_id: index.positions.get(task_id, index.count)):
+            try:
+                (_, part_result), _ = fetch_task_status(client, task_id)
+            except (requests.exceptions.RequestException, ValueError):
+                continue
+            if part_result.get('status') != 'completed':
+                continue
+            self._ready.remove(task_id)
+            self.emitted.append(task_id)
+            start_page, end_page = subtask_pages(index.subtasks[task_id])
+            yield {
+                'parent_task_id': parent_task_id,
+                'subtask_id': task_id,
+                'part_index': index.positions.get(task_id, index.count),
+                'part_count': index.count,
+                'start_page': start_page,
+                'end_page': end_page,
+                'content': (part_result.get('data') or {}).get('content'),
+            }
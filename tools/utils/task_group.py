@@ -0,0 +1,294 @@
+"""
+Concurrent waiting on many Tianshu tasks.
+
+Statuses are fetched with the server's batch status endpoint when it offers
+one, otherwise with concurrent per-task GETs over the pooled client. One
+shared poll scheduler paces the whole group, and tasks are yielded as soon
+as they reach a terminal state rather than in submission order.
+
+Status GETs are conditional: when the server sends an ``ETag`` or
+``Last-Modified`` header, the next poll of that task carries
+``If-None-Match``/``If-Modified-Since`` and a ``304 Not Modified`` answer
+reuses the previously decoded payload instead of downloading and parsing it
+again.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+
+from tools.utils.client import TianshuClient
+from tools.utils.metrics import current_metrics, propagate
+from tools.utils.polling import ETA_FIELDS, PollScheduler, first_number
+from tools.utils.resilience import transient_error
+from tools.utils.singleflight import SingleFlight
+from tools.utils.timeline import get_timeline
+
+BATCH_STATUS_PATH = '/api/v1/tasks/batch'
+TERMINAL_STATUSES = ('completed', 'failed')
+COMPLETION_POLICIES = ('all', 'any', 'first_k')
+MAX_STATUS_VALIDATORS = int(os.environ.get('TIANSHU_MAX_STATUS_VALIDATORS', 1024))
+
+# Status responses are shared between concurrent pollers of the same task
+_status_flight = SingleFlight(retain=30.0)
+
+
+# (server, task_id) -> (ETag, Last-Modified, decoded status) of the last full status response
+_validators: OrderedDict[tuple[str, str], tuple[str | None, str | None, dict[str, Any]]] = OrderedDict()
+_validators_lock = threading.Lock()
+
+
+def get_status_flight() -> SingleFlight:
+    return _status_flight
+
+
+def reset_status_validators() -> None:
+    with _validators_lock:
+        _validators.clear()
+
+
+def _conditional_headers(key: tuple[str, str]) -> tuple[dict[str, str], dict[str, Any] | None]:
+    with _validators_lock:
+        cached = _validators.get(key)
+        if cached is None:
+            return {}, None
+        _validators.move_to_end(key)
+    etag, last_modified, status_result = cached
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers, status_result
+
+
+def _remember_validators(key: tuple[str, str], response: requests.Response, status_result: dict[str, Any]) -> None:
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    etag = etag if isinstance(etag, str) else None
+    last_modified = last_modified if isinstance(last_modified, str) else None
+    with _validators_lock:
+        # A finished task is not polled again
+        if not (etag or last_modified) or status_result.get('status') in TERMINAL_STATUSES:
+            _validators.pop(key, None)
+            return
+        _validators[key] = (etag, last_modified, status_result)
+        _validators.move_to_end(key)
+        while len(_validators) > MAX_STATUS_VALIDATORS:
+            _validators.popitem(last=False)
+
+
+def fetch_task_status(
+    client: TianshuClient, task_id: str, not_before: float | None = None
+) -> tuple[tuple[requests.Response, dict[str, Any]], bool]:
+    """
+    GET one task's status, sharing the request with concurrent pollers.
+
+    Returns ((response, status_result), shared). A status fetched by another
+    poller is reused only if that request started at or after ``not_before``
+    (a ``time.monotonic()`` value), e.g. when the caller's previous poll ended.
+
+    On ``304 Not Modified`` the status_result is the very dict returned by the
+    previous poll of the task, so callers can detect an unchanged status by
+    identity.
+    """
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.record_polls()
+
+    def fetch() -> tuple[requests.Response, dict[str, Any]]:
+        key = (client.api_server_url, task_id)
+        headers, previous = _conditional_headers(key)
+        response = client.get(f"/api/v1/tasks/{task_id}", hedge=True, headers=headers, timeout=30)
+        if response.status_code == 304 and previous is not None:
+            return response, previous
+        response.raise_for_status()
+        status_result = response.json()
+        _remember_validators(key, response, status_result)
+        get_timeline().record(status_result, task_id)
+        return response, status_result
+
+    return _status_flight.do((id(client), task_id), fetch, not_before=not_before)
+
+
+def failed_status(task_id: str, error: requests.exceptions.RequestException) -> dict[str, Any]:
+    """
+    Status result for a status request that failed: ``transient`` when it is
+    worth polling again, otherwise a final error such as an unknown task.
+    """
+    message = str(error)
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and isinstance(body.get('message') or body.get('detail'), str):
+            message = body.get('message') or body.get('detail')
+    return {'success': False, 'task_id': task_id, 'transient': transient_error(error), 'message': message}
+
+
+def parse_task_ids(value: Any) -> list[str]:
+    """
+    Accept task_ids as a list, a JSON array string, or a string separated by
+    commas, semicolons or whitespace.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+    if isinstance(value, str):
+        value = re.split(r'[\s,;]+', value)
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [str(task_id).strip() for task_id in value if str(task_id).strip()]
+
+
+def fetch_statuses(
+    client: TianshuClient,
+    task_ids: list[str],
+    executor: ThreadPoolExecutor,
+) -> dict[str, dict[str, Any]]:
+    """
+    Fetch the status of every task in one round.
+
+    The batch endpoint is tried first; a 404/405/501 marks it unsupported on
+    this client so later rounds go straight to per-task GETs.
+    """
+    if client.capabilities.get('batch_status', True):
+        try:
+            response = client.post(BATCH_STATUS_PATH, idempotent=True, json={'task_ids': list(task_ids)}, timeout=30)
+            if response.status_code in (404, 405, 501):
+                client.capabilities['batch_status'] = False
+            else:
+                response.raise_for_status()
+                results = _batch_results(response.json())
+                client.capabilities['batch_status'] = True
+                for task_id, status_result in results.items():
+                    get_timeline().record(status_result, task_id)
+                metrics = current_metrics()
+                if metrics is not None:
+                    metrics.record_polls(len(task_ids))
+                return results
+        except ValueError:
+            client.capabilities['batch_status'] = False
+        except requests.exceptions.RequestException:
+            # Fall back to per-task GETs for this round only
+            pass
+
+    def fetch_one(task_id: str) -> tuple[str, dict[str, Any]]:
+        try:
+            (_, status_result), _ = fetch_task_status(client, task_id)
+            return task_id, status_result
+        except requests.exceptions.RequestException as e:
+            # Unreachable or 5xx is polled again; a 4xx such as an unknown task is final
+            return task_id, failed_status(task_id, e)
+        except ValueError as e:
+            # An unreadable body says nothing about the task
+            return task_id, {'success': False, 'task_id': task_id, 'transient': True, 'message': str(e)}
+
+    return dict(executor.map(propagate(fetch_one), task_ids))
+
+
+def _batch_results(payload: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """Normalize a batch status response (list or mapping of task payloads)."""
+    tasks = payload.get('tasks', payload.get('results', []))
+    if isinstance(tasks, dict):
+        return {task_id: {'success': True, **result} for task_id, result in tasks.items()}
+    return {
+        result['task_id']: {'success': True, **result}
+        for result in tasks if isinstance(result, dict) and result.get('task_id')
+    }
+
+
+def is_terminal(status_result: dict[str, Any] | None) -> bool:
+    if not status_result:
+        return False
+    if not status_result.get('success'):
+        # Transport hiccups and 5xx are retried; API-level errors and 4xx (e.g. unknown task) are final
+        return not status_result.get('transient')
+    return status_result.get('status') in TERMINAL_STATUSES
+
+
+def required_completions(policy: str, total: int, k: int = 1) -> int:
+    """Number of successful completions that satisfies a completion policy."""
+    if policy == 'any':
+        return 1
+    if policy == 'first_k':
+        return max(1, min(k, total))
+    return total
+
+
+class TaskGroupWaiter:
+    """
+    Waits on a set of task_ids with a shared scheduler and yields them as they finish.
+    """
+
+    def __init__(
+        self,
+        client: TianshuClient,
+        task_ids: list[str],
+        scheduler: PollScheduler,
+        max_concurrency: int = 8,
+        client_for: Callable[[str], TianshuClient] | None = None,
+    ):
+        self.client = client
+        # Tasks spread over several servers are polled on the server that owns each
+        self.client_for = client_for
+        # Coalesce duplicate ids so each task is fetched once per round
+        self.task_ids = list(dict.fromkeys(task_ids))
+        self.scheduler = scheduler
+        self.max_concurrency = max_concurrency
+        self.pending: list[str] = list(self.task_ids)
+        self.last_status: dict[str, dict[str, Any]] = {}
+
+    def iter_finished(self, deadline: float) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Yield (task_id, status_result) for each task as it reaches a terminal state."""
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(self.task_ids)))) as executor:
+            while self.pending:
+                statuses = {}
+                for client, task_ids in self._by_client().items():
+                    statuses.update(fetch_statuses(client, task_ids, executor))
+                self.scheduler.record_poll()
+                self.last_status.update(statuses)
+
+                for task_id in list(self.pending):
+                    status_result = statuses.get(task_id)
+                    if is_terminal(status_result):
+                        self.pending.remove(task_id)
+                        yield task_id, status_result
+
+                remaining = deadline - time.time()
+                if not self.pending or remaining <= 0:
+                    return
+                delay = self.scheduler.next_delay(self._aggregate_status())
+                time.sleep(min(delay, remaining))
+
+    def _by_client(self) -> dict[TianshuClient, list[str]]:
+        if self.client_for is None:
+            return {self.client: self.pending}
+        groups: dict[TianshuClient, list[str]] = {}
+        for task_id in self.pending:
+            groups.setdefault(self.client_for(task_id), []).append(task_id)
+        return groups
+
+    def _aggregate_status(self) -> dict[str, Any]:
+        """Summarize pending tasks for the shared scheduler: the soonest ETA wins."""
+        statuses = [self.last_status.get(task_id) or {} for task_id in self.pending]
+        aggregate: dict[str, Any] = {
+            'status': 'processing' if any(s.get('status') == 'processing' for s in statuses) else 'pending'
+        }
+        etas = [eta for eta in (first_number(s, ETA_FIELDS) for s in statuses) if eta is not None]
+        if etas:
+            aggregate['eta_seconds'] = min(etas)
+        return aggregate
@@ -0,0 +1,225 @@
+"""
+Server-side timelines of finished tasks.
+
+A completed task's ``created_at``, ``started_at`` and ``completed_at`` give
+how long it waited in the Tianshu queue and how long a worker spent on it.
+Those durations are kept per backend (``pipeline``, ``paddleocr-vl``,
+``sensevoice``, ``video``, ...) in a rolling window of the latest
+``TIANSHU_TIMELINE_SAMPLES`` tasks, from which the plugin reports percentile
+summaries and estimates when a newly submitted task will finish. Estimates
+seed the adaptive poll scheduler and stretch the default ``max_wait_time``
+when tasks on a backend routinely take longer. Durations are also exported
+as the ``tianshu_task_queue_seconds`` and ``tianshu_task_processing_seconds``
+histograms for sizing GPU pools.
+
+When the plugin knows how many pages it submitted (see ``expect_pages``),
+the sample also carries the page count, giving each backend's processing
+seconds per page for ``tools.utils.backend_router``.
+
+Parent tasks of split documents are not recorded: their subtasks are the
+units the server queues and processes.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any
+
+from tools.utils.metrics import get_metrics_registry
+
+TIMELINE_SAMPLES = int(os.environ.get('TIANSHU_TIMELINE_SAMPLES', 500))
+# Fewer samples than this give no estimate for a backend
+TIMELINE_MIN_SAMPLES = int(os.environ.get('TIANSHU_TIMELINE_MIN_SAMPLES', 5))
+# Headroom over the p99 duration when stretching the default max_wait_time
+WAIT_TIME_MARGIN = 1.5
+MAX_WAIT_TIME = 3600
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def parse_timestamp(value: Any) -> float | None:
+    """Seconds since the epoch from an ISO 8601 string (``Z`` allowed) or a number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def task_durations(status_result: dict[str, Any]) -> tuple[float, float] | None:
+    """(queue wait, processing) seconds of a completed task, or None when unknown."""
+    if status_result.get('status') != 'completed':
+        return None
+    created = parse_timestamp(status_result.get('created_at'))
+    started = parse_timestamp(status_result.get('started_at'))
+    completed = parse_timestamp(status_result.get('completed_at'))
+    if created is None or started is None or completed is None:
+        return None
+    if not created <= started <= completed:
+        return None
+    return started - created, completed - started
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(max(math.ceil(quantile * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    summary = {f"p{round(quantile * 100)}": round(percentile(values, quantile), 3) for quantile in QUANTILES}
+    summary['mean'] = round(sum(values) / len(values), 3)
+    return summary
+
+
+class TimelineStore:
+    """
+    Thread-safe rolling window of (queue wait, processing) seconds per backend.
+    """
+
+    def __init__(self, max_samples: int = TIMELINE_SAMPLES, min_samples: int = TIMELINE_MIN_SAMPLES):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        # (queue wait, processing, pages or None) per backend
+        self._samples: dict[str, deque[tuple[float, float, int | None]]] = {}
+        # Task ids already recorded, so repeated polls of a finished task count once
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        # Page counts of submitted tasks, until they finish
+        self._pages: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def expect_pages(self, task_id: str, pages: int) -> None:
+        """Remember how many pages a submitted task has, for its sample when it finishes."""
+        with self._lock:
+            self._pages[task_id] = pages
+            while len(self._pages) > self.max_samples * 4:
+                self._pages.popitem(last=False)
+
+    def record(self, status_result: dict[str, Any] | None, task_id: str | None = None) -> tuple[float, float] | None:
+        """Record a finished task's durations; returns them, or None when not recorded."""
+        if not status_result or not status_result.get('success', True) or status_result.get('is_parent'):
+            return None
+        durations = task_durations(status_result)
+        task_id = status_result.get('task_id') or task_id
+        if durations is None or not task_id:
+            return None
+        backend = str(status_result.get('backend') or 'unknown')
+
+        with self._lock:
+            if task_id in self._seen:
+                return durations
+            self._seen[task_id] = None
+            # Remember a few windows' worth of ids across all backends
+            while len(self._seen) > self.max_samples * 4:
+                self._seen.popitem(last=False)
+            samples = self._samples.get(backend)
+            if samples is None:
+                samples = self._samples[backend] = deque(maxlen=self.max_samples)
+            samples.append((*durations, self._pages.pop(task_id, None)))
+
+        registry = get_metrics_registry()
+        registry.observe('tianshu_task_queue_seconds', {'backend': backend}, durations[0])
+        registry.observe('tianshu_task_processing_seconds', {'backend': backend}, durations[1])
+        return durations
+
+    def _window(self, backend: str | None) -> list[tuple[float, float, int | None]]:
+        """Samples for a backend; ``auto`` (or None) pools every backend."""
+        with self._lock:
+            if backend in (None, '', 'auto'):
+                return [sample for samples in self._samples.values() for sample in samples]
+            return list(self._samples.get(backend, ()))
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Per-backend sample counts and percentiles of queue wait, processing and total time."""
+        with self._lock:
+            backends = list(self._samples)
+        result = {}
+        for backend in backends:
+            window = self._window(backend)
+            if not window:
+                continue
+            result[backend] = {
+                'samples': len(window),
+                'queue_wait_seconds': _summary([queue for queue, _, _ in window]),
+                'processing_seconds': _summary([processing for _, processing, _ in window]),
+                'total_seconds': _summary([queue + processing for queue, processing, _ in window]),
+            }
+            per_page = self._per_page(window)
+            if per_page:
+                result[backend]['seconds_per_page'] = _summary(per_page)
+        return result
+
+    def backends(self) -> list[str]:
+        """Backends with at least one recorded task."""
+        with self._lock:
+            return [backend for backend, samples in self._samples.items() if samples]
+
+    @staticmethod
+    def _per_page(window: list[tuple[float, float, int | None]]) -> list[float]:
+        return [processing / pages for _, processing, pages in window if pages]
+
+    def estimate(self, backend: str | None, quantile: float = 0.5) -> float | None:
+        """
+        Seconds from submission to completion for a new task on ``backend``
+        at the given quantile, or None without enough history.
+        """
+        window = self._window(backend)
+        if len(window) < max(self.min_samples, 1):
+            return None
+        return percentile([queue + processing for queue, processing, _ in window], quantile)
+
+    def backend_profile(self, backend: str) -> dict[str, float] | None:
+        """
+        Median queue wait, processing time and (when known) processing seconds
+        per page of a backend, or None without enough history.
+        """
+        window = self._window(backend)
+        if len(window) < max(self.min_samples, 1):
+            return None
+        profile = {
+            'samples': len(window),
+            'queue_wait_seconds': percentile([queue for queue, _, _ in window], 0.5),
+            'processing_seconds': percentile([processing for _, processing, _ in window], 0.5),
+        }
+        per_page = self._per_page(window)
+        if len(per_page) >= max(self.min_samples, 1):
+            profile['seconds_per_page'] = percentile(per_page, 0.5)
+        return profile
+
+    def suggested_wait(self, backend: str | None, default: int) -> int:
+        """A ``max_wait_time`` covering the backend's p99 with headroom, never below ``default``."""
+        p99 = self.estimate(backend, 0.99)
+        if p99 is None:
+            return default
+        return int(min(max(default, math.ceil(p99 * WAIT_TIME_MARGIN)), MAX_WAIT_TIME))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._seen.clear()
+            self._pages.clear()
+
+
+_timeline = TimelineStore()
+
+
+def get_timeline() -> TimelineStore:
+    return _timeline
+
+
+def completion_estimate(backend: str | None, submitted_at: float) -> dict[str, Any] | None:
+    """Median and p90 completion estimates of a task submitted at ``submitted_at``, for JSON output."""
+    median = _timeline.estimate(backend, 0.5)
+    if median is None:
+        return None
+    p90 = _timeline.estimate(backend, 0.9)
+    return {
+        'estimated_seconds': round(median, 3),
+        'estimated_completion_at': round(submitted_at + median, 3),
+        'p90_seconds': round(p90, 3),
+    }
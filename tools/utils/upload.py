@@ -0,0 +1,322 @@
+"""
+Streaming download-to-upload helpers.
+
+Files are pulled from ``file.url`` in fixed-size chunks into a spool that stays
+in memory for small documents and rolls over to a temporary file above
+``SPOOL_MAX_MEMORY``. The spool is then streamed into the multipart body for
+``/api/v1/tasks/submit``, so peak memory no longer grows with document size.
+
+``acquire_file`` picks the cheapest way to get a Dify file's bytes: bytes the
+SDK already holds are used as they are, otherwise the file is streamed from
+its URL, and ``file.blob`` is the last resort. A file server that cannot be
+reached (for instance ``FILES_URL`` unset or pointing at a host the plugin
+cannot resolve) is skipped for ``TIANSHU_BROKEN_FILES_URL_TTL`` seconds after
+its first failure, so later files go straight to the fallback instead of
+waiting for the same error.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+
+from tools.utils.metrics import current_metrics, measure
+from tools.utils.resilience import request_not_sent
+
+# Documents above this size are spooled to disk instead of memory
+SPOOL_MAX_MEMORY = int(os.environ.get('TIANSHU_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
+# Read/write buffer used for both the download and the upload stream
+CHUNK_SIZE = int(os.environ.get('TIANSHU_STREAM_CHUNK_SIZE', 64 * 1024))
+# An unreachable file server fails within the connect timeout instead of the read timeout
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get('TIANSHU_DOWNLOAD_CONNECT_TIMEOUT', 5))
+DOWNLOAD_READ_TIMEOUT = 60
+# Seconds a file server that could not be reached is skipped
+BROKEN_FILES_URL_TTL = float(os.environ.get('TIANSHU_BROKEN_FILES_URL_TTL', 600))
+
+
+class SpooledUpload:
+    """
+    Write-once file buffer that tracks its size and SHA-256 while being filled.
+    """
+
+    def __init__(self, max_memory: int | None = None):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory or SPOOL_MAX_MEMORY)
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        if chunk:
+            self._file.write(chunk)
+            self._sha256.update(chunk)
+            self.size += len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self._file, '_rolled', False))
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def iter_chunks(self, chunk_size: int | None = None) -> Iterator[bytes]:
+        """Yield the spooled content from the start in bounded chunks."""
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(chunk_size or CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'SpooledUpload':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def spool_response(response: requests.Response, chunk_size: int | None = None) -> SpooledUpload:
+    """Drain a ``stream=True`` response into a new spool."""
+    upload = SpooledUpload()
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size or CHUNK_SIZE):
+            upload.write(chunk)
+    except Exception:
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
+
+
+def spool_bytes(content: bytes) -> SpooledUpload:
+    """Wrap already-materialized bytes in a spool."""
+    upload = SpooledUpload()
+    upload.write(content)
+    upload.seek(0)
+    return upload
+
+
+class MultipartEncoder:
+    """
+    File-like ``multipart/form-data`` body that streams the file part from a spool.
+
+    The total length is known up front, so requests sends a normal
+    ``Content-Length`` body and reads it in ``CHUNK_SIZE`` pieces.
+    """
+
+    def __init__(
+        self,
+        fields: dict[str, Any],
+        file_field: str,
+        file_name: str,
+        upload: SpooledUpload,
+        file_content_type: str = 'application/octet-stream',
+    ):
+        self.fields = fields
+        self.upload = upload
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        preamble = b''.join(self._field_part(name, value) for name, value in fields.items())
+        quoted_name = file_name.replace('"', '%22')
+        preamble += (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{quoted_name}"\r\n'
+            f"Content-Type: {file_content_type}\r\n\r\n"
+        ).encode('utf-8')
+        self._preamble = preamble
+        self._epilogue = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self.rewind()
+
+    def _field_part(self, name: str, value: Any) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._preamble) + self.upload.size + len(self._epilogue)
+
+    def rewind(self) -> None:
+        """Reset the stream so the body can be sent again (e.g. on retry)."""
+        self._stage = 0
+        self._offset = 0
+        self.upload.seek(0)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self)
+        out = bytearray()
+        while len(out) < size and self._stage < 3:
+            wanted = size - len(out)
+            if self._stage == 1:
+                chunk = self.upload.read(wanted)
+                if not chunk:
+                    self._stage = 2
+                    self._offset = 0
+                    continue
+                out += chunk
+                continue
+
+            part = self._preamble if self._stage == 0 else self._epilogue
+            chunk = part[self._offset:self._offset + wanted]
+            self._offset += len(chunk)
+            out += chunk
+            if self._offset >= len(part):
+                self._stage += 1
+                self._offset = 0
+        return bytes(out)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def download_file(client, url: str) -> SpooledUpload:
+    """
+    Stream ``url`` into a spool through the pooled client, timed and counted
+    as the current invocation's download.
+    """
+    with measure('download'):
+        with client.download(
+            url, timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT), stream=True
+        ) as download_response:
+            download_response.raise_for_status()
+            upload = spool_response(download_response)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.record_download(upload.size)
+    return upload
+
+
+def blob_upload(file) -> SpooledUpload:
+    """Spool ``file.blob`` (which the SDK fetches on access), timed as the current invocation's download."""
+    with measure('download'):
+        upload = spool_bytes(file.blob)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.record_download(upload.size)
+    return upload
+
+
+# Origins of file URLs that failed, mapped to (monotonic time of failure, error)
+_broken_origins: dict[str, tuple[float, str]] = {}
+_broken_lock = threading.Lock()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else ''
+
+
+def broken_files_url(url: str) -> str | None:
+    """The error that made ``url``'s file server be skipped, while it is still skipped."""
+    origin = _origin(url)
+    with _broken_lock:
+        failure = _broken_origins.get(origin)
+        if failure is None:
+            return None
+        if time.monotonic() - failure[0] > BROKEN_FILES_URL_TTL:
+            del _broken_origins[origin]
+            return None
+        return failure[1]
+
+
+def origin_unreachable(error: Exception) -> bool:
+    """
+    True when a download error says the file server itself cannot be used: a
+    malformed URL, or a connection that was never made (DNS failure, refused,
+    connect timeout). Errors after connecting, such as a reset partway
+    through the body, only concern that one download.
+    """
+    if isinstance(error, (
+        requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema, requests.exceptions.InvalidURL,
+    )):
+        return True
+    return isinstance(error, requests.exceptions.RequestException) and request_not_sent(error)
+
+
+def mark_files_url_broken(url: str, error: str) -> None:
+    with _broken_lock:
+        _broken_origins[_origin(url)] = (time.monotonic(), error)
+
+
+def reset_acquisition() -> None:
+    """Forget file servers marked as broken."""
+    with _broken_lock:
+        _broken_origins.clear()
+
+
+def acquire_file(client, file) -> tuple[SpooledUpload, dict[str, Any]]:
+    """
+    Spool a Dify file for upload by the cheapest path available:
+
+    - ``materialized``: bytes the SDK already loaded (``file._blob``), no request
+    - ``url``: streamed from ``file.url`` through the pooled client
+    - ``blob``: ``file.blob``, which the SDK fetches itself
+
+    Returns the spool and a report of the path taken, the bytes and seconds it
+    took, and why the URL was skipped or failed. Raises the ``file.blob`` error
+    when every path fails.
+    """
+    started = time.monotonic()
+    report: dict[str, Any] = {'path': None}
+    upload = None
+
+    materialized = getattr(file, '_blob', None)
+    if isinstance(materialized, bytes) and materialized:
+        upload = blob_upload(file)
+        report['path'] = 'materialized'
+
+    url = getattr(file, 'url', None)
+    if upload is None and isinstance(url, str) and url:
+        skipped = broken_files_url(url)
+        if skipped is not None:
+            report['url_skipped'] = f"file server failed earlier: {skipped}"
+        else:
+            try:
+                upload = download_file(client, url)
+                if upload.size:
+                    report['path'] = 'url'
+                else:
+                    upload.close()
+                    upload = None
+                    report['url_error'] = 'empty response'
+            except Exception as e:
+                if origin_unreachable(e):
+                    mark_files_url_broken(url, str(e))
+                report['url_error'] = str(e)
+
+    if upload is None:
+        upload = blob_upload(file)
+        report['path'] = 'blob'
+
+    report.update(bytes=upload.size, seconds=round(time.monotonic() - started, 3))
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.record_acquisition(report)
+    return upload, report
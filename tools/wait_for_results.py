@@ -0,0 +1,188 @@
+from collections.abc import Generator
+from typing import Any
+import time
+import requests
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from tools.utils.cache import get_result_cache
+from tools.utils.metrics import current_snapshot, instrumented
+from tools.utils.polling import create_scheduler
+from tools.utils.resume import REQUEST_BUDGET
+from tools.utils.routing import get_server_pool
+from tools.utils.task_group import COMPLETION_POLICIES, TaskGroupWaiter, parse_task_ids, required_completions
+
+
+class WaitForResultsTool(Tool):
+    """
+    Bulk result retrieval tool.
+    Waits on many task_ids at once and returns each result as soon as it completes.
+    """
+
+    @instrumented('wait_for_results')
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # Never wait past the plugin request ceiling; callers continue with the pending task_ids
+        invocation_end = time.time() + REQUEST_BUDGET
+
+        # API server(s), API key and SSL setting from credentials; the pool's
+        # keep-alive clients are shared across invocations
+        try:
+            pool = get_server_pool(self.runtime.credentials)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        # Get parameters
+        task_ids = list(dict.fromkeys(parse_task_ids(tool_parameters.get('task_ids'))))
+        completion_policy = tool_parameters.get('completion_policy') or 'all'
+        use_cache = tool_parameters.get('use_cache', True)
+
+        if not task_ids:
+            yield self.create_text_message("Error: task_ids is required")
+            return
+
+        if completion_policy not in COMPLETION_POLICIES:
+            yield self.create_text_message(
+                f"Error: completion_policy must be one of: {', '.join(COMPLETION_POLICIES)}"
+            )
+            return
+
+        # Convert and validate max_wait_time and k
+        try:
+            max_wait_time = int(tool_parameters.get('max_wait_time', 100))
+            if max_wait_time < 1 or max_wait_time > 3600:
+                yield self.create_text_message("Error: max_wait_time must be between 1 and 3600 seconds")
+                return
+            k = int(tool_parameters.get('k') or 1)
+            if k < 1:
+                yield self.create_text_message("Error: k must be at least 1")
+                return
+        except (ValueError, TypeError):
+            yield self.create_text_message("Error: max_wait_time and k must be valid numbers")
+            return
+
+        # Each task is polled on the server that created it
+        clients = {task_id: pool.client_for_task(task_id) for task_id in task_ids}
+
+        required = required_completions(completion_policy, len(task_ids), k)
+        cache = get_result_cache() if use_cache else None
+        start_time = time.time()
+        deadline = min(start_time + max_wait_time, invocation_end)
+        completed: list[str] = []
+        failed: list[str] = []
+
+        try:
+            yield self.create_text_message(
+                f"⏳ Waiting for {len(task_ids)} task(s) (policy: {completion_policy}, "
+                f"need {required} completed)..."
+            )
+
+            # Results already in the local cache finish immediately
+            to_poll = []
+            for task_id in task_ids:
+                task_key = cache.task_key(clients[task_id].api_server_url, task_id) if cache is not None else None
+                cached_result = cache.get(task_key) if cache is not None else None
+                if cached_result is None or len(completed) >= required:
+                    to_poll.append(task_id)
+                    continue
+                completed.append(task_id)
+                yield from self._result_messages(task_id, cached_result, len(completed) + len(failed), len(task_ids))
+
+            scheduler = create_scheduler('adaptive')
+            waiter = TaskGroupWaiter(clients[task_ids[0]], to_poll, scheduler, client_for=clients.__getitem__)
+            if len(completed) < required and to_poll:
+                for task_id, status_result in waiter.iter_finished(deadline):
+                    if status_result.get('success') and status_result.get('status') == 'completed':
+                        completed.append(task_id)
+                        if cache is not None and (status_result.get('data') or {}).get('content') is not None:
+                            cache.put(cache.task_key(clients[task_id].api_server_url, task_id), status_result)
+                    else:
+                        failed.append(task_id)
+                    yield from self._result_messages(
+                        task_id, status_result, len(completed) + len(failed), len(task_ids)
+                    )
+                    if len(completed) >= required:
+                        break
+
+            finished = set(completed) | set(failed)
+            pending = [task_id for task_id in task_ids if task_id not in finished]
+            satisfied = len(completed) >= required
+            timed_out = not satisfied and time.time() - start_time >= max_wait_time
+            # The per-call budget ran out first: the caller waits on `pending` in a new call
+            call_again = not satisfied and not timed_out and bool(pending) and time.time() >= deadline
+
+            if satisfied:
+                yield self.create_text_message(
+                    f"✅ Completion policy '{completion_policy}' satisfied: "
+                    f"{len(completed)} completed, {len(failed)} failed, {len(pending)} not awaited"
+                )
+            elif timed_out:
+                yield self.create_text_message(
+                    f"⚠️ Timeout: {max_wait_time} seconds exceeded with {len(pending)} task(s) still pending"
+                )
+            elif call_again:
+                yield self.create_text_message(
+                    f"⏸️ {len(pending)} task(s) still pending after {round(time.time() - start_time)} seconds. "
+                    f"Call this tool again with the pending task_ids to keep waiting."
+                )
+            else:
+                yield self.create_text_message(
+                    f"❌ Completion policy '{completion_policy}' cannot be satisfied: "
+                    f"{len(completed)} completed, {len(failed)} failed"
+                )
+
+            yield self.create_json_message({
+                'completion_policy': completion_policy,
+                'required': required,
+                'satisfied': satisfied,
+                'timed_out': timed_out,
+                'call_again': call_again,
+                'completed': completed,
+                'failed': failed,
+                'pending': pending,
+                'elapsed_seconds': round(time.time() - start_time, 3),
+                'poll_stats': scheduler.stats.to_dict(),
+                'batch_status_endpoint': clients[task_ids[0]].capabilities.get('batch_status'),
+                'metrics': current_snapshot(
+                    'completed' if satisfied else 'timeout' if timed_out or call_again else 'failed'
+                ),
+            })
+
+            if call_again:
+                yield self.create_variable_message('pending_task_ids', ','.join(pending))
+
+        except requests.exceptions.RequestException as e:
+            yield self.create_text_message(f"❌ Network error: {str(e)}")
+        except Exception as e:
+            yield self.create_text_message(f"❌ Error: {str(e)}")
+
+    def _result_messages(
+        self, task_id: str, status_result: dict[str, Any], done: int, total: int
+    ) -> Generator[ToolInvokeMessage]:
+        """Emit one finished task as a status line and a JSON result."""
+        task_status = status_result.get('status') if status_result.get('success') else 'error'
+        data_field = status_result.get('data') or {}
+        markdown_content = data_field.get('content')
+
+        if task_status == 'completed':
+            length = len(markdown_content) if markdown_content is not None else 0
+            yield self.create_text_message(
+                f"✅ [{done}/{total}] {task_id} completed: {status_result.get('file_name')} ({length} characters)"
+            )
+        else:
+            error_msg = status_result.get('error_message') or status_result.get('message') or 'Unknown error'
+            yield self.create_text_message(f"❌ [{done}/{total}] {task_id} {task_status}: {error_msg}")
+
+        yield self.create_json_message({
+            'task_id': task_id,
+            'status': task_status,
+            'file_name': status_result.get('file_name'),
+            'backend': status_result.get('backend'),
+            'markdown_content': markdown_content,
+            'markdown_file': data_field.get('markdown_file'),
+            'completed_at': status_result.get('completed_at'),
+            'error_message': status_result.get('error_message') or (
+                None if status_result.get('success') else status_result.get('message')
+            ),
+        })